@@ -1,14 +1,52 @@
 import streamlit as st
 import pandas as pd
-import json
-from shapely.geometry import Point, shape
+import numpy as np
+import io
+import logging
+import os
+import hashlib
+import shapely
 import folium
 from streamlit_folium import st_folium
 import time
-import re
-import geopandas as gpd
+import pyogrio
 import requests
 
+from aac import (
+    ADDRESS_COLUMNS,
+    HIGHLIGHT_STYLE,
+    LAT_COLUMNS,
+    LON_COLUMNS,
+    METRICS,
+    REGION_BBOXES,
+    ZONE_STYLE,
+    COMPILED_EXTENSION,
+    CompactTopoJson,
+    DatasetCache,
+    classify_batch_file,
+    display_tolerance,
+    geocode_address,
+    get_default_geocode_cache,
+    get_default_geocoding_client,
+    get_display_topology,
+    guess_column,
+    is_in_aac,
+    iter_batch_chunks,
+    load_aac_dataset,
+    load_aac_file,
+    nearest_aac,
+    refresh_aac_dataset,
+    subset_topology,
+    zone_tooltip,
+    zones_in_window,
+)
+
+# Journaux (dont les mesures par étape du logger aac.metrics, en JSON avec AAC_LOG_LEVEL=INFO)
+logging.basicConfig(level=os.environ.get("AAC_LOG_LEVEL", "WARNING"), format="%(asctime)s %(name)s %(message)s")
+
+# Panneau de mesures de performance en bas de page (AAC_DEBUG=1)
+DEBUG_PANEL = os.environ.get("AAC_DEBUG", "0") != "0"
+
 # Configuration de la page
 st.set_page_config(page_title="Vérificateur de Zones AAC", page_icon="🌊", layout="wide")
 
@@ -21,38 +59,22 @@ def get_coordinates(address):
     with st.spinner("Recherche des coordonnées..."):
         # Utiliser l'API adresse.data.gouv.fr (spécifique à la France)
         try:
-            # Encoder l'adresse pour l'URL
-            encoded_address = requests.utils.quote(address)
-            
-            # URL de l'API française
-            url = f"https://api-adresse.data.gouv.fr/search/?q={encoded_address}&limit=1"
-            
-            # Faire la requête
-            response = requests.get(url, timeout=10)
+            result = geocode_address(address)
             
-            # Traiter la réponse
-            if response.status_code == 200:
-                data = response.json()
+            if result:
+                full_address = result['label']
+                score = result['score'] * 100
                 
-                # Vérifier si des résultats ont été trouvés
-                if data and data.get('features') and len(data['features']) > 0:
-                    # Récupérer les coordonnées (attention: l'API renvoie [lon, lat])
-                    lon, lat = data['features'][0]['geometry']['coordinates']
-                    
-                    # Récupérer également l'adresse complète pour l'afficher
-                    full_address = data['features'][0]['properties'].get('label', address)
-                    score = data['features'][0]['properties'].get('score', 0) * 100
-                    
-                    # Afficher un message de succès
-                    st.success(f"✅ Adresse trouvée: {full_address} (confiance: {score:.1f}%)")
-                    
-                    # Retourner les coordonnées
-                    return (lat, lon, full_address)
-                else:
-                    st.warning("❌ Aucun résultat trouvé pour cette adresse")
+                # Afficher un message de succès
+                st.success(f"✅ Adresse trouvée: {full_address} (confiance: {score:.1f}%)")
+                
+                # Retourner les coordonnées
+                return (result['lat'], result['lon'], full_address)
             else:
-                st.warning(f"⚠️ Erreur lors de la requête: {response.status_code}")
+                st.warning("❌ Aucun résultat trouvé pour cette adresse")
                 
+        except requests.HTTPError as e:
+            st.warning(f"⚠️ Erreur lors de la requête: {e.response.status_code}")
         except Exception as e:
             st.error(f"⚠️ Erreur lors de la requête à l'API adresse.data.gouv.fr: {str(e)}")
             
@@ -72,82 +94,90 @@ def get_coordinates(address):
                 
     return None
 
-# Fonction pour vérifier si un point est dans une zone AAC
-def is_in_aac(lat, lon, data_source):
+# Cache unique pour toutes les sessions de l'application
+@st.cache_resource
+def get_dataset_cache():
+    max_mb = int(os.environ.get("AAC_CACHE_MAX_MB", "1024"))
+    max_entries = int(os.environ.get("AAC_CACHE_MAX_ENTRIES", "8"))
+    return DatasetCache(max_entries=max_entries, max_bytes=max_mb * 1024 * 1024)
+
+# Jeu de données préchargé (idéalement un index compilé avec python -m aac compile),
+# utilisable sans téléversement
+PRELOADED_DATASET = os.environ.get("AAC_DATASET")
+
+# Vérifier un point en affichant les éventuelles erreurs dans l'interface
+def check_aac(lat, lon, aac_index, margin_m=None):
     try:
-        point = Point(lon, lat)
-        
-        # Si c'est un GeoDataFrame (GPKG), on utilise les fonctionnalités spatiales de GeoPandas
-        if isinstance(data_source, gpd.GeoDataFrame):
-            # S'assurer que le GeoDataFrame a un CRS défini
-            if data_source.crs is None:
-                st.warning("Le fichier GPKG n'a pas de système de coordonnées défini. On suppose WGS84 (EPSG:4326).")
-                data_source.set_crs(epsg=4326, inplace=True)
-            
-            # Créer un GeoDataFrame avec le point en WGS84 (coordonnées GPS standard)
-            point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-            
-            # Convertir le point dans le même CRS que le GeoDataFrame si nécessaire
-            if point_gdf.crs != data_source.crs:
-                point_gdf = point_gdf.to_crs(data_source.crs)
-            
-            # Méthode 1: Spatial join pour trouver les polygones qui contiennent le point
-            try:
-                intersects = gpd.sjoin(point_gdf, data_source, how="left", predicate="within")
-                if not intersects.empty and 'index_right' in intersects.columns and not intersects['index_right'].isna().all():
-                    # Récupérer les propriétés du premier polygone qui contient le point
-                    match_idx = intersects['index_right'].dropna().iloc[0]
-                    properties = data_source.loc[match_idx].drop('geometry').to_dict()
-                    return True, properties
-            except Exception as e:
-                st.warning(f"Méthode de jointure spatiale non concluante: {str(e)}. Essai avec d'autres méthodes...")
-            
-            # Méthode 2: Vérification directe avec un buffer
-            try:
-                # Créer un buffer autour du point (100 mètres)
-                buffer_size = 0.001  # environ 100m en degrés
-                buffer = point_gdf.geometry[0].buffer(buffer_size)
-                buffer_gdf = gpd.GeoDataFrame(geometry=[buffer], crs=point_gdf.crs)
-                
-                # Vérifier les intersections avec le buffer
-                for idx, row in data_source.iterrows():
-                    if row.geometry.intersects(buffer):
-                        properties = row.drop('geometry').to_dict()
-                        return True, properties
-            except Exception as e:
-                st.warning(f"Méthode de buffer non concluante: {str(e)}. Essai avec la méthode manuelle...")
-            
-            # Méthode 3: Vérification manuelle - dernier recours
-            try:
-                for idx, row in data_source.iterrows():
-                    if row.geometry.contains(point_gdf.geometry[0]):
-                        properties = row.drop('geometry').to_dict()
-                        return True, properties
-            except Exception as e:
-                st.warning(f"Méthode manuelle échouée: {str(e)}")
-                
-            # Afficher des informations de débogage
-            st.info(f"Point de test: {lat}, {lon} - CRS du point: {point_gdf.crs} - CRS des données: {data_source.crs}")
-            
-        # Si c'est un GeoJSON
-        else:
-            point_buffer = point.buffer(0.0001)  # Environ 10-15m
-            for feature in data_source['features']:
-                try:
-                    aac_shape = shape(feature['geometry'])
-                    properties = feature['properties']
-                    
-                    # Vérification directe
-                    if aac_shape.contains(point) or aac_shape.intersects(point_buffer):
-                        return True, properties
-                except Exception as e:
-                    st.warning(f"Erreur lors de la vérification d'une feature GeoJSON: {str(e)}")
-                    continue
-        
-        return False, None
+        return is_in_aac(lat, lon, aac_index, margin_m)
     except Exception as e:
         st.error(f"Erreur lors de la vérification des zones: {str(e)}")
-        return False, None
+        return False, None, None
+
+# Afficher la zone AAC la plus proche d'un point situé hors AAC
+def show_nearest_aac(lat, lon, aac_index, max_distance=10000):
+    try:
+        nearest = nearest_aac(lat, lon, aac_index, max_distance).iloc[0]
+    except Exception as e:
+        st.error(f"Erreur lors de la recherche de l'AAC la plus proche: {str(e)}")
+        return
+    if pd.isna(nearest["aac_id"]):
+        st.info(f"Aucune AAC à moins de {max_distance / 1000:.0f} km")
+    else:
+        st.info(f"📏 AAC la plus proche à {nearest['distance_m']:.0f} m")
+
+# Construire et afficher la carte des zones AAC autour du point vérifié.
+# Avec window_m, seules les zones proches du point sont envoyées au navigateur.
+def show_aac_map(lat, lon, popup, zone_id, dataset, window_m=None):
+    in_aac = zone_id is not None
+    
+    # Carte de base
+    m = folium.Map(location=[lat, lon], zoom_start=12)
+    
+    if window_m is not None:
+        visible = zones_in_window(dataset.aac_index, lat, lon, window_m)
+    else:
+        visible = np.flatnonzero(~shapely.is_missing(dataset.aac_index.geometries))
+    
+    # Afficher un message pour informer l'utilisateur
+    with st.spinner("Chargement des zones sur la carte (cela peut prendre un moment)..."):
+        try:
+            # La topologie simplifiée et quantifiée est réutilisée d'une vérification à l'autre
+            tolerance = display_tolerance(len(dataset.aac_index))
+            topology = get_display_topology(dataset, tolerance)
+            
+            # Toutes les zones dans une seule couche TopoJSON, avec un style constant
+            if len(visible) > 0:
+                zones_topology = subset_topology(topology, visible)
+                CompactTopoJson(zones_topology, ZONE_STYLE, tooltip=zone_tooltip(zones_topology)).add_to(m)
+            
+            # La zone active est retrouvée par son identifiant et ajoutée dans une couche séparée
+            if in_aac:
+                active_topology = subset_topology(topology, [zone_id])
+                if active_topology["objects"]["aac"]["geometries"]:
+                    CompactTopoJson(active_topology, HIGHLIGHT_STYLE).add_to(m)
+        except Exception as e:
+            st.error(f"Erreur lors de l'affichage des zones: {str(e)}")
+    
+    # Ajouter le marqueur APRÈS les polygones
+    marker_color = "green" if in_aac else "red"
+    folium.Marker(
+        [lat, lon],
+        popup=popup,
+        icon=folium.Icon(color=marker_color, icon="info-sign")
+    ).add_to(m)
+    
+    if window_m is not None:
+        st.caption(f"{len(visible)} zone(s) affichée(s) dans un rayon de {window_m / 1000:.0f} km "
+                   f"sur {len(dataset.aac_index)} au total")
+    
+    # Taille du document envoyé au navigateur, mesurée seulement avec le panneau de mesures
+    # (le rendu est refait par st_folium)
+    if DEBUG_PANEL:
+        METRICS.record_size("map_html", len(m.get_root().render()))
+    
+    # Afficher la carte
+    with METRICS.timer("st_folium", zones=len(visible)):
+        st_folium(m, width=900, height=500, returned_objects=[])
 
 # Structure à deux colonnes
 col1, col2 = st.columns([1, 3])
@@ -155,443 +185,369 @@ col1, col2 = st.columns([1, 3])
 # Colonne de gauche pour le chargement du fichier
 with col1:
     st.header("Chargement des données")
-    uploaded_file = st.file_uploader("Fichier des AAC", type=["geojson", "json", "gpkg"])
+    uploaded_file = st.file_uploader("Fichier des AAC", type=["geojson", "json", "gpkg", "arrow"])
     
     # Variables pour stocker les données
-    data_source = None
-    file_type = None
+    dataset = None
+    aac_index = None
     
     # Options de filtrage régional
     st.subheader("Options de filtrage")
     filter_by_region = st.checkbox("Filtrer par région", value=True)
     
     if filter_by_region:
-        regions = ["Occitanie", "Nouvelle-Aquitaine", "Auvergne-Rhône-Alpes", "Provence-Alpes-Côte d'Azur", 
-                  "Île-de-France", "Hauts-de-France", "Grand Est", "Bourgogne-Franche-Comté", 
-                  "Centre-Val de Loire", "Pays de la Loire", "Bretagne", "Normandie", "Corse", "France entière"]
+        regions = list(REGION_BBOXES) + ["France entière"]
         selected_region = st.selectbox("Sélectionner une région", regions, index=0)
     
     if uploaded_file:
         try:
+            file_bytes = uploaded_file.getvalue()
+            
+            # Le hachage du contenu n'est recalculé que lorsque le fichier change
+            hash_key = f"content_hash_{uploaded_file.file_id}"
+            if hash_key not in st.session_state:
+                st.session_state[hash_key] = hashlib.sha256(file_bytes).hexdigest()
+            content_hash = st.session_state[hash_key]
+            
             file_extension = uploaded_file.name.split('.')[-1].lower()
+            region_key = selected_region if filter_by_region else None
             
-            if file_extension in ['geojson', 'json']:
-                data_source = json.load(uploaded_file)
-                
-                if filter_by_region:
-                    st.warning("Le filtrage par région est uniquement disponible pour les fichiers GPKG. Les fichiers GeoJSON sont chargés en entier.")
-                
-                st.success(f"{len(data_source['features'])} zones détectées")
-                file_type = "geojson"
-                
-            elif file_extension == 'gpkg':
-                # Utiliser geopandas pour lire le GeoPackage
-                with st.spinner("Chargement du fichier GPKG..."):
-                    gdf = gpd.read_file(uploaded_file)
-                
-                # Filtrer par région si demandé
-                if filter_by_region and selected_region != "France entière":
-                    with st.spinner(f"Filtrage des données pour la région {selected_region}..."):
-                        # Vérifier si une colonne 'region' ou similaire existe
-                        region_cols = [col for col in gdf.columns if 'region' in col.lower() or 'reg' == col.lower()]
-                        
-                        if region_cols:
-                            region_col = region_cols[0]
-                            # Filtrage exact sur le nom de la région
-                            filtered_gdf = gdf[gdf[region_col].str.contains(selected_region, case=False, na=False)]
-                            
-                            if len(filtered_gdf) > 0:
-                                gdf = filtered_gdf
-                                st.success(f"Données filtrées pour la région {selected_region}: {len(gdf)} zones trouvées")
-                            else:
-                                st.warning(f"Aucune zone trouvée pour la région {selected_region}. Utilisation de toutes les données.")
-                        else:
-                            # Essai de filtrage par bbox approximative de l'Occitanie
-                            if selected_region == "Occitanie":
-                                # Bbox approximative de l'Occitanie (lon_min, lat_min, lon_max, lat_max)
-                                occitanie_bbox = (0.5, 42.3, 4.8, 45.0)  # Valeurs approximatives
-                                
-                                # S'assurer que le GDF est en WGS84
-                                if gdf.crs and gdf.crs != "EPSG:4326":
-                                    gdf = gdf.to_crs("EPSG:4326")
-                                
-                                # Créer un GeoDataFrame pour la bbox
-                                from shapely.geometry import box
-                                bbox_polygon = box(*occitanie_bbox)
-                                
-                                # Filtrer par intersection avec la bbox
-                                filtered_gdf = gdf[gdf.intersects(bbox_polygon)]
-                                
-                                if len(filtered_gdf) > 0:
-                                    gdf = filtered_gdf
-                                    st.success(f"Données filtrées pour la région Occitanie par bbox: {len(gdf)} zones trouvées")
-                                else:
-                                    st.warning("Aucune zone trouvée dans la bbox de l'Occitanie. Utilisation de toutes les données.")
-                            else:
-                                st.warning(f"Impossible de filtrer automatiquement pour {selected_region}. Aucune colonne 'region' trouvée.")
-                elif filter_by_region and selected_region == "France entière":
-                    st.info(f"Utilisation de l'ensemble des données: {len(gdf)} zones au total pour la France entière")
-                
-                data_source = gdf
-                file_type = "gpkg"
+            selected_columns = None
+            if file_extension == 'gpkg':
+                fields_key = f"gpkg_fields_{content_hash}"
+                if fields_key not in st.session_state:
+                    st.session_state[fields_key] = list(pyogrio.read_info(io.BytesIO(file_bytes))["fields"])
+                all_fields = st.session_state[fields_key]
+                kept_fields = st.multiselect("Colonnes à charger", all_fields, default=all_fields)
+                if len(kept_fields) < len(all_fields):
+                    selected_columns = tuple(kept_fields)
+            
+            cache = get_dataset_cache()
+            dataset_key = (content_hash, file_extension, region_key, selected_columns)
+            previous_key = st.session_state.get("dataset_key")
+            # Nouvelle version du fichier chargé précédemment (mêmes options): seules les zones
+            # modifiées sont recalculées, sauf si les colonnes ou trop de zones ont changé.
+            # L'ancienne version reste en cache, intacte, pour les sessions qui l'utilisent.
+            if (previous_key is not None and previous_key[1:] == dataset_key[1:] and file_extension != COMPILED_EXTENSION
+                    and dataset_key not in cache and previous_key in cache):
+                try:
+                    with st.spinner("Mise à jour des zones modifiées..."):
+                        dataset = cache.get_or_derive(previous_key, dataset_key, lambda previous: refresh_aac_dataset(
+                            previous, file_bytes, uploaded_file.name, region_key, selected_columns
+                        )[0])
+                except (KeyError, ValueError):
+                    dataset = None
+            
+            if dataset is None:
+                with st.spinner("Chargement et indexation du fichier..."):
+                    dataset = cache.get_or_load(
+                        dataset_key,
+                        lambda: load_aac_dataset(file_bytes, uploaded_file.name, region_key, selected_columns)
+                    )
+            st.session_state["dataset_key"] = dataset_key
         except Exception as e:
             st.error(f"Erreur: Format de fichier invalide - {str(e)}")
+    elif PRELOADED_DATASET:
+        try:
+            # La date de modification invalide le cache quand le fichier est recompilé
+            with st.spinner("Ouverture du jeu de données préchargé..."):
+                dataset = get_dataset_cache().get_or_load(
+                    ("preloaded", PRELOADED_DATASET, os.path.getmtime(PRELOADED_DATASET)),
+                    lambda: load_aac_file(PRELOADED_DATASET)
+                )
+            st.caption(f"Jeu de données préchargé: {os.path.basename(PRELOADED_DATASET)}")
+        except Exception as e:
+            st.error(f"Erreur lors de l'ouverture de {PRELOADED_DATASET}: {str(e)}")
+    
+    if dataset is not None:
+        # Rejouer les messages émis lors du chargement initial
+        for level, message in dataset.messages:
+            getattr(st, level)(message)
+        
+        aac_index = dataset.aac_index
+        
+        cache = get_dataset_cache()
+        st.caption(f"Cache: {len(cache)} jeu(x) de données, {cache.nbytes / 1e6:.0f} Mo / {cache.max_bytes / 1e6:.0f} Mo")
+    
+    # Marge de proximité: un point à moins de cette distance d'une zone est considéré dans l'AAC
+    st.subheader("Options de vérification")
+    margin_m = st.number_input("Marge de proximité (m)", min_value=0, max_value=5000,
+                               value=int(aac_index.tolerance) if aac_index is not None else 0, step=10,
+                               help="Distance en mètres en deçà de laquelle un point est rattaché à la zone la plus proche")
+    
+    # Options d'affichage de la carte
+    st.subheader("Options de la carte")
+    limit_map = st.checkbox("Limiter la carte aux environs du point", value=True,
+                            help="N'envoie au navigateur que les zones proches du point vérifié")
+    map_window_m = None
+    if limit_map:
+        map_window_m = st.slider("Rayon affiché (km)", min_value=1, max_value=100, value=20) * 1000
     
     # Ajouter des informations sur l'API utilisée
     st.markdown("---")
-    st.info("✨ Cette application utilise l'API adresse.data.gouv.fr pour le géocodage des adresses françaises.")
+    geocoding_client = get_default_geocoding_client()
+    if geocoding_client.local is not None:
+        fallback = ", avec l'API adresse.data.gouv.fr en secours" if geocoding_client.remote else ""
+        st.info(f"✨ Géocodage local sur {len(geocoding_client.local)} adresses de la Base Adresse Nationale{fallback}.")
+    else:
+        st.info("✨ Cette application utilise l'API adresse.data.gouv.fr pour le géocodage des adresses françaises.")
+    
+    # Statistiques du cache de géocodage
+    geocode_stats = get_default_geocode_cache().stats
+    st.caption(f"Cache de géocodage: {geocode_stats['memory_hits']} succès mémoire, "
+               f"{geocode_stats['disk_hits']} succès disque, {geocode_stats['misses']} requêtes à l'API")
 
 # Colonne de droite pour la vérification
 with col2:
     st.header("Vérification")
     
-    # Initialisation des variables de session si elles n'existent pas
-    if 'reset_pressed' not in st.session_state:
-        st.session_state.reset_pressed = False
-    if 'last_address' not in st.session_state:
-        st.session_state.last_address = ""
-    if 'last_lat' not in st.session_state:
-        st.session_state.last_lat = 46.603354
-    if 'last_lon' not in st.session_state:
-        st.session_state.last_lon = 1.888334
-    
-    # Fonction pour réinitialiser les champs
-    def reset_fields():
-        st.session_state.reset_pressed = True
-        st.session_state.last_address = ""
-        st.session_state.last_lat = 46.603354
-        st.session_state.last_lon = 1.888334
+    check_tab, batch_tab = st.tabs(["Adresse ou coordonnées", "Traitement par lot"])
     
-    # Bouton de réinitialisation
-    reset_col, spacer = st.columns([1, 3])
-    with reset_col:
-        st.button("🔄 Nouvelle recherche", on_click=reset_fields, help="Réinitialiser les champs et effacer les résultats")
-    
-    # Mode de saisie
-    input_mode = st.radio("Mode", ["Adresse", "Coordonnées"])
-    
-    # Placeholder pour les résultats (vide au début)
-    results_placeholder = st.empty()
-    
-    # Conteneur pour les résultats
-    with results_placeholder.container():
-        if input_mode == "Adresse":
-            # Utiliser la dernière adresse ou une chaîne vide si réinitialisation
-            if st.session_state.reset_pressed:
-                initial_address = ""
-                st.session_state.reset_pressed = False  # Réinitialiser le flag
-            else:
-                initial_address = st.session_state.last_address
-                
-            address = st.text_input("Entrez une adresse", value=initial_address,
-                                   help="Exemple: 1 Place de la Mairie, 34000 Montpellier")
-            # Stocker l'adresse actuelle
-            st.session_state.last_address = address
-            
-            check_button = st.button("Vérifier l'adresse")
-            
-            # Ne continuer que si on a cliqué sur le bouton et qu'un fichier est chargé
-            if check_button and address:
-                if data_source is None:
-                    st.error("Veuillez d'abord charger un fichier (GeoJSON ou GPKG)")
+    with check_tab:
+        # Initialisation des variables de session si elles n'existent pas
+        if 'reset_pressed' not in st.session_state:
+            st.session_state.reset_pressed = False
+        if 'last_address' not in st.session_state:
+            st.session_state.last_address = ""
+        if 'last_lat' not in st.session_state:
+            st.session_state.last_lat = 46.603354
+        if 'last_lon' not in st.session_state:
+            st.session_state.last_lon = 1.888334
+        
+        # Fonction pour réinitialiser les champs
+        def reset_fields():
+            st.session_state.reset_pressed = True
+            st.session_state.last_address = ""
+            st.session_state.last_lat = 46.603354
+            st.session_state.last_lon = 1.888334
+        
+        # Bouton de réinitialisation
+        reset_col, spacer = st.columns([1, 3])
+        with reset_col:
+            st.button("🔄 Nouvelle recherche", on_click=reset_fields, help="Réinitialiser les champs et effacer les résultats")
+        
+        # Mode de saisie
+        input_mode = st.radio("Mode", ["Adresse", "Coordonnées"])
+        
+        # Placeholder pour les résultats (vide au début)
+        results_placeholder = st.empty()
+        
+        # Conteneur pour les résultats
+        with results_placeholder.container():
+            if input_mode == "Adresse":
+                # Utiliser la dernière adresse ou une chaîne vide si réinitialisation
+                if st.session_state.reset_pressed:
+                    initial_address = ""
+                    st.session_state.reset_pressed = False  # Réinitialiser le flag
                 else:
-                    # Effacer le contenu du placeholder
-                    results_placeholder.empty()
+                    initial_address = st.session_state.last_address
                     
-                    # Recréer un conteneur pour les nouveaux résultats
-                    with results_placeholder.container():
-                        st.write(f"Adresse saisie: {address}")
+                address = st.text_input("Entrez une adresse", value=initial_address,
+                                       help="Exemple: 1 Place de la Mairie, 34000 Montpellier")
+                # Stocker l'adresse actuelle
+                st.session_state.last_address = address
+                
+                check_button = st.button("Vérifier l'adresse")
+                
+                # Ne continuer que si on a cliqué sur le bouton et qu'un fichier est chargé
+                if check_button and address:
+                    if aac_index is None:
+                        st.error("Veuillez d'abord charger un fichier (GeoJSON ou GPKG)")
+                    else:
+                        # Effacer le contenu du placeholder
+                        results_placeholder.empty()
+                        
+                        # Recréer un conteneur pour les nouveaux résultats
+                        with results_placeholder.container():
+                            st.write(f"Adresse saisie: {address}")
+                            
+                            # Géocodage
+                            coordinates = get_coordinates(address)
+                            if coordinates:
+                                lat, lon, full_address = coordinates
+                                st.write(f"Coordonnées: {lat}, {lon}")
+                                
+                                # Vérification AAC
+                                in_aac, properties, zone_id = check_aac(lat, lon, aac_index, margin_m)
+                                
+                                # Afficher le résultat textuel
+                                if in_aac:
+                                    st.success("✅ Cette adresse est située dans une AAC")
+                                    
+                                    # Infos sur la zone
+                                    st.subheader("Informations sur la zone:")
+                                    df = pd.DataFrame(list(properties.items()), 
+                                                    columns=["Propriété", "Valeur"])
+                                    st.dataframe(df)
+                                else:
+                                    st.warning("❌ Cette adresse n'est pas dans une AAC")
+                                    show_nearest_aac(lat, lon, aac_index)
+                                
+                                # Maintenant on crée et affiche la carte
+                                st.subheader("Carte")
+                                show_aac_map(lat, lon, f"<b>{full_address}</b>", zone_id, dataset, map_window_m)
+                                
+                                # Ajouter un bouton pour refaire une recherche
+                                if st.button("🔄 Faire une nouvelle recherche", key="new_search_addr"):
+                                    st.session_state.reset_pressed = True
+                                    st.session_state.last_address = ""
+                                    st.rerun()  # Forcer le rechargement de la page
+                            else:
+                                st.error("Impossible de géocoder cette adresse")
+                                
+            else:  # Mode Coordonnées
+                # Utiliser les dernières coordonnées ou les valeurs par défaut si réinitialisation
+                if st.session_state.reset_pressed:
+                    initial_lat = 46.603354
+                    initial_lon = 1.888334
+                    st.session_state.reset_pressed = False  # Réinitialiser le flag
+                else:
+                    initial_lat = st.session_state.last_lat
+                    initial_lon = st.session_state.last_lon
+                
+                lat_col, lon_col = st.columns(2)
+                with lat_col:
+                    lat = st.number_input("Latitude", value=initial_lat, format="%.6f")
+                with lon_col:
+                    lon = st.number_input("Longitude", value=initial_lon, format="%.6f")
+                
+                # Stocker les coordonnées actuelles
+                st.session_state.last_lat = lat
+                st.session_state.last_lon = lon
+                
+                check_button = st.button("Vérifier les coordonnées")
+                
+                if check_button:
+                    if aac_index is None:
+                        st.error("Veuillez d'abord charger un fichier (GeoJSON ou GPKG)")
+                    else:
+                        # Effacer le contenu du placeholder
+                        results_placeholder.empty()
                         
-                        # Géocodage
-                        coordinates = get_coordinates(address)
-                        if coordinates:
-                            lat, lon, full_address = coordinates
+                        # Recréer un conteneur pour les nouveaux résultats
+                        with results_placeholder.container():
                             st.write(f"Coordonnées: {lat}, {lon}")
                             
                             # Vérification AAC
-                            in_aac, properties = is_in_aac(lat, lon, data_source)
+                            in_aac, properties, zone_id = check_aac(lat, lon, aac_index, margin_m)
                             
-                            # Afficher le résultat textuel
+                            # Afficher le résultat
                             if in_aac:
-                                st.success("✅ Cette adresse est située dans une AAC")
+                                st.success("✅ Ces coordonnées sont dans une AAC")
                                 
                                 # Infos sur la zone
                                 st.subheader("Informations sur la zone:")
                                 df = pd.DataFrame(list(properties.items()), 
-                                                columns=["Propriété", "Valeur"])
+                                                 columns=["Propriété", "Valeur"])
                                 st.dataframe(df)
                             else:
-                                st.warning("❌ Cette adresse n'est pas dans une AAC")
+                                st.warning("❌ Ces coordonnées ne sont pas dans une AAC")
+                                show_nearest_aac(lat, lon, aac_index)
                             
-                            # Maintenant on crée et affiche la carte
+                            # Créer et afficher la carte
                             st.subheader("Carte")
-                            
-                            # Carte de base
-                            m = folium.Map(location=[lat, lon], zoom_start=12)
-                            
-                            # Ajouter les zones AAC
-                            if file_type == "geojson":
-                                for feature in data_source['features']:
-                                    try:
-                                        # Style de base
-                                        style = {
-                                            'fillColor': '#81C6E8',
-                                            'color': '#1F75C4',
-                                            'fillOpacity': 0.4,
-                                            'weight': 1.5
-                                        }
-                                        
-                                        # Mettre en évidence la zone si on est dedans
-                                        if in_aac and properties == feature['properties']:
-                                            style = {
-                                                'fillColor': '#4CAF50',
-                                                'color': '#2E7D32',
-                                                'fillOpacity': 0.6,
-                                                'weight': 2.5
-                                            }
-                                        
-                                        # Ajouter le polygone
-                                        folium.GeoJson(
-                                            feature,
-                                            style_function=lambda x, style=style: style
-                                        ).add_to(m)
-                                    except:
-                                        continue
-                            elif file_type == "gpkg":
-                                # Afficher un message pour informer l'utilisateur
-                                with st.spinner("Chargement des zones sur la carte (cela peut prendre un moment)..."):
-                                    try:
-                                        # Convertir tout le GeoDataFrame en GeoJSON pour l'affichage
-                                        # Simplifier les géométries pour améliorer les performances
-                                        simplified_gdf = data_source.copy()
-                                        
-                                        # Simplification adaptative selon le nombre de zones
-                                        if len(simplified_gdf) > 500:
-                                            tolerance = 0.003  # Plus grande simplification pour de nombreuses zones
-                                        else:
-                                            tolerance = 0.001
-                                            
-                                        simplified_gdf['geometry'] = simplified_gdf['geometry'].simplify(tolerance=tolerance)
-                                        
-                                        # Convertir le CRS en WGS84 si nécessaire
-                                        if simplified_gdf.crs and simplified_gdf.crs != "EPSG:4326":
-                                            simplified_gdf = simplified_gdf.to_crs("EPSG:4326")
-                                        
-                                        # Créer un style_function qui vérifie chaque feature
-                                        def style_function(feature):
-                                            # Style de base
-                                            style = {
-                                                'fillColor': '#81C6E8',
-                                                'color': '#1F75C4',
-                                                'fillOpacity': 0.4,
-                                                'weight': 1.5
-                                            }
-                                            
-                                            # Vérifier si c'est la zone active
-                                            if in_aac and properties:
-                                                feature_props = feature['properties']
-                                                # Comparer les propriétés principales (peut nécessiter des ajustements)
-                                                matches = all(str(feature_props.get(k)) == str(properties.get(k)) 
-                                                            for k in properties.keys() 
-                                                            if k in feature_props and k != 'geometry')
-                                                
-                                                if matches:
-                                                    style = {
-                                                        'fillColor': '#4CAF50',
-                                                        'color': '#2E7D32',
-                                                        'fillOpacity': 0.6,
-                                                        'weight': 2.5
-                                                    }
-                                            
-                                            return style
-                                        
-                                        # Convertir tout le GeoDataFrame en GeoJSON puis l'ajouter à la carte
-                                        geojson_data = simplified_gdf.to_json()
-                                        folium.GeoJson(
-                                            geojson_data,
-                                            style_function=style_function
-                                        ).add_to(m)
-                                        
-                                    except Exception as e:
-                                        st.error(f"Erreur lors de l'affichage des zones: {str(e)}")
-                            
-                            # Ajouter le marqueur APRÈS les polygones
-                            marker_color = "green" if in_aac else "red"
-                            folium.Marker(
-                                [lat, lon],
-                                popup=f"<b>{full_address}</b>",
-                                icon=folium.Icon(color=marker_color, icon="info-sign")
-                            ).add_to(m)
-                            
-                            # Afficher la carte
-                            st_folium(m, width=900, height=500, returned_objects=[])
+                            show_aac_map(lat, lon, f"<b>Coordonnées: {lat}, {lon}</b>", zone_id, dataset, map_window_m)
                             
                             # Ajouter un bouton pour refaire une recherche
-                            if st.button("🔄 Faire une nouvelle recherche", key="new_search_addr"):
+                            if st.button("🔄 Faire une nouvelle recherche", key="new_search_coords"):
                                 st.session_state.reset_pressed = True
-                                st.session_state.last_address = ""
                                 st.rerun()  # Forcer le rechargement de la page
-                        else:
-                            st.error("Impossible de géocoder cette adresse")
-                            
-        else:  # Mode Coordonnées
-            # Utiliser les dernières coordonnées ou les valeurs par défaut si réinitialisation
-            if st.session_state.reset_pressed:
-                initial_lat = 46.603354
-                initial_lon = 1.888334
-                st.session_state.reset_pressed = False  # Réinitialiser le flag
-            else:
-                initial_lat = st.session_state.last_lat
-                initial_lon = st.session_state.last_lon
-            
-            lat_col, lon_col = st.columns(2)
-            with lat_col:
-                lat = st.number_input("Latitude", value=initial_lat, format="%.6f")
-            with lon_col:
-                lon = st.number_input("Longitude", value=initial_lon, format="%.6f")
-            
-            # Stocker les coordonnées actuelles
-            st.session_state.last_lat = lat
-            st.session_state.last_lon = lon
-            
-            check_button = st.button("Vérifier les coordonnées")
+    
+    with batch_tab:
+        st.markdown("Classez en une seule fois un fichier CSV ou Parquet de coordonnées ou d'adresses.")
+        batch_file = st.file_uploader("Fichier de points", type=["csv", "txt", "parquet"], key="batch_file")
+        
+        if batch_file:
+            batch_bytes = batch_file.getvalue()
+            try:
+                # Lire uniquement le premier morceau pour proposer les colonnes
+                preview = next(iter_batch_chunks(batch_bytes, batch_file.name, chunk_size=100))
+            except Exception as e:
+                preview = None
+                st.error(f"Erreur: Fichier de points illisible - {str(e)}")
             
-            if check_button:
-                if data_source is None:
-                    st.error("Veuillez d'abord charger un fichier (GeoJSON ou GPKG)")
+            if preview is not None:
+                st.dataframe(preview.head(5))
+                columns = list(preview.columns)
+                
+                batch_mode = st.radio("Type de données", ["Coordonnées", "Adresses"], horizontal=True, key="batch_mode")
+                lat_col = lon_col = address_col = None
+                if batch_mode == "Coordonnées":
+                    guessed_lat = guess_column(columns, LAT_COLUMNS)
+                    guessed_lon = guess_column(columns, LON_COLUMNS)
+                    lat_col_ui, lon_col_ui = st.columns(2)
+                    with lat_col_ui:
+                        lat_col = st.selectbox("Colonne latitude", columns,
+                                               index=columns.index(guessed_lat) if guessed_lat in columns else 0)
+                    with lon_col_ui:
+                        lon_col = st.selectbox("Colonne longitude", columns,
+                                               index=columns.index(guessed_lon) if guessed_lon in columns else 0)
                 else:
-                    # Effacer le contenu du placeholder
-                    results_placeholder.empty()
-                    
-                    # Recréer un conteneur pour les nouveaux résultats
-                    with results_placeholder.container():
-                        st.write(f"Coordonnées: {lat}, {lon}")
+                    guessed_address = guess_column(columns, ADDRESS_COLUMNS)
+                    address_col = st.selectbox("Colonne adresse", columns,
+                                               index=columns.index(guessed_address) if guessed_address in columns else 0)
+                
+                output_format = st.selectbox("Format du résultat", ["csv", "parquet"])
+                
+                if st.button("Classer le fichier"):
+                    if aac_index is None:
+                        st.error("Veuillez d'abord charger un fichier (GeoJSON ou GPKG)")
+                    else:
+                        progress_text = st.empty()
                         
-                        # Vérification AAC
-                        in_aac, properties = is_in_aac(lat, lon, data_source)
+                        def show_progress(stats):
+                            progress_text.write(f"{stats['rows']} lignes traitées, {stats['in_aac']} dans une AAC")
                         
-                        # Afficher le résultat
-                        if in_aac:
-                            st.success("✅ Ces coordonnées sont dans une AAC")
+                        try:
+                            with st.spinner("Classement des points..."):
+                                start_time = time.time()
+                                result_bytes, stats = classify_batch_file(
+                                    batch_bytes, batch_file.name, aac_index,
+                                    lat_col=lat_col, lon_col=lon_col, address_col=address_col,
+                                    output_format=output_format, progress=show_progress,
+                                    margin_m=margin_m
+                                )
+                                elapsed = time.time() - start_time
                             
-                            # Infos sur la zone
-                            st.subheader("Informations sur la zone:")
-                            df = pd.DataFrame(list(properties.items()), 
-                                             columns=["Propriété", "Valeur"])
-                            st.dataframe(df)
-                        else:
-                            st.warning("❌ Ces coordonnées ne sont pas dans une AAC")
-                        
-                        # Créer et afficher la carte
-                        st.subheader("Carte")
-                        
-                        # Carte de base
-                        m = folium.Map(location=[lat, lon], zoom_start=12)
-                        
-                        # Ajouter les zones AAC
-                        if file_type == "geojson":
-                            for feature in data_source['features']:
-                                try:
-                                    # Style de base
-                                    style = {
-                                        'fillColor': '#81C6E8',
-                                        'color': '#1F75C4',
-                                        'fillOpacity': 0.4,
-                                        'weight': 1.5
-                                    }
-                                    
-                                    # Mettre en évidence la zone si on est dedans
-                                    if in_aac and properties == feature['properties']:
-                                        style = {
-                                            'fillColor': '#4CAF50',
-                                            'color': '#2E7D32',
-                                            'fillOpacity': 0.6,
-                                            'weight': 2.5
-                                        }
-                                    
-                                    # Ajouter le polygone
-                                    folium.GeoJson(
-                                        feature,
-                                        style_function=lambda x, style=style: style
-                                    ).add_to(m)
-                                except:
-                                    continue
-                        elif file_type == "gpkg":
-                            # Afficher un message pour informer l'utilisateur
-                            with st.spinner("Chargement des zones sur la carte (cela peut prendre un moment)..."):
-                                try:
-                                    # Convertir tout le GeoDataFrame en GeoJSON pour l'affichage
-                                    # Simplifier les géométries pour améliorer les performances
-                                    simplified_gdf = data_source.copy()
-                                    
-                                    # Simplification adaptative selon le nombre de zones
-                                    if len(simplified_gdf) > 500:
-                                        tolerance = 0.003  # Plus grande simplification pour de nombreuses zones
-                                    else:
-                                        tolerance = 0.001
-                                        
-                                    simplified_gdf['geometry'] = simplified_gdf['geometry'].simplify(tolerance=tolerance)
-                                    
-                                    # Convertir le CRS en WGS84 si nécessaire
-                                    if simplified_gdf.crs and simplified_gdf.crs != "EPSG:4326":
-                                        simplified_gdf = simplified_gdf.to_crs("EPSG:4326")
-                                    
-                                    # Créer un style_function qui vérifie chaque feature
-                                    def style_function(feature):
-                                        # Style de base
-                                        style = {
-                                            'fillColor': '#81C6E8',
-                                            'color': '#1F75C4',
-                                            'fillOpacity': 0.4,
-                                            'weight': 1.5
-                                        }
-                                        
-                                        # Vérifier si c'est la zone active
-                                        if in_aac and properties:
-                                            feature_props = feature['properties']
-                                            # Comparer les propriétés principales (peut nécessiter des ajustements)
-                                            matches = all(str(feature_props.get(k)) == str(properties.get(k)) 
-                                                        for k in properties.keys() 
-                                                        if k in feature_props and k != 'geometry')
-                                            
-                                            if matches:
-                                                style = {
-                                                    'fillColor': '#4CAF50',
-                                                    'color': '#2E7D32',
-                                                    'fillOpacity': 0.6,
-                                                    'weight': 2.5
-                                                }
-                                        
-                                        return style
-                                    
-                                    # Convertir tout le GeoDataFrame en GeoJSON puis l'ajouter à la carte
-                                    geojson_data = simplified_gdf.to_json()
-                                    folium.GeoJson(
-                                        geojson_data,
-                                        style_function=style_function
-                                    ).add_to(m)
-                                    
-                                except Exception as e:
-                                    st.error(f"Erreur lors de l'affichage des zones: {str(e)}")
-                        
-                        # Ajouter le marqueur APRÈS les polygones
-                        marker_color = "green" if in_aac else "red"
-                        folium.Marker(
-                            [lat, lon],
-                            popup=f"<b>Coordonnées: {lat}, {lon}</b>",
-                            icon=folium.Icon(color=marker_color, icon="info-sign")
-                        ).add_to(m)
-                        
-                        # Afficher la carte
-                        st_folium(m, width=900, height=500, returned_objects=[])
-                        
-                        # Ajouter un bouton pour refaire une recherche
-                        if st.button("🔄 Faire une nouvelle recherche", key="new_search_coords"):
-                            st.session_state.reset_pressed = True
-                            st.rerun()  # Forcer le rechargement de la page
+                            st.success(f"✅ {stats['rows']} lignes classées en {elapsed:.1f} s: "
+                                       f"{stats['in_aac']} dans une AAC, "
+                                       f"{stats['rows'] - stats['in_aac'] - stats['invalid']} hors AAC, "
+                                       f"{stats['invalid']} sans coordonnées valides")
+                            
+                            base_name = batch_file.name.rsplit('.', 1)[0]
+                            st.download_button(
+                                "📥 Télécharger le résultat",
+                                data=result_bytes,
+                                file_name=f"{base_name}_aac.{output_format}",
+                                mime="text/csv" if output_format == "csv" else "application/octet-stream"
+                            )
+                        except Exception as e:
+                            st.error(f"Erreur lors du classement du fichier: {str(e)}")
 
 # Pied de page
 st.markdown("---")
 st.info("""Cette application vérifie si une adresse ou des coordonnées GPS sont situées dans une 
         Aire d'Alimentation de Captage (AAC). Supporte les fichiers GeoJSON et GeoPackage (GPKG).
         Utilise l'API adresse.data.gouv.fr pour le géocodage.""")
+
+# Mesures cumulées du processus (toutes sessions confondues), rendu de cette page compris
+if DEBUG_PANEL:
+    with st.expander("🔧 Mesures de performance"):
+        snapshot = METRICS.snapshot()
+        if snapshot["timings"]:
+            timings = pd.DataFrame.from_dict(snapshot["timings"], orient="index")
+            timings[["total_s", "mean_s", "max_s", "last_s"]] *= 1000
+            st.dataframe(timings.rename(columns={"count": "appels", "total_s": "total (ms)", "mean_s": "moyenne (ms)",
+                                                 "max_s": "max (ms)", "last_s": "dernier (ms)"}).round(1))
+        if snapshot["sizes"]:
+            st.dataframe(pd.DataFrame.from_dict(snapshot["sizes"], orient="index")
+                         .rename(columns={"count": "mesures", "total_bytes": "total (octets)", "last_bytes": "dernière (octets)"}))
+        
+        rates = {cache: METRICS.hit_rate(cache) for cache in ["dataset_cache", "display_topology_cache", "geocode_cache", "geocode_local"]}
+        st.caption(" · ".join(f"{cache}: {rate:.0%} de succès" for cache, rate in rates.items() if rate is not None))
+        
+        prometheus_text = METRICS.to_prometheus()
+        st.download_button("📥 Export Prometheus", data=prometheus_text, file_name="aac_metrics.prom", mime="text/plain")
+        if st.button("Remettre les mesures à zéro"):
+            METRICS.reset()
+            st.rerun()
@@ -0,0 +1,80 @@
+# Bibliothèque de vérification des zones AAC (Aire d'Alimentation de Captage), sans interface.
+# L'application Streamlit (Zonage_AAC.py) et la ligne de commande (python -m aac) reposent dessus.
+
+from .ban import LocalGeocoder, parse_query, tokenize
+from .batch import (
+    ADDRESS_COLUMNS,
+    LAT_COLUMNS,
+    LON_COLUMNS,
+    classify_address_stream,
+    classify_batch,
+    classify_batch_file,
+    classify_chunk,
+    classify_points,
+    guess_column,
+    iter_batch_chunks,
+)
+from .bench import compare_reports, make_points, make_zones, prepare_bench_files, run_benchmark
+from .compiled import COMPILED_EXTENSION, COMPILED_FORMAT_VERSION, read_compiled, write_compiled
+from .display import (
+    HIGHLIGHT_STYLE,
+    LABEL_COLUMNS,
+    ZONE_STYLE,
+    CompactTopoJson,
+    display_tolerance,
+    get_display_topology,
+    update_display_artifacts,
+    zone_labels,
+    zone_tooltip,
+    zones_in_window,
+)
+from .geocoding import (
+    API_ADRESSE_URL,
+    BAN_CSV,
+    CACHE_MISS,
+    GEOCODE_ERROR,
+    GEOCODE_REMOTE,
+    INTERACTIVE_TIMEOUT,
+    GeocodeCache,
+    GeocodingClient,
+    TokenBucket,
+    geocode_address,
+    get_default_geocode_cache,
+    get_default_geocoding_client,
+    normalize_address,
+)
+from .geojson import geometry_from_geojson, iter_geojson_features, make_feature_filter, read_geojson
+from .grid import BOUNDARY, OUTSIDE, CellGrid, build_cell_grid, classify_cells
+from .index import (
+    ATTRIBUTE_PREFIX,
+    DISPLAY_CRS,
+    WORKING_CRS,
+    AACIndex,
+    build_aac_index,
+    get_transformer,
+    is_in_aac,
+    locate_aac_zone,
+    nearest_aac,
+    transform_geometries,
+)
+from .loading import (
+    REGION_BBOXES,
+    CachedDataset,
+    DatasetCache,
+    compile_dataset,
+    load_aac_dataset,
+    load_aac_file,
+    open_compiled_dataset,
+    read_aac_source,
+)
+from .metrics import METRICS, Metrics
+from .parallel import (
+    ParallelAACIndex,
+    read_shared_geometries,
+    read_shared_grid,
+    write_shared_geometries,
+    write_shared_grid,
+)
+from .refresh import KEY_COLUMNS, diff_features, refresh_aac_dataset, update_dataset
+from .server import MAX_BATCH_POINTS, make_handler, make_server, serialize_properties, serve_forever
+from .topojson import build_topology, patch_topology, subset_topology
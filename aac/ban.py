@@ -0,0 +1,251 @@
+# Géocodeur local construit à partir d'un extrait CSV de la Base Adresse Nationale (BAN),
+# pour résoudre les adresses sans appel réseau (adresses-XX.csv.gz sur adresse.data.gouv.fr)
+import difflib
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .geocoding import normalize_address
+
+# Colonnes utilisées du format CSV de la BAN (séparateur ';')
+BAN_COLUMNS = ["numero", "rep", "nom_voie", "code_postal", "nom_commune", "lon", "lat"]
+
+# Abréviations courantes des types de voie et des saints
+ABBREVIATIONS = {
+    "av": "avenue", "ave": "avenue", "bd": "boulevard", "bld": "boulevard", "blvd": "boulevard",
+    "r": "rue", "pl": "place", "ch": "chemin", "chem": "chemin", "rte": "route", "imp": "impasse",
+    "all": "allee", "sq": "square", "fg": "faubourg", "faub": "faubourg", "qu": "quai", "crs": "cours",
+    "res": "residence", "lot": "lotissement", "pass": "passage", "sen": "sentier", "mte": "montee",
+    "st": "saint", "ste": "sainte",
+}
+# Mots trop fréquents pour départager des voies (gardés pour le score final)
+STOP_WORDS = {"de", "du", "des", "la", "le", "les", "l", "d", "a", "au", "aux", "et", "en", "sur", "france"}
+# Indices de répétition des numéros (12 bis, 4 ter...)
+NUMBER_SUFFIXES = {"bis", "ter", "quater", "quinquies", "a", "b", "c", "d", "e", "f"}
+
+# Version de l'index enregistré sur disque (à changer avec la structure de LocalGeocoder)
+INDEX_VERSION = 1
+
+POSTCODE_PATTERN = re.compile(r"^\d{5}$")
+NUMBER_PATTERN = re.compile(r"^(\d{1,4})([a-z]*)$")
+
+# Mots normalisés d'une adresse, abréviations développées
+def tokenize(text):
+    return [ABBREVIATIONS.get(token, token) for token in normalize_address(text).split()]
+
+# Découper une requête en (numéro, code postal, mots restants)
+def parse_query(address):
+    tokens = tokenize(address)
+    postcode = None
+    for i in range(len(tokens) - 1, -1, -1):
+        if POSTCODE_PATTERN.match(tokens[i]):
+            postcode = tokens.pop(i)
+            break
+
+    number = None
+    match = NUMBER_PATTERN.match(tokens[0]) if tokens else None
+    if match:
+        number = match.group(1).lstrip("0") + match.group(2)
+        tokens = tokens[1:]
+        if not match.group(2) and tokens and tokens[0] in NUMBER_SUFFIXES:
+            number += tokens.pop(0)
+    return number, postcode, tokens
+
+# Couples (mot, voie) des textes (noms de voie ou de communes, un par voie). Chaque texte distinct
+# n'est découpé qu'une fois, vocabulary (mot -> numéro) est complété au passage.
+def _token_pairs(texts, vocabulary):
+    codes, uniques = pd.factorize(texts)
+    token_lists = [
+        [vocabulary.setdefault(token, len(vocabulary)) for token in set(tokenize(text)) - STOP_WORDS]
+        for text in uniques
+    ]
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.int64)
+    tokens = np.fromiter(itertools.chain.from_iterable(token_lists), dtype=np.int64, count=int(lengths.sum()))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    # Mots du texte de chaque voie, mis bout à bout voie par voie
+    counts = lengths[codes]
+    ends = np.cumsum(counts)
+    positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(offsets[codes] - (ends - counts), counts)
+    return tokens[positions], np.repeat(np.arange(len(texts)), counts)
+
+# Index de recherche en mémoire: voies (nom, code postal, commune) avec leurs numéros,
+# index inversé des mots et partition par code postal
+class LocalGeocoder:
+    def __init__(self, addresses, min_score=0.5, max_candidates=10):
+        self.min_score = min_score
+        self.max_candidates = max_candidates
+
+        addresses = addresses.dropna(subset=["nom_voie", "code_postal", "lon", "lat"]).copy()
+        addresses["code_postal"] = addresses["code_postal"].str.zfill(5)
+        street_keys = ["code_postal", "nom_commune", "nom_voie"]
+        addresses["voie"] = addresses.groupby(street_keys, sort=False).ngroup()
+        addresses = addresses.sort_values("voie", kind="stable")
+
+        # Numéros (avec indice de répétition) et coordonnées, rangés voie par voie
+        numero = addresses["numero"].fillna("").str.lstrip("0")
+        rep = addresses["rep"].fillna("").str.lower()
+        self.numbers = (numero + rep).to_numpy(dtype=object)
+        self.number_labels = (numero + np.where(rep != "", " " + rep, "")).to_numpy(dtype=object)
+        self.lons = addresses["lon"].to_numpy(dtype=float)
+        self.lats = addresses["lat"].to_numpy(dtype=float)
+
+        streets = addresses.groupby("voie", sort=True).agg(
+            nom_voie=("nom_voie", "first"), code_postal=("code_postal", "first"), nom_commune=("nom_commune", "first"),
+            lon=("lon", "mean"), lat=("lat", "mean"), count=("lon", "size")
+        )
+        self.street_names = streets["nom_voie"].to_numpy(dtype=object)
+        self.street_postcodes = streets["code_postal"].to_numpy(dtype=object)
+        self.street_communes = streets["nom_commune"].fillna("").to_numpy(dtype=object)
+        self.street_lons = streets["lon"].to_numpy()
+        self.street_lats = streets["lat"].to_numpy()
+        # Numéros de la voie i: positions starts[i]:starts[i + 1]
+        self.starts = np.concatenate([[0], np.cumsum(streets["count"].to_numpy())])
+
+        # Index inversé: mot -> voies dont le nom ou la commune contient ce mot. Les couples
+        # (mot, voie) sont dédoublonnés et triés en bloc, puis découpés mot par mot.
+        n_streets = len(self.street_names)
+        vocabulary = {}
+        pairs = [_token_pairs(self.street_names, vocabulary), _token_pairs(self.street_communes, vocabulary)]
+        keys = np.unique(np.concatenate([tokens * n_streets + streets for tokens, streets in pairs]))
+        counts = np.bincount(keys // n_streets, minlength=len(vocabulary)) if n_streets else np.zeros(0, np.int64)
+        self.postings = dict(zip(vocabulary, np.split(keys % max(n_streets, 1), np.cumsum(counts)[:-1])))
+        # Les mots rares départagent mieux les voies que "rue" ou "chemin"
+        self.weights = dict(zip(vocabulary, np.log1p(n_streets / np.maximum(counts, 1)).tolist()))
+        self.max_weight = float(np.log1p(n_streets))
+        # Vocabulaire par initiale pour corriger les fautes de frappe
+        self.vocabulary = {}
+        for token in vocabulary:
+            self.vocabulary.setdefault(token[0], []).append(token)
+
+        # Voies de chaque code postal
+        order = np.argsort(self.street_postcodes, kind="stable")
+        postcodes, starts = np.unique(self.street_postcodes[order], return_index=True)
+        self.postcodes = dict(zip(postcodes, np.split(order, starts[1:])))
+
+    # Construire l'index depuis un ou plusieurs extraits CSV de la BAN. Avec cache_dir, l'index
+    # construit y est enregistré et réutilisé tant que les fichiers sources ne changent pas.
+    @classmethod
+    def from_csv(cls, paths, cache_dir=None, min_score=0.5, max_candidates=10):
+        if isinstance(paths, str):
+            paths = [paths]
+        index_path = None
+        if cache_dir:
+            sources = [(os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)) for path in paths]
+            digest = hashlib.sha1(json.dumps([INDEX_VERSION, sources]).encode("utf-8")).hexdigest()[:16]
+            index_path = os.path.join(cache_dir, f"ban_index_{digest}.pickle")
+            if os.path.exists(index_path):
+                with open(index_path, "rb") as f:
+                    geocoder = pickle.load(f)
+                geocoder.min_score = min_score
+                geocoder.max_candidates = max_candidates
+                return geocoder
+
+        frames = [
+            pd.read_csv(path, sep=";", usecols=BAN_COLUMNS, dtype=str, keep_default_na=False, na_values=[""])
+            for path in paths
+        ]
+        addresses = pd.concat(frames, ignore_index=True)
+        addresses["lon"] = pd.to_numeric(addresses["lon"], errors="coerce")
+        addresses["lat"] = pd.to_numeric(addresses["lat"], errors="coerce")
+        geocoder = cls(addresses, min_score=min_score, max_candidates=max_candidates)
+
+        if index_path is not None:
+            # Écriture dans un fichier temporaire renommé: un autre processus ne lit jamais un index partiel
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(geocoder, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, index_path)
+        return geocoder
+
+    def __len__(self):
+        return len(self.numbers)
+
+    # Mots de la requête présents dans l'index (ou leur correction la plus proche)
+    def _known_tokens(self, tokens):
+        known = []
+        for token in tokens:
+            if token in STOP_WORDS:
+                continue
+            if token in self.postings:
+                known.append(token)
+            elif len(token) > 3:
+                known.extend(difflib.get_close_matches(token, self.vocabulary.get(token[0], []), n=1, cutoff=0.75))
+        return known
+
+    # Voies partageant le plus de mots (pondérés par leur rareté) avec la requête
+    def _candidates(self, tokens, scope):
+        postings = []
+        for token in tokens:
+            ids = self.postings[token]
+            if scope is not None:
+                ids = ids[np.isin(ids, scope, assume_unique=True)]
+            postings.append((ids, self.weights[token]))
+        ids = np.concatenate([ids for ids, _ in postings])
+        weights = np.concatenate([np.full(len(ids), weight) for ids, weight in postings])
+        street_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=weights)
+        return street_ids[np.argsort(-totals, kind="stable")[:self.max_candidates]]
+
+    # Part pondérée des mots de la requête présents (à une faute près) parmi label_tokens.
+    # Les mots absents de l'index ont le poids maximal.
+    def _coverage(self, tokens, label_tokens):
+        if not tokens:
+            return 1.0
+        found = total = 0.0
+        for token in tokens:
+            weight = self.weights.get(token, self.max_weight)
+            total += weight
+            if token in label_tokens or difflib.get_close_matches(token, label_tokens, n=1, cutoff=0.75):
+                found += weight
+        return found / total
+
+    def _street_label(self, street_id):
+        return f"{self.street_names[street_id]} {self.street_postcodes[street_id]} {self.street_communes[street_id]}"
+
+    # Géocoder une adresse: dict (lat, lon, label, score, type) au format de GeocodingClient.search, ou None
+    def search(self, address):
+        number, postcode, tokens = parse_query(address)
+        known = self._known_tokens(tokens)
+        if not known:
+            return None
+
+        # Voies candidates dans le code postal demandé, ou partout s'il n'y en a aucune
+        scope = self.postcodes.get(postcode) if postcode else None
+        candidates = self._candidates(known, scope)
+        if len(candidates) == 0 and scope is not None:
+            candidates = self._candidates(known, None)
+        if len(candidates) == 0:
+            return None
+
+        # Score final comparable à celui de l'API: similarité entre la requête et le libellé,
+        # pondérée par la part (selon leur rareté) des mots de la requête retrouvés dans le libellé
+        query = " ".join(tokenize(address))
+        significant = [token for token in tokens if token not in STOP_WORDS]
+        best = None
+        for street_id in candidates:
+            start, end = self.starts[street_id], self.starts[street_id + 1]
+            label = self._street_label(street_id)
+            lon, lat, result_type = self.street_lons[street_id], self.street_lats[street_id], "street"
+            if number:
+                matches = np.flatnonzero(self.numbers[start:end] == number)
+                if len(matches) > 0:
+                    position = start + matches[0]
+                    lon, lat, result_type = self.lons[position], self.lats[position], "housenumber"
+                    label = f"{self.number_labels[position]} {label}"
+            label_tokens = tokenize(label)
+            score = difflib.SequenceMatcher(None, query, " ".join(label_tokens)).ratio()
+            score *= self._coverage(significant, set(label_tokens))
+            if best is None or score > best['score']:
+                best = {'lat': float(lat), 'lon': float(lon), 'label': label, 'score': round(score, 4), 'type': result_type}
+
+        if best is None or best['score'] < self.min_score:
+            return None
+        return best
@@ -0,0 +1,199 @@
+# Classement par lot de fichiers de points (CSV, Parquet), par coordonnées ou adresses
+import csv
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+
+from .geocoding import GEOCODE_ERROR, get_default_geocoding_client
+from .index import ATTRIBUTE_PREFIX
+from .metrics import METRICS
+
+# Noms de colonnes reconnus automatiquement dans les fichiers de lot
+LAT_COLUMNS = ["lat", "latitude", "y"]
+LON_COLUMNS = ["lon", "lng", "long", "longitude", "x"]
+ADDRESS_COLUMNS = ["adresse", "address", "adresse_complete", "q"]
+# Suffixe des colonnes du fichier d'entrée portant le nom d'une colonne de résultat
+# (fichier déjà classé, par exemple)
+INPUT_SUFFIX = "_entree"
+
+# Trouver la première colonne dont le nom correspond à l'un des candidats
+def guess_column(columns, candidates):
+    lowered = {str(col).lower(): col for col in columns}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+# Lire un fichier CSV ou Parquet par morceaux pour borner la mémoire.
+# source est le contenu du fichier (bytes) ou un chemin sur disque.
+def iter_batch_chunks(source, file_name=None, chunk_size=50000):
+    file_name = file_name or str(source)
+    file_extension = file_name.split('.')[-1].lower()
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    
+    if file_extension == 'parquet':
+        parquet_file = pq.ParquetFile(source)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        # Détecter le séparateur (les CSV français utilisent souvent ';')
+        if isinstance(source, io.BytesIO):
+            sample = source.getvalue()[:65536]
+        else:
+            with open(source, 'rb') as f:
+                sample = f.read(65536)
+        try:
+            sep = csv.Sniffer().sniff(sample.decode('utf-8-sig', errors='ignore'), delimiters=",;\t|").delimiter
+        except csv.Error:
+            sep = ","
+        # Colonnes lues en texte: le type d'une colonne ne dépend pas du morceau (colonne vide dans
+        # le premier, renseignée ensuite), et les coordonnées sont converties par parse_coordinates
+        yield from pd.read_csv(source, sep=sep, chunksize=chunk_size, encoding='utf-8-sig', dtype=str)
+
+# Convertir des coordonnées en flottants (NaN si invalides), virgule décimale comprise (46,5)
+def parse_coordinates(values):
+    values = pd.Series(values)
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype("string").str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+# Classer un ensemble de points WGS84 en une seule requête vectorisée sur l'index.
+# in_aac vaut NA pour les points sans coordonnées valides.
+def classify_points(lats, lons, aac_index, margin_m=None):
+    lats = parse_coordinates(lats)
+    lons = parse_coordinates(lons)
+    valid = np.isfinite(lats) & np.isfinite(lons)
+    
+    matches = np.full(len(lats), -1, dtype=np.int64)
+    distances = np.full(len(lats), np.nan)
+    if valid.any():
+        with METRICS.timer("lookup_many", points=int(valid.sum())):
+            matches[valid], distances[valid] = aac_index.locate_many(lats[valid], lons[valid], margin_m)
+    
+    result = pd.DataFrame({
+        "in_aac": pd.array(matches >= 0, dtype="boolean"),
+        "aac_id": pd.array(np.where(matches >= 0, matches, 0), dtype="Int64"),
+        "aac_distance_m": distances
+    })
+    result.loc[matches < 0, "aac_id"] = pd.NA
+    result.loc[~valid, "in_aac"] = pd.NA
+    
+    # Joindre les attributs des zones trouvées (toujours les mêmes colonnes)
+    return result.join(aac_index.attributes_for(matches).add_prefix(ATTRIBUTE_PREFIX))
+
+# Ajouter les colonnes de résultat au morceau d'entrée; les colonnes d'entrée homonymes sont suffixées
+def join_results(chunk, classified):
+    return chunk.join(classified, lsuffix=INPUT_SUFFIX)
+
+# Classer un morceau du fichier de lot, par coordonnées ou par adresses
+def classify_chunk(chunk, aac_index, lat_col=None, lon_col=None, address_col=None, geocoding_client=None,
+                   margin_m=None):
+    chunk = chunk.reset_index(drop=True)
+    
+    if address_col is not None:
+        client = geocoding_client or get_default_geocoding_client()
+        addresses = [str(address) if pd.notna(address) else "" for address in chunk[address_col]]
+        classified = pd.concat(
+            list(classify_address_stream(addresses, aac_index, client, margin_m=margin_m)) or [pd.DataFrame()]
+        ).sort_index()
+        return join_results(chunk, classified)
+    
+    return join_results(chunk, classify_points(chunk[lat_col], chunk[lon_col], aac_index, margin_m))
+
+# Géocoder puis classer des adresses au fil de l'eau, par petits lots indexés par position.
+# L'endpoint CSV est utilisé en priorité; les adresses qu'il rejette, ou toutes si
+# l'endpoint est indisponible, passent par le géocodage concurrent et limité en débit.
+def classify_address_stream(addresses, aac_index, client, batch_size=1000, workers=8, margin_m=None):
+    positions, results = [], []
+    
+    def flush():
+        geocoded = pd.DataFrame.from_records([result or {} for result in results], index=positions,
+                                             columns=['lat', 'lon', 'label', 'score'])
+        # Types fixes, même pour un lot sans aucune adresse trouvée
+        geocoded = geocoded.astype({'lat': float, 'lon': float, 'label': "string", 'score': float})
+        classified = classify_points(geocoded['lat'], geocoded['lon'], aac_index, margin_m)
+        classified.index = positions
+        positions.clear()
+        results.clear()
+        return geocoded.add_prefix("geocodage_").join(classified)
+    
+    retry = []
+    processed = 0
+    try:
+        for i, result in enumerate(client.geocode_bulk(addresses)):
+            processed = i + 1
+            if result is GEOCODE_ERROR:
+                retry.append(i)
+                continue
+            positions.append(i)
+            results.append(result)
+            if len(positions) >= batch_size:
+                yield flush()
+    except requests.RequestException:
+        # Endpoint CSV indisponible: les adresses restantes passent en mode concurrent
+        retry.extend(range(processed, len(addresses)))
+    
+    for i, result in client.geocode_concurrent(((i, addresses[i]) for i in retry), workers=workers):
+        positions.append(i)
+        results.append(result)
+        if len(positions) >= batch_size:
+            yield flush()
+    
+    if positions:
+        yield flush()
+
+# Classer un fichier de lot morceau par morceau et écrire le résultat (CSV ou Parquet)
+# dans output (chemin ou fichier binaire). Renvoie les statistiques du traitement.
+def classify_batch(source, aac_index, output, file_name=None, lat_col=None, lon_col=None,
+                   address_col=None, output_format="csv", chunk_size=50000, progress=None,
+                   geocoding_client=None, margin_m=None):
+    writer = None
+    stats = {"rows": 0, "in_aac": 0, "invalid": 0}
+    
+    for chunk in iter_batch_chunks(source, file_name, chunk_size):
+        with METRICS.timer("classify_chunk", rows=len(chunk)):
+            classified = classify_chunk(chunk, aac_index, lat_col, lon_col, address_col, geocoding_client, margin_m)
+        with METRICS.timer("write_chunk", output_format=output_format):
+            writer = write_chunk(classified, output, output_format, writer)
+        stats["rows"] += len(classified)
+        stats["in_aac"] += int(classified["in_aac"].sum())
+        stats["invalid"] += int(classified["in_aac"].isna().sum())
+        
+        if progress is not None:
+            progress(stats)
+    
+    if output_format == "parquet" and writer is not None:
+        writer.close()
+    return stats
+
+# Ajouter un morceau classé au fichier résultat; renvoie l'écrivain à réutiliser
+def write_chunk(classified, output, output_format, writer=None):
+    if output_format == "parquet":
+        table = pa.Table.from_pandas(classified, preserve_index=False)
+        if writer is None:
+            # Le schéma du premier morceau s'impose aux suivants; ses colonnes entièrement vides
+            # (sans type) sont écrites en texte pour accepter les valeurs des morceaux suivants
+            schema = pa.schema(
+                [field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in table.schema],
+                metadata=table.schema.metadata
+            )
+            writer = pq.ParquetWriter(output, schema)
+        writer.write_table(table.cast(writer.schema))
+        return writer
+    
+    # L'en-tête n'est écrit qu'avec le premier morceau; un fichier sur disque est ensuite complété
+    mode = 'a' if writer is not None and isinstance(output, (str, os.PathLike)) else 'w'
+    classified.to_csv(output, index=False, header=(writer is None), mode=mode, encoding='utf-8')
+    return True
+
+# Traiter un fichier de lot complet en mémoire et renvoyer le fichier résultat
+def classify_batch_file(file_bytes, file_name, aac_index, **options):
+    output = io.BytesIO()
+    stats = classify_batch(file_bytes, aac_index, output, file_name=file_name, **options)
+    return output.getvalue(), stats
@@ -0,0 +1,215 @@
+# Banc d'essai reproductible et hors ligne: couches AAC synthétiques (GeoJSON et GPKG), points
+# aléatoires, et mesures du chargement, des recherches et de la construction de la couche d'affichage.
+# Chaque mesure tourne dans un processus neuf pour que la mémoire de pointe soit comparable.
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from .index import DISPLAY_CRS, WORKING_CRS, get_transformer
+
+# Emprise de la France métropolitaine en Lambert-93 (x_min, y_min, x_max, y_max)
+FRANCE_EXTENT = (100000, 6050000, 1240000, 7110000)
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+BENCH_FORMATS = ("geojson", "gpkg")
+
+# Zones synthétiques en Lambert-93: polygones étoilés irréguliers, disjoints, centrés sur une
+# grille perturbée. Rayon médian de radius_m mètres, vertices sommets en moyenne par zone.
+def make_zones(n_zones, vertices=150, radius_m=2000, seed=0, extent=FRANCE_EXTENT):
+    rng = np.random.default_rng(seed)
+    x_min, y_min, x_max, y_max = extent
+    n_cols = int(np.ceil(np.sqrt(n_zones * (x_max - x_min) / (y_max - y_min))))
+    spacing = (x_max - x_min) / n_cols
+    cells = rng.choice(n_cols * int(np.ceil((y_max - y_min) / spacing)), n_zones, replace=False)
+    centers_x = x_min + (cells % n_cols + 0.5) * spacing
+    centers_y = y_min + (cells // n_cols + 0.5) * spacing
+
+    # Les zones restent dans leur cellule: rayon borné par l'espacement, centre décalé de la marge restante
+    radii = np.minimum(rng.lognormal(np.log(radius_m), 0.5, n_zones), 0.45 * spacing)
+    centers_x += rng.uniform(-1, 1, n_zones) * (0.5 * spacing - radii)
+    centers_y += rng.uniform(-1, 1, n_zones) * (0.5 * spacing - radii)
+
+    # Nombre de sommets variable, rayon entre 0.6 et 1 fois le rayon de la zone
+    counts = np.clip(rng.poisson(vertices, n_zones), 8, None)
+    zone_ids = np.repeat(np.arange(n_zones), counts)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, zone_ids.size) + zone_ids * 2 * np.pi) - zone_ids * 2 * np.pi
+    distances = radii[zone_ids] * rng.uniform(0.6, 1.0, zone_ids.size)
+    coords = np.column_stack([centers_x[zone_ids] + distances * np.cos(angles),
+                              centers_y[zone_ids] + distances * np.sin(angles)])
+    # Fermer chaque anneau en répétant son premier sommet
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    coords = np.insert(coords, np.cumsum(counts), coords[starts], axis=0)
+    rings = shapely.linearrings(coords, indices=np.repeat(np.arange(n_zones), counts + 1))
+
+    return gpd.GeoDataFrame({
+        "code_aac": [f"AAC{i:06d}" for i in range(n_zones)],
+        "nom_aac": [f"Captage synthétique {i}" for i in range(n_zones)],
+        "surface_ha": np.round(np.pi * radii ** 2 * 0.64 / 10000, 1),
+        "centre_x": centers_x,
+        "centre_y": centers_y,
+        "rayon_m": radii,
+    }, geometry=shapely.polygons(rings), crs=WORKING_CRS)
+
+# Points WGS84 aléatoires: une part inside_fraction tirée à l'intérieur des zones, le reste
+# uniformément sur l'emprise. Renvoie (latitudes, longitudes).
+def make_points(zones, n_points, inside_fraction=0.5, seed=1, extent=FRANCE_EXTENT):
+    rng = np.random.default_rng(seed)
+    n_inside = int(n_points * inside_fraction)
+    picked = rng.integers(0, len(zones), n_inside)
+    # Les sommets sont à plus de 0.6 rayon du centre: un disque de 0.5 rayon est toujours intérieur
+    angles = rng.uniform(0, 2 * np.pi, n_inside)
+    distances = 0.5 * zones["rayon_m"].to_numpy()[picked] * np.sqrt(rng.uniform(0, 1, n_inside))
+    xs = np.concatenate([zones["centre_x"].to_numpy()[picked] + distances * np.cos(angles),
+                         rng.uniform(extent[0], extent[2], n_points - n_inside)])
+    ys = np.concatenate([zones["centre_y"].to_numpy()[picked] + distances * np.sin(angles),
+                         rng.uniform(extent[1], extent[3], n_points - n_inside)])
+    order = rng.permutation(n_points)
+    lons, lats = get_transformer(WORKING_CRS, DISPLAY_CRS).transform(xs[order], ys[order])
+    return np.asarray(lats), np.asarray(lons)
+
+# Générer (ou réutiliser) les fichiers d'une taille de couche dans directory.
+# Renvoie {format: chemin} et le chemin des points (.npz).
+def prepare_bench_files(directory, n_zones, n_points, vertices=150, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"aac_{n_zones}_v{vertices}_s{seed}")
+    paths = {"geojson": f"{base}.geojson", "gpkg": f"{base}.gpkg"}
+    points_path = f"{base}_points_{n_points}.npz"
+    if all(os.path.exists(path) for path in [*paths.values(), points_path]):
+        return paths, points_path
+
+    zones = make_zones(n_zones, vertices, seed=seed)
+    lats, lons = make_points(zones, n_points, seed=seed + 1)
+    np.savez(points_path, lats=lats, lons=lons)
+    zones = zones.drop(columns=["centre_x", "centre_y", "rayon_m"])
+    # GeoJSON en WGS84 (seul CRS prévu par la norme), GPKG en Lambert-93 comme les exports courants
+    zones.to_crs(DISPLAY_CRS).to_file(paths["geojson"], driver="GeoJSON", engine="pyogrio")
+    zones.to_file(paths["gpkg"], driver="GPKG", engine="pyogrio")
+    return paths, points_path
+
+# Mémoire de pointe du processus en Mo (ru_maxrss est en Ko sous Linux, en octets sous macOS)
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+# Mémoire résidente actuelle en Mo (Linux), à défaut la mémoire de pointe
+def _current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return _peak_rss_mb()
+
+# Mesures d'un fichier, exécutées dans un processus dédié
+def _bench_file(path, points_path, lookups, grid_cell):
+    from .batch import classify_points
+    from .display import display_tolerance, get_display_topology
+    from .index import is_in_aac
+    from .loading import load_aac_file
+    from .metrics import METRICS
+
+    # Le GPKG est relu depuis la mémoire, ce dont pyogrio avertit à chaque lecture
+    warnings.filterwarnings("ignore", category=RuntimeWarning, module="pyogrio")
+
+    # Mémoires en valeur absolue: la pointe due aux imports peut dépasser celle d'un petit chargement
+    result = {"file_mb": os.path.getsize(path) / 1e6, "baseline_rss_mb": _current_rss_mb()}
+    start = time.perf_counter()
+    dataset = load_aac_file(path)
+    result["load_s"] = time.perf_counter() - start
+    result["load_peak_rss_mb"] = _peak_rss_mb()
+    aac_index = dataset.aac_index
+
+    points = np.load(points_path)
+    lats, lons = points["lats"], points["lons"]
+    result.update(_bench_lookups(aac_index, lats, lons, lookups, is_in_aac, classify_points))
+    if grid_cell:
+        start = time.perf_counter()
+        aac_index.build_grid(grid_cell)
+        result["grid_build_s"] = time.perf_counter() - start
+        grid_results = _bench_lookups(aac_index, lats, lons, lookups, is_in_aac, classify_points)
+        result.update({f"grid_{key}": value for key, value in grid_results.items()})
+
+    start = time.perf_counter()
+    topology = get_display_topology(dataset, display_tolerance(len(aac_index)))
+    result["topology_s"] = time.perf_counter() - start
+    result["topology_mb"] = len(json.dumps(topology, separators=(",", ":"))) / 1e6
+    result["display_peak_rss_mb"] = _peak_rss_mb()
+
+    # Détail par étape issu de l'instrumentation (lecture, indexation, simplification...)
+    result["stages_s"] = {stage: timing["total_s"] for stage, timing in METRICS.snapshot()["timings"].items()}
+    return result
+
+# Latence de is_in_aac point par point, puis débit du classement vectorisé
+def _bench_lookups(aac_index, lats, lons, lookups, is_in_aac, classify_points):
+    # Premier appel hors mesure (initialisations paresseuses)
+    is_in_aac(lats[0], lons[0], aac_index)
+    latencies = np.empty(min(lookups, len(lats)))
+    hits = 0
+    for i in range(len(latencies)):
+        start = time.perf_counter()
+        in_aac, _, _ = is_in_aac(lats[i], lons[i], aac_index)
+        latencies[i] = time.perf_counter() - start
+        hits += in_aac
+
+    start = time.perf_counter()
+    classify_points(lats, lons, aac_index)
+    batch_s = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e6
+    return {
+        "lookup_p50_us": p50, "lookup_p95_us": p95, "lookup_p99_us": p99,
+        "lookup_per_s": len(latencies) / latencies.sum(),
+        "lookup_hit_rate": hits / len(latencies),
+        "batch_points_per_s": len(lats) / batch_s,
+    }
+
+# Lancer le banc d'essai complet et renvoyer le rapport (dict sérialisable en JSON)
+def run_benchmark(directory, sizes=DEFAULT_SIZES, formats=BENCH_FORMATS, n_points=100000, lookups=2000,
+                  vertices=150, seed=0, grid_cell=None, progress=None):
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "shapely": shapely.__version__,
+            "geos": shapely.geos_version_string,
+            "numpy": np.__version__,
+            "geopandas": gpd.__version__,
+        },
+        "parameters": {"sizes": list(sizes), "formats": list(formats), "points": n_points, "lookups": lookups,
+                       "vertices": vertices, "seed": seed, "grid_cell": grid_cell},
+        "results": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for n_zones in sizes:
+        paths, points_path = prepare_bench_files(directory, n_zones, n_points, vertices, seed)
+        for file_format in formats:
+            # Un processus neuf par mesure: ni cache ni mémoire de pointe hérités de la précédente
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(_bench_file, paths[file_format], points_path, lookups, grid_cell).result()
+            result = {"zones": n_zones, "format": file_format, **result}
+            report["results"].append(result)
+            if progress is not None:
+                progress(result)
+    return report
+
+# Comparer deux rapports: ratio nouveau / ancien de chaque mesure, par taille et format
+def compare_reports(previous, current):
+    previous_results = {(result["zones"], result["format"]): result for result in previous["results"]}
+    rows = []
+    for result in current["results"]:
+        old = previous_results.get((result["zones"], result["format"]))
+        if old is None:
+            continue
+        for key, value in result.items():
+            if key in ("zones", "format") or not isinstance(value, (int, float)) or not old.get(key):
+                continue
+            rows.append({"zones": result["zones"], "format": result["format"], "metric": key,
+                         "previous": old[key], "current": value, "ratio": value / old[key]})
+    return rows
@@ -0,0 +1,228 @@
+# Ligne de commande: classement de gros fichiers de points sans interface web
+#   python -m aac classify zones.gpkg points.csv resultat.parquet --region Occitanie
+#   python -m aac classify zones.gpkg points.parquet resultat.parquet --workers 32
+#   python -m aac check zones.gpkg 43.6 3.88
+#   python -m aac compile zones.gpkg zones.arrow --grid-cell 500   (index compilé avec sa grille, accepté partout à la place du GPKG)
+#   python -m aac classify zones.arrow points.csv resultat.csv --metrics mesures.prom --log-metrics
+#   python -m aac bench --sizes 100,1000,10000 --output rapport.json --compare rapport_precedent.json
+#   python -m aac serve zones.arrow --port 8080 --workers 4   (service HTTP, voir aac/server.py)
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from .ban import LocalGeocoder
+from .bench import BENCH_FORMATS, DEFAULT_SIZES, compare_reports, run_benchmark
+from .batch import ADDRESS_COLUMNS, LAT_COLUMNS, LON_COLUMNS, classify_batch, guess_column, iter_batch_chunks
+from .geocoding import GeocodingClient, default_cache_path, get_default_geocode_cache
+from .index import is_in_aac
+from .loading import compile_dataset, load_aac_file
+from .metrics import METRICS, logger as metrics_logger
+from .parallel import ParallelAACIndex
+from .server import make_server, serve_forever
+
+# Charger le fichier AAC en affichant les messages de chargement sur la sortie d'erreur
+def load_dataset(args):
+    start_time = time.time()
+    columns = tuple(args.columns.split(",")) if args.columns else None
+    dataset = load_aac_file(args.aac, args.region, columns)
+    for level, message in dataset.messages:
+        print(f"[{level}] {message}", file=sys.stderr)
+    print(f"{len(dataset.aac_index)} zones chargées en {time.time() - start_time:.1f} s", file=sys.stderr)
+    return dataset
+
+def run_classify(args):
+    dataset = load_dataset(args)
+
+    # Colonnes à utiliser, devinées sur le premier morceau si elles ne sont pas précisées
+    lat_col, lon_col, address_col = args.lat_col, args.lon_col, args.address_col
+    if address_col is None and (lat_col is None or lon_col is None):
+        columns = list(next(iter_batch_chunks(args.input, chunk_size=100)).columns)
+        lat_col = lat_col or guess_column(columns, LAT_COLUMNS)
+        lon_col = lon_col or guess_column(columns, LON_COLUMNS)
+        if lat_col is None or lon_col is None:
+            address_col = guess_column(columns, ADDRESS_COLUMNS)
+        if address_col is None and (lat_col is None or lon_col is None):
+            print(f"Colonnes de coordonnées ou d'adresse introuvables parmi: {', '.join(map(str, columns))}",
+                  file=sys.stderr)
+            return 2
+
+    output_format = args.format or ("parquet" if args.output.lower().endswith(".parquet") else "csv")
+
+    def show_progress(stats):
+        if not args.quiet:
+            print(f"\r{stats['rows']} lignes traitées, {stats['in_aac']} dans une AAC", end="", file=sys.stderr)
+
+    if args.grid_cell:
+        grid = dataset.aac_index.build_grid(args.grid_cell, args.margin)
+        grid_stats = grid.stats()
+        print(f"Grille de {grid_stats['cells']} cellules de {grid_stats['cell_size']:.0f} m: "
+              f"{grid_stats['boundary']:.0%} en bordure",
+              file=sys.stderr)
+    
+    # Géocodage local (extraits BAN) et/ou sans recours à l'API distante
+    geocoding_client = None
+    if args.ban or args.no_remote:
+        local = LocalGeocoder.from_csv(args.ban, cache_dir=os.path.dirname(default_cache_path())) if args.ban else None
+        geocoding_client = GeocodingClient(cache=get_default_geocode_cache(), local=local, remote=not args.no_remote)
+    
+    # Avec plusieurs processus, des morceaux plus gros laissent à chacun une part suffisante
+    workers = max(args.workers, 1)
+    chunk_size = args.chunk_size or 50000 * workers
+
+    start_time = time.time()
+    aac_index = ParallelAACIndex(dataset.aac_index, workers) if workers > 1 else dataset.aac_index
+    try:
+        stats = classify_batch(
+            args.input, aac_index, args.output,
+            lat_col=lat_col, lon_col=lon_col, address_col=address_col,
+            output_format=output_format, chunk_size=chunk_size,
+            progress=show_progress, geocoding_client=geocoding_client, margin_m=args.margin
+        )
+    finally:
+        if workers > 1:
+            aac_index.close()
+    elapsed = time.time() - start_time
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"{stats['rows']} lignes classées en {elapsed:.1f} s ({stats['rows'] / max(elapsed, 1e-9):.0f} lignes/s): "
+          f"{stats['in_aac']} dans une AAC, {stats['invalid']} sans coordonnées valides", file=sys.stderr)
+    return 0
+
+def run_check(args):
+    dataset = load_dataset(args)
+    in_aac, properties, zone_id = is_in_aac(args.lat, args.lon, dataset.aac_index, args.margin)
+    print(json.dumps({"in_aac": in_aac, "aac_id": zone_id, "properties": properties},
+                     ensure_ascii=False, default=str))
+    return 0
+
+def run_compile(args):
+    dataset = load_dataset(args)
+    # La marge précisée devient la tolérance par défaut de l'index compilé
+    if args.margin is not None:
+        dataset.aac_index.tolerance = args.margin
+    # La grille est enregistrée avec l'index et reprise à l'ouverture (classify et serve sans --grid-cell)
+    if args.grid_cell:
+        dataset.aac_index.build_grid(args.grid_cell)
+    compile_dataset(dataset, args.output, os.path.basename(args.aac))
+    print(f"Index compilé écrit dans {args.output} ({os.path.getsize(args.output) / 1e6:.1f} Mo)", file=sys.stderr)
+    return 0
+
+def run_bench(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    formats = args.formats.split(",")
+
+    def show_result(result):
+        print(f"{result['zones']:>6} zones {result['format']:<8} "
+              f"chargement {result['load_s']:6.2f} s (pointe {result['load_peak_rss_mb']:5.0f} Mo), "
+              f"is_in_aac p50 {result['lookup_p50_us']:6.0f} µs p99 {result['lookup_p99_us']:6.0f} µs, "
+              f"lot {result['batch_points_per_s']:9.0f} points/s, "
+              f"affichage TopoJSON {result['topology_s']:6.2f} s ({result['topology_mb']:.1f} Mo)", file=sys.stderr)
+
+    report = run_benchmark(args.workdir, sizes, formats, n_points=args.points, lookups=args.lookups,
+                           vertices=args.vertices, seed=args.seed, grid_cell=args.grid_cell, progress=show_result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        for row in compare_reports(previous, report):
+            print(f"{row['zones']:>6} zones {row['format']:<8} {row['metric']:<24} "
+                  f"{row['previous']:12.4g} -> {row['current']:12.4g} (x{row['ratio']:.2f})")
+    return 0
+
+def run_serve(args):
+    dataset = load_dataset(args)
+    if args.grid_cell:
+        dataset.aac_index.build_grid(args.grid_cell, args.margin)
+    server = make_server(dataset, args.host, args.port, args.margin)
+    host, port = server.server_address[:2]
+    print(f"Service à l'écoute sur http://{host}:{port} ({max(args.workers, 1)} processus)", file=sys.stderr)
+    serve_forever(server, args.workers)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m aac", description="Vérification des zones AAC sans interface web")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Options communes de chargement du fichier AAC
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("aac", help="Fichier des AAC (GPKG, GeoJSON ou index compilé .arrow)")
+    common.add_argument("--region", help="Région à conserver (GPKG ou GeoJSON; ignorée pour un index compilé)")
+    common.add_argument("--columns", help="Colonnes à charger, séparées par des virgules")
+    common.add_argument("--margin", type=float, default=None, help="Marge de proximité en mètres")
+    common.add_argument("--metrics", help="Fichier où écrire les mesures par étape (format texte Prometheus)")
+    common.add_argument("--log-metrics", action="store_true",
+                        help="Journaliser chaque étape chronométrée (JSON) sur la sortie d'erreur")
+
+    classify = subparsers.add_parser("classify", parents=[common], help="Classer un fichier CSV ou Parquet de points")
+    classify.add_argument("input", help="Fichier de points (CSV ou Parquet)")
+    classify.add_argument("output", help="Fichier résultat (CSV ou Parquet)")
+    classify.add_argument("--lat-col", help="Colonne latitude")
+    classify.add_argument("--lon-col", help="Colonne longitude")
+    classify.add_argument("--address-col", help="Colonne adresse (géocodage via l'API adresse)")
+    classify.add_argument("--ban", action="append", help="Extrait CSV de la BAN pour le géocodage local (répétable)")
+    classify.add_argument("--no-remote", action="store_true", help="Ne pas interroger l'API adresse en secours")
+    classify.add_argument("--format", choices=["csv", "parquet"], help="Format du résultat (déduit de l'extension)")
+    classify.add_argument("--chunk-size", type=int, default=None,
+                          help="Nombre de lignes par morceau (par défaut 50000 par processus)")
+    classify.add_argument("--grid-cell", type=float, default=None,
+                          help="Taille (m) des cellules de la grille d'accélération (désactivée par défaut)")
+    classify.add_argument("--workers", type=int, default=1, help="Nombre de processus de classement")
+    classify.add_argument("--quiet", action="store_true", help="Ne pas afficher la progression")
+    classify.set_defaults(func=run_classify)
+
+    check = subparsers.add_parser("check", parents=[common], help="Vérifier un point")
+    check.add_argument("lat", type=float)
+    check.add_argument("lon", type=float)
+    check.set_defaults(func=run_check)
+
+    compile_parser = subparsers.add_parser("compile", parents=[common], help="Compiler le fichier AAC pour un démarrage rapide")
+    compile_parser.add_argument("output", help="Fichier compilé (.arrow)")
+    compile_parser.add_argument("--grid-cell", type=float, default=None,
+                                help="Taille (m) des cellules de la grille d'accélération à enregistrer avec l'index")
+    compile_parser.set_defaults(func=run_compile)
+
+    serve = subparsers.add_parser("serve", parents=[common], help="Servir les recherches de zones en HTTP (JSON)")
+    serve.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute")
+    serve.add_argument("--port", type=int, default=8080, help="Port d'écoute (0: port libre)")
+    serve.add_argument("--workers", type=int, default=1, help="Nombre de processus préforkés partageant l'index")
+    serve.add_argument("--grid-cell", type=float, default=None,
+                       help="Taille (m) des cellules de la grille d'accélération (désactivée par défaut)")
+    serve.set_defaults(func=run_serve)
+
+    bench = subparsers.add_parser("bench", help="Mesurer les performances sur des couches AAC synthétiques")
+    bench.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Nombres de zones, séparés par des virgules")
+    bench.add_argument("--formats", default=",".join(BENCH_FORMATS), help="Formats testés (geojson, gpkg)")
+    bench.add_argument("--points", type=int, default=100000, help="Nombre de points pour le classement par lot")
+    bench.add_argument("--lookups", type=int, default=2000, help="Nombre d'appels à is_in_aac chronométrés")
+    bench.add_argument("--vertices", type=int, default=150, help="Nombre moyen de sommets par zone")
+    bench.add_argument("--seed", type=int, default=0, help="Graine des données synthétiques")
+    bench.add_argument("--grid-cell", type=float, default=None, help="Mesurer aussi les recherches avec une grille")
+    bench.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "aac_bench"),
+                       help="Répertoire des fichiers générés (réutilisés d'un lancement à l'autre)")
+    bench.add_argument("--output", help="Rapport JSON")
+    bench.add_argument("--compare", help="Rapport JSON précédent à comparer")
+    bench.set_defaults(func=run_bench)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "log_metrics", False):
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics_logger.addHandler(handler)
+        metrics_logger.setLevel(logging.INFO)
+    try:
+        return args.func(args)
+    finally:
+        if getattr(args, "metrics", None):
+            with open(args.metrics, "w", encoding="utf-8") as f:
+                f.write(METRICS.to_prometheus())
@@ -0,0 +1,136 @@
+# Format compilé des AAC: fichier Arrow IPC (attributs en colonnes, géométries déjà projetées
+# en Lambert-93, grille d'accélération éventuelle), ouvert par projection en mémoire pour un
+# démarrage rapide
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from .grid import CellGrid
+
+COMPILED_EXTENSION = "arrow"
+# Version 2: géométries en coordonnées brutes quand ce sont toutes des polygones, grille incluse
+COMPILED_FORMAT_VERSION = 2
+# Noms de colonnes réservés pour ne pas masquer un attribut "geometry" du fichier d'origine
+GEOMETRY_COLUMN = "__aac_geometry_wkb"
+POLYGON_COLUMN = "__aac_geometry_polygon"
+GRID_COLUMN = "__aac_grid_cells"
+
+# Convertir la table des attributs en tableaux Arrow par colonne. Les colonnes aux valeurs hétérogènes
+# (propriétés GeoJSON imbriquées, types mélangés) sont conservées en texte.
+def attributes_to_arrow(attributes):
+    arrays = {}
+    for name in attributes.columns:
+        column = attributes[name]
+        try:
+            arrays[str(name)] = pa.array(column, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays[str(name)] = pa.array([
+                None if value is None or value is pd.NA
+                else value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+                for value in column
+            ], type=pa.string())
+    return arrays
+
+# Polygones 2D en colonne Arrow liste d'anneaux -> liste de points (x, y), lus sans copie et
+# reconstruits par from_ragged_array, bien plus vite qu'en décodant du WKB. None si une géométrie
+# n'est pas un polygone non vide en 2D (zones supprimées, multipolygones...).
+def polygons_to_arrow(geometries):
+    if (len(geometries) == 0 or not (shapely.get_type_id(geometries) == 3).all()
+            or shapely.is_empty(geometries).any() or shapely.has_z(geometries).any()):
+        return None
+    _, coords, (ring_offsets, polygon_offsets) = shapely.to_ragged_array(geometries)
+    points = pa.FixedSizeListArray.from_arrays(pa.array(coords.ravel()), 2)
+    return pa.ListArray.from_arrays(pa.array(polygon_offsets), pa.ListArray.from_arrays(pa.array(ring_offsets), points))
+
+def polygons_from_arrow(column):
+    polygons = column.chunk(0)
+    rings = polygons.values
+    coords = rings.values.values.to_numpy().reshape(-1, 2)
+    return shapely.from_ragged_array(
+        shapely.GeometryType.POLYGON, coords, (rings.offsets.to_numpy(), polygons.offsets.to_numpy())
+    )
+
+# Colonne des géométries: (nom, tableau Arrow), en coordonnées brutes si possible, sinon en WKB
+def geometries_to_arrow(geometries):
+    polygons = polygons_to_arrow(geometries)
+    if polygons is not None:
+        return POLYGON_COLUMN, polygons
+    return GEOMETRY_COLUMN, pa.array(shapely.to_wkb(geometries), type=pa.large_binary())
+
+def geometries_from_table(table):
+    if POLYGON_COLUMN in table.column_names:
+        return polygons_from_arrow(table.column(POLYGON_COLUMN))
+    return shapely.from_wkb(table.column(GEOMETRY_COLUMN).to_numpy(zero_copy_only=False))
+
+# Ouvrir une table Arrow IPC depuis un chemin (projeté en mémoire) ou un contenu en bytes
+def read_ipc_table(source):
+    if isinstance(source, (str, os.PathLike)):
+        source = pa.memory_map(str(source), "r")
+    else:
+        source = pa.BufferReader(source)
+    return pa.ipc.open_file(source).read_all()
+
+def write_ipc_table(path, table):
+    # Fichier IPC non compressé: les colonnes sont lisibles directement depuis la projection mémoire
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+# Écrire un index AAC au format compilé
+def write_compiled(path, aac_index, file_type, source_name=None):
+    arrays = attributes_to_arrow(aac_index.attributes)
+    name, geometries = geometries_to_arrow(aac_index.geometries)
+    arrays[name] = geometries
+    metadata = {
+        "version": COMPILED_FORMAT_VERSION,
+        "crs": aac_index.crs,
+        "tolerance": aac_index.tolerance,
+        "file_type": file_type,
+        "source": source_name,
+        "zones": len(aac_index),
+    }
+    grid = aac_index.grid
+    if grid is not None and len(aac_index) > 0:
+        # Cellules aplaties dans la première ligne d'une colonne de listes (les autres lignes sont
+        # vides): relues sans copie depuis la projection mémoire
+        cells = np.ascontiguousarray(grid.cells, dtype=np.int32).ravel()
+        offsets = np.full(len(aac_index) + 1, len(cells), dtype=np.int64)
+        offsets[0] = 0
+        arrays[GRID_COLUMN] = pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(cells))
+        metadata["grid"] = {
+            "x0": float(grid.x0),
+            "y0": float(grid.y0),
+            "cell_size": float(grid.cell_size),
+            "margin": float(grid.margin),
+            "shape": list(grid.cells.shape),
+        }
+    table = pa.table(arrays)
+    write_ipc_table(path, table.replace_schema_metadata({"aac": json.dumps(metadata)}))
+
+# Lire un fichier compilé (chemin projeté en mémoire, ou contenu en bytes).
+# Renvoie (géométries, attributs, métadonnées, grille ou None). Les cellules de la grille
+# restent dans la projection mémoire (lecture seule).
+def read_compiled(source, columns=None):
+    table = read_ipc_table(source)
+    schema_metadata = table.schema.metadata or {}
+    if b"aac" not in schema_metadata:
+        raise ValueError("Le fichier n'est pas un index AAC compilé")
+    metadata = json.loads(schema_metadata[b"aac"])
+    if metadata["version"] > COMPILED_FORMAT_VERSION:
+        raise ValueError(f"Version de format compilé non prise en charge: {metadata['version']}")
+
+    geometries = geometries_from_table(table)
+    grid = None
+    if "grid" in metadata:
+        params = metadata["grid"]
+        cells = table.column(GRID_COLUMN).chunk(0).values.to_numpy().reshape(params["shape"])
+        grid = CellGrid(params["x0"], params["y0"], params["cell_size"], cells, params["margin"])
+
+    reserved = {GEOMETRY_COLUMN, POLYGON_COLUMN, GRID_COLUMN}
+    names = [name for name in table.column_names
+             if name not in reserved and (columns is None or name in columns)]
+    attributes = table.select(names).to_pandas()
+    return geometries, attributes, metadata, grid
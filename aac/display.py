@@ -0,0 +1,134 @@
+# Préparation des couches d'affichage des zones AAC (WGS84, simplifiées)
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+from jinja2 import Template
+
+from .batch import guess_column
+from .index import DISPLAY_CRS, transform_geometries
+from .metrics import METRICS
+from .topojson import build_topology, patch_topology
+
+# Styles des zones AAC sur la carte
+ZONE_STYLE = {
+    'fillColor': '#81C6E8',
+    'color': '#1F75C4',
+    'fillOpacity': 0.4,
+    'weight': 1.5
+}
+HIGHLIGHT_STYLE = {
+    'fillColor': '#4CAF50',
+    'color': '#2E7D32',
+    'fillOpacity': 0.6,
+    'weight': 2.5
+}
+
+# Colonnes reconnues pour le libellé des zones affiché au survol
+LABEL_COLUMNS = ["nom", "nom_aac", "name", "libelle", "lib_aac", "nom_captage", "code_aac", "code"]
+# Pas de quantification des coordonnées envoyées au navigateur: une fraction de la tolérance de simplification
+QUANTIZATION_RATIO = 10
+
+# Simplification adaptative selon le nombre de zones (en degrés)
+def display_tolerance(n_zones):
+    if n_zones > 500:
+        return 0.003  # Plus grande simplification pour de nombreuses zones
+    return 0.001
+
+# Propriétés TopoJSON (libellé "nom") des zones de la table d'attributs, ou None sans colonne de libellé
+def zone_labels(attributes):
+    label_column = guess_column(attributes.columns, LABEL_COLUMNS)
+    if label_column is None:
+        return None
+    return [{"nom": None if pd.isna(label) else str(label)} for label in attributes[label_column]]
+
+# Topologie TopoJSON de la couche d'affichage, construite une seule fois par jeu de données et tolérance:
+# coordonnées quantifiées, frontières communes partagées, et pour seule propriété le libellé de la zone.
+# Les objets sont rangés dans l'ordre des zones de l'index (voir subset_topology).
+def get_display_topology(dataset, tolerance):
+    key = ("display_topology", tolerance)
+    if key in dataset.artifacts:
+        METRICS.increment("display_topology_cache_hit")
+    else:
+        METRICS.increment("display_topology_cache_miss")
+        aac_index = dataset.aac_index
+        properties = zone_labels(aac_index.attributes)
+        
+        # Simplification arc par arc, après le repérage des frontières communes
+        with METRICS.timer("topology", zones=len(aac_index), tolerance=tolerance):
+            geometries = transform_geometries(aac_index.geometries, aac_index.crs, DISPLAY_CRS)
+            topology = build_topology(geometries, tolerance / QUANTIZATION_RATIO, tolerance, properties)
+        nbytes = len(json.dumps(topology, separators=(",", ":")))
+        METRICS.record_size("display_topology", nbytes)
+        
+        dataset.nbytes += nbytes
+        dataset.artifacts[key] = topology
+    return dataset.artifacts[key]
+
+# Mettre à jour les artefacts d'affichage après la modification des zones d'indices donnés
+# (remplacées, supprimées ou ajoutées à la suite): seules ces zones sont simplifiées et encodées.
+# Chaque artefact est remplacé par une copie qui partage les entités inchangées, jamais modifié:
+# dataset.artifacts peut provenir d'un autre jeu de données encore utilisé.
+# Les autres artefacts sont abandonnés et recalculés à la demande.
+def update_display_artifacts(dataset, indices):
+    indices = np.asarray(indices, dtype=np.int64)
+    aac_index = dataset.aac_index
+    geometries = transform_geometries(aac_index.geometries[indices], aac_index.crs, DISPLAY_CRS)
+    for key in list(dataset.artifacts):
+        kind, tolerance = key
+        if kind == "display_topology":
+            topology = dataset.artifacts[key]
+            patch = build_topology(
+                geometries, topology["transform"]["scale"][0], tolerance,
+                zone_labels(aac_index.attributes.iloc[indices]), translate=topology["transform"]["translate"]
+            )
+            dataset.artifacts[key] = patch_topology(topology, indices, patch)
+        else:
+            del dataset.artifacts[key]
+
+# Couche TopoJSON au style constant: le style n'est pas recopié dans chaque entité comme avec
+# folium.TopoJson, et les données sont sérialisées sans espaces
+class CompactTopoJson(folium.TopoJson):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_data = {{ this.compact_data }};
+            var {{ this.get_name() }} = L.geoJson(
+                topojson.feature(
+                    {{ this.get_name() }}_data,
+                    {{ this.get_name() }}_data{{ this._safe_object_path }}
+                ),
+                {style: {{ this.style|tojson }}}
+            ).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, topology, style, object_path="objects.aac", tooltip=None):
+        super().__init__(topology, object_path, tooltip=tooltip)
+        self.style = style
+
+    @property
+    def compact_data(self):
+        # Échappement équivalent au filtre tojson de Jinja, pour l'inclusion dans une balise <script>
+        text = json.dumps(self.data, separators=(",", ":"))
+        return (text.replace("&", "\\u0026").replace("<", "\\u003c").replace(">", "\\u003e")
+                .replace("'", "\\u0027"))
+
+    def render(self, **kwargs):
+        # Pas de style_data: les données (partagées en cache) ne sont pas modifiées
+        super(folium.TopoJson, self).render(**kwargs)
+
+# Infobulle affichant le libellé des zones, si la topologie en porte un
+def zone_tooltip(topology, object_name="aac"):
+    objects = topology["objects"][object_name]["geometries"]
+    if not objects or "nom" not in objects[0].get("properties", {}):
+        return None
+    return folium.GeoJsonTooltip(fields=["nom"], aliases=["AAC"])
+
+# Indices des zones dont l'emprise croise une fenêtre de window_m mètres autour du point
+def zones_in_window(aac_index, lat, lon, window_m):
+    x, y = aac_index.project(lat, lon)
+    window = shapely.box(x - window_m, y - window_m, x + window_m, y + window_m)
+    return np.sort(aac_index.tree.query(window, predicate="intersects"))
+
@@ -0,0 +1,423 @@
+# Géocodage via l'API adresse.data.gouv.fr ou un index BAN local: client HTTP, cache et limitation de débit
+import csv
+import io
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import METRICS
+
+# Normaliser une adresse pour servir de clé de cache (casse, accents, espaces, code postal)
+def normalize_address(address):
+    text = unicodedata.normalize("NFKD", str(address))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[,;'’\"().\-/]", " ", text)
+    # "34 000" -> "34000"
+    text = re.sub(r"\b(\d{2})\s+(\d{3})\b", r"\1\2", text)
+    return " ".join(text.split())
+
+# Marqueur d'absence dans le cache (distinct d'une adresse introuvable, mise en cache à None)
+CACHE_MISS = object()
+
+# Cache de géocodage à deux niveaux: LRU en mémoire devant une base SQLite sur disque
+class GeocodeCache:
+    def __init__(self, path, max_entries=10000, ttl=30 * 24 * 3600, negative_ttl=24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Durée de conservation plus courte pour les adresses introuvables
+        self.negative_ttl = negative_ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS geocodage (
+                cle TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL,
+                label TEXT,
+                score REAL,
+                expire REAL NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def _remember(self, key, value, expire):
+        self._memory[key] = (value, expire)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # Renvoie le résultat en cache (dict ou None), ou CACHE_MISS
+    def get(self, address):
+        key = normalize_address(address)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                METRICS.increment("geocode_cache_hit")
+                return entry[0]
+            
+            row = self._db.execute(
+                "SELECT lat, lon, label, score, expire FROM geocodage WHERE cle = ?", (key,)
+            ).fetchone()
+            if row is not None and row[4] > now:
+                lat, lon, label, score, expire = row
+                value = None if lat is None else {'lat': lat, 'lon': lon, 'label': label, 'score': score}
+                self._remember(key, value, expire)
+                self.disk_hits += 1
+                METRICS.increment("geocode_cache_hit")
+                return value
+            
+            self.misses += 1
+            METRICS.increment("geocode_cache_miss")
+            return CACHE_MISS
+
+    # Enregistrer plusieurs résultats (adresse, dict ou None) en une transaction
+    def put_many(self, items):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for address, value in items:
+                key = normalize_address(address)
+                expire = now + (self.ttl if value is not None else self.negative_ttl)
+                self._remember(key, value, expire)
+                if value is None:
+                    rows.append((key, None, None, None, None, expire))
+                else:
+                    rows.append((key, value['lat'], value['lon'], value['label'], value['score'], expire))
+            self._db.executemany("INSERT OR REPLACE INTO geocodage VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def put(self, address, value):
+        self.put_many([(address, value)])
+
+    @property
+    def stats(self):
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+    # Supprimer les entrées expirées de la base
+    def purge(self):
+        with self._lock:
+            self._db.execute("DELETE FROM geocodage WHERE expire <= ?", (time.time(),))
+            self._db.commit()
+
+# Emplacement par défaut de la base SQLite du cache de géocodage
+def default_cache_path():
+    return os.environ.get(
+        "AAC_GEOCODE_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "zonage_aac", "geocodage.sqlite3")
+    )
+
+# URL de l'API adresse, modifiable pour pointer vers un serveur local (serveur_adresse_local.py)
+API_ADRESSE_URL = os.environ.get("API_ADRESSE_URL", "https://api-adresse.data.gouv.fr")
+
+# Limiteur de débit à seau de jetons, partagé entre les threads
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Bloquer jusqu'à ce qu'un jeton soit disponible
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+# Débit maximal vers /search/ (l'API publie une limite de 50 requêtes/s par IP)
+GEOCODE_RATE_LIMIT = float(os.environ.get("AAC_GEOCODE_RATE", "40"))
+
+# Marqueur d'une ligne rejetée par l'endpoint CSV (à retenter via /search/)
+GEOCODE_ERROR = object()
+
+# Extrait(s) CSV de la BAN pour le géocodage local (séparés par os.pathsep), et
+# recours à l'API distante quand le géocodage local échoue (AAC_GEOCODE_REMOTE=0 pour le désactiver)
+BAN_CSV = os.environ.get("AAC_BAN_CSV")
+GEOCODE_REMOTE = os.environ.get("AAC_GEOCODE_REMOTE", "1") != "0"
+
+# Client de géocodage avec session HTTP partagée (keep-alive, nouvelles tentatives).
+# Avec un géocodeur local (LocalGeocoder), l'API n'est interrogée que pour les adresses
+# que l'index local ne résout pas avec un score d'au moins local_min_score.
+class GeocodingClient:
+    def __init__(self, base_url=API_ADRESSE_URL, timeout=(5, 30), retries=3, backoff_factor=0.5, pool_size=10,
+                 cache=None, rate_limit=GEOCODE_RATE_LIMIT, local=None, local_min_score=0.7, remote=True):
+        self.base_url = base_url.rstrip('/')
+        # Cache de géocodage optionnel (GeocodeCache), pour les résultats de l'API uniquement
+        self.cache = cache
+        self.local = local
+        self.local_min_score = local_min_score
+        self.remote = remote
+        self.rate_limiter = TokenBucket(rate_limit)
+        # (connexion, lecture) en secondes
+        self.timeout = timeout
+        
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # Géocoder une adresse localement puis via /search/ (None si aucun résultat)
+    def search(self, address):
+        local_result, accepted = self._search_local(address)
+        if accepted or not self.remote:
+            return local_result
+        
+        if self.cache is not None:
+            cached = self.cache.get(address)
+            if cached is not CACHE_MISS:
+                return cached if cached is not None else local_result
+        
+        try:
+            result = self._search_remote(address)
+        except requests.RequestException:
+            # API injoignable: le résultat local, même peu sûr, vaut mieux que rien
+            if local_result is not None:
+                return local_result
+            raise
+        if self.cache is not None:
+            self.cache.put(address, result)
+        return result if result is not None else local_result
+
+    # Résultat du géocodeur local et indication qu'il suffit (sans recours à l'API)
+    def _search_local(self, address):
+        if self.local is None or not address:
+            return None, False
+        with METRICS.timer("geocode_local"):
+            result = self.local.search(address)
+        accepted = result is not None and result['score'] >= self.local_min_score
+        METRICS.increment("geocode_local_hit" if accepted else "geocode_local_miss")
+        return result, accepted
+
+    def _search_remote(self, address):
+        self.rate_limiter.acquire()
+        with METRICS.timer("geocode_remote"):
+            response = self.session.get(
+                f"{self.base_url}/search/",
+                params={"q": address, "limit": 1},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+        
+        # Vérifier si des résultats ont été trouvés
+        if not data or not data.get('features'):
+            return None
+        
+        # Attention: l'API renvoie [lon, lat]
+        feature = data['features'][0]
+        lon, lat = feature['geometry']['coordinates']
+        return {
+            'lat': lat,
+            'lon': lon,
+            'label': feature['properties'].get('label', address),
+            'score': feature['properties'].get('score', 0)
+        }
+
+    # Géocoder une liste d'adresses localement puis via l'endpoint /search/csv/, par paquets.
+    # Les résultats (dict ou None) sont produits dans l'ordre des adresses, au fil de la lecture.
+    def geocode_bulk(self, addresses, chunk_size=5000):
+        addresses = list(addresses)
+        for start in range(0, len(addresses), chunk_size):
+            chunk = addresses[start:start + chunk_size]
+            local_results = [self._search_local(address) for address in chunk]
+            if not self.remote:
+                yield from (result for result, _ in local_results)
+                continue
+            
+            # Seules les adresses non résolues localement sont envoyées à l'API
+            unresolved = [address for address, (_, accepted) in zip(chunk, local_results) if not accepted]
+            fetched = self._geocode_remote_bulk(unresolved) if unresolved else iter(())
+            for local_result, accepted in local_results:
+                if accepted:
+                    yield local_result
+                    continue
+                result = next(fetched)
+                yield result if result is not None else local_result
+            # Terminer le générateur pour enregistrer les résultats dans le cache
+            for _ in fetched:
+                pass
+
+    # Partie distante de geocode_bulk: cache puis /search/csv/ pour les adresses absentes du cache
+    def _geocode_remote_bulk(self, addresses):
+        if self.cache is None:
+            yield from self._geocode_csv_chunk(addresses)
+            return
+        
+        cached = [self.cache.get(address) if address else None for address in addresses]
+        misses = [address for address, result in zip(addresses, cached) if result is CACHE_MISS]
+        fetched = self._geocode_csv_chunk(misses) if misses else iter(())
+        new_results = []
+        for address, result in zip(addresses, cached):
+            if result is CACHE_MISS:
+                result = next(fetched)
+                if result is not GEOCODE_ERROR:
+                    new_results.append((address, result))
+            yield result
+        if new_results:
+            self.cache.put_many(new_results)
+
+    def _geocode_csv_chunk(self, addresses):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "adresse"])
+        for i, address in enumerate(addresses):
+            writer.writerow([i, "" if address is None else address])
+        payload = buffer.getvalue().encode("utf-8")
+        METRICS.record_size("geocode_csv_request", len(payload))
+        
+        # Seul l'envoi est chronométré: la réponse est lue au rythme du classement
+        with METRICS.timer("geocode_csv_request", addresses=len(addresses)):
+            response = self.session.post(
+                f"{self.base_url}/search/csv/",
+                files={"data": ("adresses.csv", payload, "text/csv")},
+                data=[
+                    ("columns", "adresse"),
+                    ("result_columns", "latitude"),
+                    ("result_columns", "longitude"),
+                    ("result_columns", "result_label"),
+                    ("result_columns", "result_score"),
+                    ("result_columns", "result_status")
+                ],
+                timeout=self.timeout,
+                stream=True
+            )
+        try:
+            response.raise_for_status()
+            response.encoding = "utf-8"
+            
+            # Lecture en flux de la réponse CSV: l'API conserve l'ordre des lignes,
+            # chaque résultat est donc émis dès sa réception
+            expected = 0
+            lines = response.iter_lines(decode_unicode=True)
+            for row in csv.DictReader(line.lstrip("\ufeff") for line in lines):
+                row_id = int(row["id"])
+                while expected < row_id:
+                    yield None
+                    expected += 1
+                yield parse_csv_result(row)
+                expected += 1
+            while expected < len(addresses):
+                yield None
+                expected += 1
+        finally:
+            response.close()
+
+    # Géocoder des couples (clé, adresse) en parallèle via /search/, dans la limite de débit.
+    # Les couples (clé, résultat) sont produits dès qu'ils sont disponibles, sans ordre garanti.
+    def geocode_concurrent(self, items, workers=8):
+        items = iter(items)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Nombre borné de requêtes en vol pour limiter la mémoire
+            def submit_next():
+                for key, address in items:
+                    pending[executor.submit(self._search_or_none, address)] = key
+                    return True
+                return False
+            
+            for _ in range(workers * 4):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+                    submit_next()
+
+    def _search_or_none(self, address):
+        if not address:
+            return None
+        try:
+            return self.search(address)
+        except requests.RequestException:
+            return None
+
+# Convertir une ligne de résultat /search/csv/ au format de GeocodingClient.search
+def parse_csv_result(row):
+    if row.get("result_status") == "error":
+        return GEOCODE_ERROR
+    if row.get("result_status", "ok") not in ("ok", "") or not row.get("latitude"):
+        return None
+    return {
+        'lat': float(row["latitude"]),
+        'lon': float(row["longitude"]),
+        'label': row.get("result_label") or "",
+        'score': float(row.get("result_score") or 0)
+    }
+
+# Délais (connexion, lecture) en secondes d'une adresse saisie dans l'interface: l'utilisateur attend
+# la réponse, une API lente est signalée au bout de 10 s au plus plutôt qu'après les nouvelles tentatives
+INTERACTIVE_TIMEOUT = (3, 7)
+
+# Cache et clients par défaut, créés à la première utilisation et partagés par le processus
+_default_cache = None
+_default_clients = {}
+_default_lock = threading.Lock()
+
+def get_default_geocode_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = GeocodeCache(default_cache_path())
+            _default_cache.purge()
+        return _default_cache
+
+# Client par défaut: délais longs et nouvelles tentatives pour le traitement par lot, délai court
+# sans nouvelle tentative pour une adresse isolée (interactive=True). Les deux partagent le cache
+# et l'index BAN local.
+def get_default_geocoding_client(interactive=False):
+    cache = get_default_geocode_cache()
+    with _default_lock:
+        if not _default_clients:
+            local = None
+            if BAN_CSV:
+                # Import différé: le module ban dépend de ce module. L'index construit est
+                # enregistré à côté du cache de géocodage et relu aux démarrages suivants.
+                from .ban import LocalGeocoder
+                local = LocalGeocoder.from_csv(BAN_CSV.split(os.pathsep), cache_dir=os.path.dirname(default_cache_path()))
+            _default_clients[False] = GeocodingClient(cache=cache, local=local, remote=GEOCODE_REMOTE)
+            _default_clients[True] = GeocodingClient(
+                timeout=INTERACTIVE_TIMEOUT, retries=0, cache=cache, local=local, remote=GEOCODE_REMOTE
+            )
+        return _default_clients[interactive]
+
+# Géocodage d'une adresse saisie par l'utilisateur (index BAN local s'il est configuré, puis API
+# adresse.data.gouv.fr avec le délai court du client interactif)
+def geocode_address(address, client=None):
+    if client is None:
+        client = get_default_geocoding_client(interactive=True)
+    return client.search(address)
@@ -0,0 +1,170 @@
+# Lecture incrémentale des GeoJSON: les entités sont décodées une à une et converties aussitôt
+# en géométries shapely et en colonnes d'attributs, sans construire le document complet en mémoire
+import codecs
+import json
+import sys
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+# Taille des lectures successives dans le flux (octets)
+READ_SIZE = 1024 * 1024
+WHITESPACE = " \t\n\r"
+
+# Lecteur JSON sur un flux binaire: décode les valeurs une à une avec raw_decode
+# sur un tampon de texte qui ne contient que la partie non encore consommée
+class JSONStreamReader:
+    def __init__(self, stream, read_size=READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    # Lire la suite du flux; renvoie False à la fin du fichier
+    def fill(self):
+        if self.eof:
+            return False
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        # Lire au moins la taille du tampon: une entité plus grande que le tampon
+        # n'est redécodée qu'un nombre logarithmique de fois
+        data = self.stream.read(max(self.read_size, len(self.buffer)))
+        self.eof = not data
+        self.buffer += self.text_decoder.decode(data, final=self.eof)
+        return True
+
+    # Prochain caractère significatif (sans le consommer), "" en fin de flux
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, *chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"GeoJSON invalide: {' ou '.join(chars)} attendu, {char or 'fin de fichier'} trouvé")
+        self.pos += 1
+        return char
+
+    # Décoder la valeur JSON suivante, en lisant la suite du flux si elle est incomplète
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # Un nombre en fin de tampon peut se poursuivre dans la lecture suivante
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+# Parcourir les entités d'une FeatureCollection; les autres membres (type, name, crs...)
+# sont décodés puis ignorés
+def iter_geojson_features(stream, read_size=READ_SIZE):
+    reader = JSONStreamReader(stream, read_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "features":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",", "]") == "]":
+                        break
+        else:
+            reader.value()
+        if reader.expect(",", "}") == "}":
+            return
+
+# Polygone construit à partir de tableaux numpy (environ deux fois plus rapide que shape())
+def polygon_from_coordinates(rings):
+    if not rings:
+        return shapely.Polygon()
+    return shapely.Polygon(np.asarray(rings[0], dtype=float), [np.asarray(ring, dtype=float) for ring in rings[1:]])
+
+# Géométrie shapely d'une géométrie GeoJSON; les zones AAC sont presque toujours des (multi)polygones
+def geometry_from_geojson(geometry):
+    geometry_type = geometry['type']
+    if geometry_type == 'Polygon':
+        return polygon_from_coordinates(geometry['coordinates'])
+    if geometry_type == 'MultiPolygon':
+        return shapely.MultiPolygon([polygon_from_coordinates(rings) for rings in geometry['coordinates']])
+    return shape(geometry)
+
+# Colonnes de propriétés pouvant contenir le nom de la région (mêmes règles que pour les GPKG)
+def is_region_property(name):
+    return 'region' in name.lower() or name.lower() == 'reg'
+
+# Filtre appliqué pendant la lecture: par la propriété région quand l'entité en a une,
+# sinon par intersection de son emprise avec bbox (lon_min, lat_min, lon_max, lat_max)
+def make_feature_filter(region=None, bbox=None):
+    region = region.lower() if region else None
+
+    def keep(geometry, properties):
+        if region is not None:
+            for name, value in properties.items():
+                if is_region_property(name):
+                    return region in str(value).lower()
+        if bbox is not None:
+            if geometry is None:
+                return False
+            xmin, ymin, xmax, ymax = shapely.bounds(geometry)
+            return xmin <= bbox[2] and xmax >= bbox[0] and ymin <= bbox[3] and ymax >= bbox[1]
+        return region is None
+
+    return keep
+
+# Lire un GeoJSON (flux binaire) en GeoDataFrame WGS84, en ne gardant que les entités
+# acceptées par feature_filter(géométrie, propriétés) et, si précisées, les propriétés columns
+def read_geojson(stream, feature_filter=None, messages=None, columns=None, read_size=READ_SIZE):
+    messages = [] if messages is None else messages
+    kept_columns = set(columns) if columns is not None else None
+    geometries = []
+    arrays = {}
+
+    for feature in iter_geojson_features(stream, read_size):
+        try:
+            geometry = geometry_from_geojson(feature['geometry'])
+        except Exception as e:
+            messages.append(("warning", f"Erreur lors de la lecture d'une feature GeoJSON: {str(e)}"))
+            geometry = None
+        properties = feature.get('properties') or {}
+        if feature_filter is not None and not feature_filter(geometry, properties):
+            continue
+
+        row = len(geometries)
+        geometries.append(geometry)
+        for name, value in properties.items():
+            if kept_columns is not None and name not in kept_columns:
+                continue
+            column = arrays.get(name)
+            if column is None:
+                column = arrays[name] = [None] * row
+            # Les valeurs courtes répétées (région, type de captage...) ne sont stockées qu'une fois
+            if isinstance(value, str) and len(value) <= 64:
+                value = sys.intern(value)
+            column.append(value)
+        for column in arrays.values():
+            if len(column) == row:
+                column.append(None)
+
+    # Le GeoJSON est en WGS84 (RFC 7946)
+    return gpd.GeoDataFrame(arrays, geometry=np.asarray(geometries, dtype=object), crs="EPSG:4326")
@@ -0,0 +1,125 @@
+# Grille précalculée en Lambert-93: chaque cellule est classée entièrement dans une zone,
+# entièrement hors de toute zone, ou en bordure. Seules les cellules de bordure
+# nécessitent le test exact sur les géométries.
+import numpy as np
+import shapely
+
+# Codes des cellules qui ne correspondent pas à une zone
+OUTSIDE = -1
+BOUNDARY = -2
+
+# Taille de cellule par défaut (mètres) et nombre maximal de cellules
+DEFAULT_CELL_SIZE = 500
+MAX_CELLS = 4_000_000
+
+class CellGrid:
+    def __init__(self, x0, y0, cell_size, cells, margin):
+        self.x0 = x0
+        self.y0 = y0
+        self.cell_size = cell_size
+        # cells[ligne, colonne]: indice de zone, OUTSIDE ou BOUNDARY
+        self.cells = cells
+        # Une cellule OUTSIDE n'a aucune zone à moins de margin mètres
+        self.margin = margin
+
+    @property
+    def nbytes(self):
+        return self.cells.nbytes
+
+    # Code de cellule pour chaque point; les points hors de l'emprise de la grille sont OUTSIDE.
+    # Pour une marge plus grande que celle de la grille, les cellules OUTSIDE ne sont plus sûres.
+    def classify(self, xs, ys, max_distance=None):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        n_rows, n_cols = self.cells.shape
+        with np.errstate(invalid="ignore"):
+            cols = np.floor((xs - self.x0) / self.cell_size)
+            rows = np.floor((ys - self.y0) / self.cell_size)
+            inside = (cols >= 0) & (cols < n_cols) & (rows >= 0) & (rows < n_rows)
+
+        codes = np.full(len(xs), OUTSIDE, dtype=np.int64)
+        codes[inside] = self.cells[rows[inside].astype(np.intp), cols[inside].astype(np.intp)]
+        if max_distance is not None and max_distance > self.margin:
+            # Les coordonnées invalides (NaN) restent hors de toute zone
+            codes[(codes == OUTSIDE) & ~(np.isnan(xs) | np.isnan(ys))] = BOUNDARY
+        return codes
+
+    # Recalculer les cellules proches des emprises bounds (xmin, ymin, xmax, ymax) après la
+    # modification de zones. Renvoie False si une emprise déborde de la grille (à reconstruire).
+    def update(self, geometries, tree, bounds):
+        n_rows, n_cols = self.cells.shape
+        for xmin, ymin, xmax, ymax in bounds:
+            if (xmin - self.margin < self.x0 or ymin - self.margin < self.y0 or
+                    xmax + self.margin >= self.x0 + n_cols * self.cell_size or
+                    ymax + self.margin >= self.y0 + n_rows * self.cell_size):
+                return False
+            # Cellules dont la version élargie de margin mètres touche l'emprise
+            col_start = max(int((xmin - self.margin - self.x0) // self.cell_size) - 1, 0)
+            col_end = min(int((xmax + self.margin - self.x0) // self.cell_size) + 2, n_cols)
+            row_start = max(int((ymin - self.margin - self.y0) // self.cell_size) - 1, 0)
+            row_end = min(int((ymax + self.margin - self.y0) // self.cell_size) + 2, n_rows)
+            box_x, box_y = np.meshgrid(self.x0 + np.arange(col_start, col_end) * self.cell_size,
+                                       self.y0 + np.arange(row_start, row_end) * self.cell_size)
+            codes = classify_cells(box_x.ravel(), box_y.ravel(), self.cell_size, self.margin, geometries, tree)
+            self.cells[row_start:row_end, col_start:col_end] = codes.reshape(box_x.shape)
+        return True
+
+    # Part des cellules de chaque catégorie (intérieur, extérieur, bordure)
+    def stats(self):
+        total = max(self.cells.size, 1)
+        return {
+            "cells": int(self.cells.size),
+            "cell_size": self.cell_size,
+            "inside": float((self.cells >= 0).sum() / total),
+            "outside": float((self.cells == OUTSIDE).sum() / total),
+            "boundary": float((self.cells == BOUNDARY).sum() / total),
+        }
+
+# Code des cellules de coin inférieur gauche (box_x, box_y): zone qui la couvre, BOUNDARY ou OUTSIDE
+def classify_cells(box_x, box_y, cell_size, margin, geometries, tree):
+    codes = np.full(len(box_x), OUTSIDE, dtype=np.int32)
+    # Zones touchant la cellule élargie de margin mètres (approximation par excès du
+    # voisinage à margin mètres, bien moins coûteuse qu'un test de distance): bordure
+    expanded = shapely.box(box_x - margin, box_y - margin, box_x + cell_size + margin, box_y + cell_size + margin)
+    cell_idx, zone_idx = tree.query(expanded, predicate="intersects")
+    if len(cell_idx) > 0:
+        # Zone de plus petit indice touchant chaque cellule élargie
+        order = np.lexsort((zone_idx, cell_idx))
+        cell_idx, zone_idx = cell_idx[order], zone_idx[order]
+        first = np.r_[True, cell_idx[1:] != cell_idx[:-1]]
+        cell_idx, zone_idx = cell_idx[first], zone_idx[first]
+        codes[cell_idx] = BOUNDARY
+        # Si elle couvre la cellule, c'est aussi la zone de plus petit indice contenant ses points
+        boxes = shapely.box(box_x[cell_idx], box_y[cell_idx], box_x[cell_idx] + cell_size, box_y[cell_idx] + cell_size)
+        covered = shapely.covers(geometries[zone_idx], boxes)
+        codes[cell_idx[covered]] = zone_idx[covered]
+    return codes
+
+# Construire la grille sur l'emprise des zones (élargie de margin mètres).
+# Une cellule est attribuée à une zone si elle est entièrement couverte par la zone
+# de plus petit indice qui la touche, comme la règle de AACIndex.lookup.
+def build_cell_grid(geometries, tree, margin=0.0, cell_size=None, max_cells=MAX_CELLS):
+    present = ~shapely.is_missing(geometries) & ~shapely.is_empty(geometries)
+    if not present.any():
+        return CellGrid(0.0, 0.0, cell_size or DEFAULT_CELL_SIZE, np.full((0, 0), OUTSIDE, dtype=np.int32), margin)
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geometries[present])
+    xmin, ymin, xmax, ymax = xmin - margin, ymin - margin, xmax + margin, ymax + margin
+    cell_size = float(cell_size or DEFAULT_CELL_SIZE)
+    # Agrandir les cellules si l'emprise en demanderait trop
+    cell_size = max(cell_size, np.sqrt((xmax - xmin) * (ymax - ymin) / max_cells))
+    # Une cellule de plus dans chaque direction pour inclure le bord supérieur de l'emprise
+    n_cols = int((xmax - xmin) // cell_size) + 1
+    n_rows = int((ymax - ymin) // cell_size) + 1
+
+    cells = np.full((n_rows, n_cols), OUTSIDE, dtype=np.int32)
+    col_x = xmin + np.arange(n_cols) * cell_size
+    # Traitement par bandes de lignes pour borner le nombre de boîtes en mémoire
+    rows_per_band = max(1, 100_000 // n_cols)
+    for row_start in range(0, n_rows, rows_per_band):
+        row_y = ymin + np.arange(row_start, min(row_start + rows_per_band, n_rows)) * cell_size
+        box_x, box_y = np.meshgrid(col_x, row_y)
+        band = classify_cells(box_x.ravel(), box_y.ravel(), cell_size, margin, geometries, tree)
+        cells[row_start:row_start + len(row_y)] = band.reshape(len(row_y), n_cols)
+
+    return CellGrid(xmin, ymin, cell_size, cells, margin)
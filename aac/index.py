@@ -0,0 +1,265 @@
+# Index spatial des zones AAC et requêtes ponctuelles (contenance, proximité)
+import copy
+import functools
+
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+from shapely import STRtree
+from shapely.geometry import Point
+
+from .grid import BOUNDARY, build_cell_grid
+from .metrics import METRICS
+
+# CRS de travail pour les opérations métriques (Lambert-93) et CRS d'affichage (WGS84)
+WORKING_CRS = "EPSG:2154"
+DISPLAY_CRS = "EPSG:4326"
+# Préfixe des attributs des zones joints aux résultats de recherche, distinct des colonnes calculées
+# (aac_id, distance_m...) pour qu'un attribut id ou distance_m ne les masque pas
+ATTRIBUTE_PREFIX = "aac_attr_"
+
+# Transformateurs pyproj mis en cache: leur création coûte bien plus qu'une projection
+@functools.lru_cache(maxsize=16)
+def get_transformer(src_crs, dst_crs):
+    return pyproj.Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+# Reprojeter un tableau de géométries shapely
+def transform_geometries(geometries, src_crs, dst_crs):
+    transformer = get_transformer(src_crs, dst_crs)
+    return shapely.transform(
+        geometries,
+        lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+    )
+
+# Copie de frame (indexé par les indices de zones 0..n-1) où les lignes de rows, indexées par indice
+# de zone, remplacent les lignes existantes ou s'ajoutent à la suite (indices n, n + 1...). Seules ces
+# lignes sont écrites, sans concaténation suivie d'un tri de toute la table. Une colonne dont le type
+# change (entiers devenus décimaux...) est reconstruite entière.
+def replace_rows(frame, rows):
+    n_rows = len(frame)
+    rows = rows.reindex(columns=frame.columns)
+    positions = rows.index.to_numpy()
+    replaced = positions < n_rows
+    added = rows.iloc[~replaced].sort_index()
+    result = pd.concat([frame, added]) if len(added) > 0 else frame.copy()
+    rows = rows.iloc[replaced]
+    for column, name in enumerate(result.columns):
+        values = rows[name]
+        if values.dtype == result[name].dtype:
+            result.iloc[positions[replaced], column] = values.array
+        elif len(values) > 0:
+            result[name] = pd.concat([result[name].drop(index=values.index), values]).sort_index()
+    return result
+
+# Index spatial des zones AAC, construit une seule fois au chargement du fichier.
+# Les géométries sont stockées dans le CRS de travail (Lambert-93).
+class AACIndex:
+    def __init__(self, geometries, get_properties, attributes, crs=WORKING_CRS, tolerance=0.0):
+        self.geometries = np.asarray(geometries, dtype=object)
+        # Les géométries préparées accélèrent les tests de contenance répétés
+        shapely.prepare(self.geometries)
+        self.tree = STRtree(self.geometries)
+        self.get_properties = get_properties
+        # Table des attributs en types nullables, alignée sur les indices de zones
+        self.attributes = attributes.reset_index(drop=True).convert_dtypes()
+        self.crs = crs
+        self.transformer = get_transformer(DISPLAY_CRS, crs)
+        # Marge de tolérance (mètres) pour les points situés juste en bordure
+        self.tolerance = tolerance
+        # Grille d'accélération optionnelle (voir build_grid)
+        self.grid = None
+
+    def __len__(self):
+        return len(self.geometries)
+
+    # Précalculer la grille de cellules intérieures/extérieures pour une marge donnée
+    # (par défaut la tolérance de l'index). Les recherches avec une marge plus grande
+    # n'utilisent que les cellules intérieures.
+    def build_grid(self, cell_size=None, margin=None):
+        margin = self.tolerance if margin is None else margin
+        self.grid = build_cell_grid(self.geometries, self.tree, margin, cell_size)
+        return self.grid
+
+    # Remplacer des zones (ou en ajouter, aux indices len(self), len(self) + 1...) sans tout reconstruire.
+    # geometries sont dans le CRS de l'index (None supprime la zone), attributes est indexé par les
+    # indices dont les attributs changent. Seules les nouvelles géométries sont préparées et seules
+    # les cellules de la grille proches des zones modifiées sont recalculées.
+    def update_zones(self, indices, geometries, attributes=None):
+        indices = np.asarray(indices, dtype=np.int64)
+        geometries = np.asarray(geometries, dtype=object)
+        n_zones = len(self.geometries)
+        replaced = indices < n_zones
+        previous = self.geometries[indices[replaced]]
+
+        added = indices[~replaced]
+        if len(added) > 0:
+            if not np.array_equal(np.sort(added), np.arange(n_zones, n_zones + len(added))):
+                raise ValueError("Les zones ajoutées doivent suivre les zones existantes")
+            self.geometries = np.concatenate([self.geometries, np.full(len(added), None, dtype=object)])
+        shapely.prepare(geometries)
+        self.geometries[indices] = geometries
+        # L'arbre de shapely ne se modifie pas: il est reconstruit, mais ne lit que les emprises
+        # (quelques millisecondes pour 30 000 zones), négligeable devant la préparation
+        self.tree = STRtree(self.geometries)
+
+        if attributes is not None and len(attributes) > 0:
+            self.attributes = replace_rows(self.attributes, attributes.convert_dtypes())
+        if len(self.attributes) < len(self.geometries):
+            self.attributes = self.attributes.reindex(pd.RangeIndex(len(self.geometries)))
+
+        if self.grid is not None:
+            changed = np.concatenate([previous, geometries])
+            changed = changed[~shapely.is_missing(changed) & ~shapely.is_empty(changed)]
+            if not self.grid.update(self.geometries, self.tree, shapely.bounds(changed)):
+                self.grid = build_cell_grid(self.geometries, self.tree, self.grid.margin, self.grid.cell_size)
+
+    # Copie de l'index avec les zones d'indices donnés remplacées ou ajoutées (voir update_zones).
+    # L'index d'origine, qui peut servir à d'autres sessions, n'est pas modifié: les géométries
+    # inchangées (déjà préparées) sont partagées, seuls le tableau des géométries et la grille sont copiés.
+    def with_zones(self, indices, geometries, attributes=None):
+        index = copy.copy(self)
+        index.geometries = self.geometries.copy()
+        if self.grid is not None:
+            index.grid = copy.copy(self.grid)
+            index.grid.cells = self.grid.cells.copy()
+        index.update_zones(indices, geometries, attributes)
+        return index
+
+    # Projeter des coordonnées WGS84 dans le CRS de l'index
+    def project(self, lats, lons):
+        return self.transformer.transform(lons, lats)
+
+    # Renvoie l'indice de la première zone contenant le point (x, y), ou à moins de
+    # max_distance mètres (par défaut la tolérance de l'index), ou None
+    def lookup(self, x, y, max_distance=None):
+        if self.grid is not None:
+            code = int(self.grid.classify([x], [y], max_distance)[0])
+            if code != BOUNDARY:
+                return code if code >= 0 else None
+        point = Point(x, y)
+        # Seuls les candidats dont la bbox contient le point sont testés
+        candidates = np.sort(self.tree.query(point))
+        if len(candidates) > 0:
+            hits = candidates[shapely.intersects(self.geometries[candidates], point)]
+            if len(hits) > 0:
+                return int(hits[0])
+        margin = self.tolerance if max_distance is None else max_distance
+        if margin > 0:
+            nearest = self.tree.query_nearest(point, max_distance=margin, all_matches=False)
+            if len(nearest) > 0:
+                return int(nearest[0])
+        return None
+
+    # Version vectorisée de lookup: indice de zone par point (-1 si aucune) et distance
+    # en mètres à cette zone (0 à l'intérieur, NaN si aucune)
+    def lookup_many(self, xs, ys, max_distance=None):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        if self.grid is not None:
+            # Les points des cellules intérieures ou extérieures sont résolus par la grille,
+            # les autres passent par le test exact
+            codes = self.grid.classify(xs, ys, max_distance)
+            exact = np.flatnonzero(codes == BOUNDARY)
+            matches = np.where(codes >= 0, codes, -1)
+            distances = np.where(codes >= 0, 0.0, np.nan)
+            if len(exact) > 0:
+                matches[exact], distances[exact] = self._lookup_exact(xs[exact], ys[exact], max_distance)
+            return matches, distances
+        return self._lookup_exact(xs, ys, max_distance)
+
+    def _lookup_exact(self, xs, ys, max_distance):
+        points = shapely.points(xs, ys)
+        matches = np.full(len(points), -1, dtype=np.int64)
+        distances = np.full(len(points), np.nan)
+        
+        point_idx, zone_idx = self.tree.query(points, predicate="intersects")
+        if len(point_idx) > 0:
+            # Garder la zone de plus petit indice pour chaque point, comme lookup
+            order = np.lexsort((zone_idx, point_idx))
+            point_idx, zone_idx = point_idx[order], zone_idx[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            matches[point_idx[first]] = zone_idx[first]
+            distances[point_idx[first]] = 0.0
+        
+        margin = self.tolerance if max_distance is None else max_distance
+        missing = np.flatnonzero(matches < 0)
+        if margin > 0 and len(missing) > 0:
+            # La recherche du plus proche voisin est coûteuse: ne la faire que pour
+            # les points ayant au moins une zone à moins de margin mètres
+            missing = missing[np.unique(self.tree.query(points[missing], predicate="dwithin", distance=margin)[0])]
+            if len(missing) > 0:
+                near_zones, near_distances = self._nearest_points(points[missing], margin)
+                matches[missing] = near_zones
+                distances[missing] = near_distances
+        return matches, distances
+
+    # lookup_many pour des coordonnées WGS84, projetées dans le CRS de l'index
+    def locate_many(self, lats, lons, max_distance=None):
+        xs, ys = self.project(lats, lons)
+        return self.lookup_many(xs, ys, max_distance)
+
+    # Zone la plus proche de chaque point, dans la limite de max_distance mètres:
+    # renvoie (indices, -1 si aucune) et (distances en mètres, NaN si aucune)
+    def nearest(self, xs, ys, max_distance=None):
+        points = shapely.points(np.atleast_1d(np.asarray(xs, dtype=float)), np.atleast_1d(np.asarray(ys, dtype=float)))
+        return self._nearest_points(points, max_distance)
+
+    def _nearest_points(self, points, max_distance):
+        zones = np.full(len(points), -1, dtype=np.int64)
+        distances = np.full(len(points), np.nan)
+        (point_idx, zone_idx), zone_distances = self.tree.query_nearest(
+            points, max_distance=max_distance, return_distance=True, all_matches=False
+        )
+        zones[point_idx] = zone_idx
+        distances[point_idx] = zone_distances
+        return zones, distances
+
+    # Attributs des zones demandées, dans l'ordre des indices (lignes vides pour -1)
+    def attributes_for(self, indices):
+        return self.attributes.reindex(indices).reset_index(drop=True)
+
+# Construire l'index spatial à partir d'un GeoDataFrame (GPKG, ou GeoJSON lu par read_geojson).
+# Les données sont reprojetées une seule fois dans le CRS de travail.
+# La tolérance par défaut (mètres) dépend de la précision du format d'origine.
+def build_aac_index(gdf, tolerance=100):
+    attributes = gdf.drop(columns=gdf.geometry.name)
+    geometries = gdf.geometry
+    if geometries.crs != WORKING_CRS:
+        geometries = geometries.to_crs(WORKING_CRS)
+    return AACIndex(
+        geometries.to_numpy(),
+        lambda i: attributes.iloc[i].to_dict(),
+        attributes,
+        tolerance=tolerance
+    )
+
+# Indice de la zone AAC contenant le point WGS84 (ou à moins de margin_m mètres), ou None
+def locate_aac_zone(lat, lon, aac_index, margin_m=None):
+    # Convertir le point dans le CRS des données
+    x, y = aac_index.project(lat, lon)
+    return aac_index.lookup(x, y, margin_m)
+
+# Zones AAC les plus proches d'un ou plusieurs points WGS84, dans la limite de max_distance mètres.
+# Renvoie un DataFrame avec l'identifiant, la distance en mètres et les attributs de la zone.
+def nearest_aac(lats, lons, aac_index, max_distance):
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    xs, ys = aac_index.project(lats, lons)
+    zones, distances = aac_index.nearest(xs, ys, max_distance)
+    
+    result = pd.DataFrame({
+        "aac_id": pd.array(np.where(zones >= 0, zones, 0), dtype="Int64"),
+        "distance_m": distances
+    })
+    result.loc[zones < 0, "aac_id"] = pd.NA
+    return result.join(aac_index.attributes_for(zones).add_prefix(ATTRIBUTE_PREFIX))
+
+# Vérifier si un point est dans une zone AAC, ou à moins de margin_m mètres.
+# Renvoie (dans une AAC, propriétés de la zone, identifiant de la zone).
+def is_in_aac(lat, lon, aac_index, margin_m=None):
+    with METRICS.timer("lookup"):
+        zone_id = locate_aac_zone(lat, lon, aac_index, margin_m)
+    if zone_id is not None:
+        return True, aac_index.get_properties(zone_id), zone_id
+    return False, None, None
@@ -0,0 +1,293 @@
+# Chargement des fichiers AAC (GPKG, GeoJSON) et cache des jeux de données chargés
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import geopandas as gpd
+import pyogrio
+import pyproj
+import shapely
+
+from .compiled import COMPILED_EXTENSION, read_compiled, write_compiled
+from .geojson import make_feature_filter, read_geojson
+from .index import AACIndex, build_aac_index
+from .metrics import METRICS
+
+# Jeu de données AAC chargé, avec son index spatial et ses artefacts dérivés
+class CachedDataset:
+    def __init__(self, data_source, file_type, aac_index, messages, nbytes=None):
+        self.data_source = data_source
+        self.file_type = file_type
+        self.aac_index = aac_index
+        # Messages (niveau, texte) émis au chargement, rejoués à chaque rerun
+        self.messages = messages
+        # Artefacts calculés à la demande (couches d'affichage, etc.)
+        self.artifacts = {}
+        # Empreintes des entités (géométries, attributs) par précision, calculées au premier
+        # rafraîchissement puis tenues à jour par les suivants (voir refresh.py)
+        self.fingerprints = {}
+        self.nbytes = estimate_dataset_size(data_source, aac_index) if nbytes is None else nbytes
+
+# Estimation de l'empreinte mémoire d'un jeu de données chargé
+def estimate_dataset_size(data_source, aac_index):
+    return estimate_rows_size(aac_index.geometries, data_source.drop(columns=data_source.geometry.name))
+
+# Estimation de l'empreinte mémoire de zones (géométries de l'index et attributs), pour le jeu
+# entier ou seulement les lignes modifiées par un rafraîchissement
+def estimate_rows_size(geometries, attributes):
+    # Environ 16 octets par coordonnée, doublés pour les géométries préparées
+    nbytes = int(shapely.get_num_coordinates(geometries).sum()) * 16 * 2
+    nbytes += int(attributes.memory_usage(deep=True, index=False).sum())
+    return nbytes
+
+# Cache LRU des jeux de données, partagé entre les sessions, avec budget mémoire
+class DatasetCache:
+    def __init__(self, max_entries=8, max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        # Chargements en cours par clé: les autres sessions attendent leur fin au lieu de relire le fichier
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return self._nbytes()
+
+    def _nbytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    # Jeu de données de key, chargé par load() s'il n'est pas en cache. Une seule session charge
+    # une clé donnée: les autres attendent puis relisent le cache (ou chargent à leur tour si le
+    # chargement a échoué ou si l'entrée a déjà été évincée)
+    def get_or_load(self, key, load):
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    METRICS.increment("dataset_cache_hit")
+                    return self._entries[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            pending.wait()
+        
+        METRICS.increment("dataset_cache_miss")
+        try:
+            dataset = load()
+            self._insert(key, dataset)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+        return dataset
+
+    # Jeu de données de new_key, dérivé si besoin de celui de old_key par derive(ancien) -> nouveau
+    # (rafraîchissement incrémental). L'entrée de old_key n'est pas modifiée: d'autres sessions
+    # peuvent être en train de la lire. KeyError si old_key n'est pas (ou plus) en cache.
+    def get_or_derive(self, old_key, new_key, derive):
+        def load():
+            with self._lock:
+                previous = self._entries[old_key]
+            return derive(previous)
+        return self.get_or_load(new_key, load)
+
+    def _insert(self, key, dataset):
+        with self._lock:
+            self._entries[key] = dataset
+            self._entries.move_to_end(key)
+            # Évincer les entrées les moins récemment utilisées (en gardant la dernière)
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._nbytes() > self.max_bytes):
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Emprises approximatives des régions (lon_min, lat_min, lon_max, lat_max), en WGS84
+REGION_BBOXES = {
+    "Occitanie": (-0.33, 42.33, 4.85, 45.05),
+    "Nouvelle-Aquitaine": (-1.79, 42.78, 2.61, 47.18),
+    "Auvergne-Rhône-Alpes": (2.06, 44.12, 7.19, 46.81),
+    "Provence-Alpes-Côte d'Azur": (4.23, 42.98, 7.72, 45.13),
+    "Île-de-France": (1.45, 48.12, 3.56, 49.24),
+    "Hauts-de-France": (1.38, 48.84, 4.26, 51.09),
+    "Grand Est": (3.38, 47.42, 8.23, 50.17),
+    "Bourgogne-Franche-Comté": (2.85, 46.16, 7.14, 48.40),
+    "Centre-Val de Loire": (0.05, 46.35, 3.13, 48.94),
+    "Pays de la Loire": (-2.62, 46.27, 0.92, 48.57),
+    "Bretagne": (-5.14, 47.28, -1.01, 48.90),
+    "Normandie": (-1.95, 48.18, 1.80, 50.07),
+    "Corse": (8.53, 41.33, 9.56, 43.03),
+}
+
+# Lecture en flux d'un GeoJSON, avec le filtre régional appliqué pendant la lecture.
+# open_stream ouvre un nouveau flux binaire: le fichier est relu en entier si le filtre ne garde aucune zone.
+def read_geojson_source(open_stream, selected_region, columns, messages):
+    gdf = None
+    if selected_region is not None and selected_region != "France entière":
+        # Par la propriété région des entités, sinon par la bbox approximative de la région
+        feature_filter = make_feature_filter(selected_region, REGION_BBOXES.get(selected_region))
+        filter_messages = []
+        with METRICS.timer("region_filter", file_type="geojson", region=selected_region), open_stream() as stream:
+            gdf = read_geojson(stream, feature_filter, filter_messages, columns=columns)
+        
+        if len(gdf) > 0:
+            messages.extend(filter_messages)
+            messages.append(("success", f"Données filtrées pour la région {selected_region}: {len(gdf)} zones trouvées"))
+        else:
+            gdf = None
+            messages.append(("warning", f"Aucune zone trouvée pour la région {selected_region}. Utilisation de toutes les données."))
+    
+    if gdf is None:
+        with METRICS.timer("parse", file_type="geojson"), open_stream() as stream:
+            gdf = read_geojson(stream, messages=messages, columns=columns)
+        messages.append(("success", f"{len(gdf)} zones détectées"))
+    return gdf
+
+# Lecture d'un fichier GeoJSON ou GPKG en mémoire, avec le filtre régional et la sélection de colonnes
+# appliqués à la lecture. Renvoie (GeoDataFrame, type de fichier).
+def read_aac_source(file_bytes, file_extension, selected_region, columns, messages):
+    filter_by_region = selected_region is not None
+    if file_extension in ['geojson', 'json']:
+        # Lecture en flux: le document GeoJSON complet n'est jamais construit en mémoire
+        data_source = read_geojson_source(lambda: io.BytesIO(file_bytes), selected_region, columns, messages)
+        file_type = "geojson"
+        
+    elif file_extension == 'gpkg':
+        # Lire uniquement le schéma pour préparer les filtres appliqués à la lecture
+        info = pyogrio.read_info(io.BytesIO(file_bytes))
+        fields = list(info["fields"])
+        read_options = {}
+        if columns is not None:
+            read_options["columns"] = [col for col in columns if col in fields]
+        
+        # Filtrer par région si demandé, directement lors de la lecture
+        if filter_by_region and selected_region != "France entière":
+            # Vérifier si une colonne 'region' ou similaire existe
+            region_cols = [col for col in fields if 'region' in col.lower() or 'reg' == col.lower()]
+            
+            if region_cols:
+                # Filtre attributaire SQL (insensible à la casse) sur le nom de la région
+                region_col = region_cols[0].replace('"', '""')
+                region_value = selected_region.replace("'", "''")
+                region_filter = {"where": f"\"{region_col}\" LIKE '%{region_value}%'"}
+                filter_label = f"la région {selected_region}"
+            elif selected_region in REGION_BBOXES:
+                # Filtre spatial sur la bbox approximative de la région, exprimée dans le CRS du fichier
+                bbox = REGION_BBOXES[selected_region]
+                if info["crs"]:
+                    bbox = pyproj.Transformer.from_crs("EPSG:4326", info["crs"], always_xy=True).transform_bounds(*bbox)
+                region_filter = {"bbox": tuple(bbox)}
+                filter_label = f"la région {selected_region} par bbox"
+            else:
+                region_filter = None
+                messages.append(("warning", f"Impossible de filtrer automatiquement pour {selected_region}. Aucune colonne 'region' trouvée."))
+            
+            gdf = None
+            if region_filter is not None:
+                with METRICS.timer("region_filter", file_type="gpkg", region=selected_region):
+                    gdf = gpd.read_file(io.BytesIO(file_bytes), engine="pyogrio", **read_options, **region_filter)
+                
+                if len(gdf) > 0:
+                    messages.append(("success", f"Données filtrées pour {filter_label}: {len(gdf)} zones trouvées"))
+                else:
+                    gdf = None
+                    messages.append(("warning", f"Aucune zone trouvée pour {filter_label}. Utilisation de toutes les données."))
+            
+            if gdf is None:
+                with METRICS.timer("parse", file_type="gpkg"):
+                    gdf = gpd.read_file(io.BytesIO(file_bytes), engine="pyogrio", **read_options)
+        else:
+            # Utiliser geopandas pour lire le GeoPackage
+            with METRICS.timer("parse", file_type="gpkg"):
+                gdf = gpd.read_file(io.BytesIO(file_bytes), engine="pyogrio", **read_options)
+            
+            if filter_by_region:
+                messages.append(("info", f"Utilisation de l'ensemble des données: {len(gdf)} zones au total pour la France entière"))
+        
+        # S'assurer que le GeoDataFrame a un CRS défini
+        if gdf.crs is None:
+            messages.append(("warning", "Le fichier GPKG n'a pas de système de coordonnées défini. On suppose WGS84 (EPSG:4326)."))
+            gdf = gdf.set_crs(epsg=4326)
+        
+        data_source = gdf
+        file_type = "gpkg"
+    else:
+        raise ValueError(f"Extension de fichier non prise en charge: {file_extension}")
+    return data_source, file_type
+
+# Lecture, filtrage régional et indexation d'un fichier AAC.
+# Le filtre régional et la sélection de colonnes sont appliqués à la lecture.
+def load_aac_dataset(file_bytes, file_name, selected_region=None, columns=None):
+    messages = []
+    file_extension = file_name.split('.')[-1].lower()
+    METRICS.record_size("aac_file", len(file_bytes))
+    
+    if file_extension == COMPILED_EXTENSION:
+        # Index déjà compilé: ni lecture du format d'origine ni reprojection
+        if selected_region is not None:
+            messages.append(("warning", "Le filtrage par région n'est pas disponible pour un index compilé. L'index est chargé en entier."))
+        return open_compiled_dataset(file_bytes, columns, messages)
+    
+    data_source, file_type = read_aac_source(file_bytes, file_extension, selected_region, columns, messages)
+    
+    # Construire l'index spatial une seule fois pour toutes les vérifications
+    # (tolérance d'environ 10-15m pour les GeoJSON, 100m pour les GPKG)
+    with METRICS.timer("build_index", zones=len(data_source)):
+        aac_index = build_aac_index(data_source, tolerance=10 if file_type == "geojson" else 100)
+    
+    return CachedDataset(data_source, file_type, aac_index, messages)
+
+# Ouvrir un index compilé (chemin projeté en mémoire, ou contenu en bytes)
+def open_compiled_dataset(source, columns=None, messages=None):
+    messages = [] if messages is None else messages
+    with METRICS.timer("parse", file_type=COMPILED_EXTENSION):
+        geometries, attributes, metadata, grid = read_compiled(source, columns)
+    messages.append(("success", f"Index compilé chargé: {len(attributes)} zones"))
+    
+    with METRICS.timer("build_index", zones=len(attributes)):
+        aac_index = AACIndex(
+            geometries,
+            lambda i: attributes.iloc[i].to_dict(),
+            attributes,
+            crs=metadata["crs"],
+            tolerance=metadata["tolerance"]
+        )
+        # La grille compilée avec l'index est reprise telle quelle plutôt que recalculée
+        aac_index.grid = grid
+    data_source = gpd.GeoDataFrame(attributes, geometry=geometries, crs=metadata["crs"])
+    return CachedDataset(data_source, COMPILED_EXTENSION, aac_index, messages)
+
+# Compiler un jeu de données chargé dans un fichier Arrow IPC ouvrable par open_compiled_dataset
+def compile_dataset(dataset, path, source_name=None):
+    write_compiled(path, dataset.aac_index, dataset.file_type, source_name)
+
+# Charger un fichier AAC (GPKG, GeoJSON ou index compilé) depuis le disque
+def load_aac_file(path, selected_region=None, columns=None):
+    if os.path.basename(path).split('.')[-1].lower() == COMPILED_EXTENSION:
+        # Le fichier compilé est projeté en mémoire plutôt que lu en entier
+        messages = []
+        if selected_region is not None:
+            messages.append(("warning", "Le filtrage par région n'est pas disponible pour un index compilé. L'index est chargé en entier."))
+        return open_compiled_dataset(path, columns, messages)
+    file_name = os.path.basename(path)
+    if file_name.split('.')[-1].lower() in ['geojson', 'json']:
+        # Le GeoJSON est lu en flux depuis le disque, sans charger le fichier entier
+        messages = []
+        gdf = read_geojson_source(lambda: open(path, 'rb'), selected_region, columns, messages)
+        with METRICS.timer("build_index", zones=len(gdf)):
+            aac_index = build_aac_index(gdf, tolerance=10)
+        return CachedDataset(gdf, "geojson", aac_index, messages)
+    with open(path, 'rb') as f:
+        return load_aac_dataset(f.read(), os.path.basename(path), selected_region, columns)
@@ -0,0 +1,111 @@
+# Mesures légères par étape (durées, tailles de données, compteurs de cache), partagées par le
+# processus et exportables en journaux structurés (JSON) et au format texte Prometheus
+import contextlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger("aac.metrics")
+
+class Metrics:
+    def __init__(self, prefix="aac"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # étape -> [nombre, somme (s), max (s), dernière (s)]
+        self._timings = {}
+        # nom -> [nombre, somme (octets), dernière (octets)]
+        self._sizes = {}
+        # nom -> valeur
+        self._counters = {}
+
+    # Chronométrer un bloc: with METRICS.timer("load", file_type="gpkg"): ...
+    # Les champs supplémentaires ne servent qu'aux journaux.
+    @contextlib.contextmanager
+    def timer(self, stage, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **fields)
+
+    def observe(self, stage, seconds, **fields):
+        with self._lock:
+            entry = self._timings.setdefault(stage, [0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3] = seconds
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"stage": stage, "duration_ms": round(seconds * 1000, 3), **fields},
+                                   ensure_ascii=False, default=str))
+
+    # Taille d'une donnée produite ou transmise (fichier téléversé, couche d'affichage...)
+    def record_size(self, name, nbytes):
+        with self._lock:
+            entry = self._sizes.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += nbytes
+            entry[2] = nbytes
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    # Taux de succès d'un cache à partir des compteurs <nom>_hit et <nom>_miss
+    def hit_rate(self, name):
+        with self._lock:
+            hits = self._counters.get(f"{name}_hit", 0)
+            misses = self._counters.get(f"{name}_miss", 0)
+        return hits / (hits + misses) if hits + misses else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "timings": {
+                    stage: {"count": count, "total_s": total, "mean_s": total / count, "max_s": maximum, "last_s": last}
+                    for stage, (count, total, maximum, last) in self._timings.items()
+                },
+                "sizes": {
+                    name: {"count": count, "total_bytes": total, "last_bytes": last}
+                    for name, (count, total, last) in self._sizes.items()
+                },
+                "counters": dict(self._counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._sizes.clear()
+            self._counters.clear()
+
+    # Export au format texte d'exposition de Prometheus. labels: étiquettes ajoutées à chaque série
+    # (par exemple {"pid": ...} pour distinguer les processus d'un même service)
+    def to_prometheus(self, labels=None):
+        snapshot = self.snapshot()
+        extra = "".join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        stage_metric = f"{self.prefix}_stage_duration_seconds"
+        size_metric = f"{self.prefix}_payload_bytes"
+        counter_metric = f"{self.prefix}_events_total"
+        lines = [
+            f"# HELP {stage_metric} Durée des étapes de traitement",
+            f"# TYPE {stage_metric} summary",
+        ]
+        for stage, timing in sorted(snapshot["timings"].items()):
+            lines.append(f'{stage_metric}_count{{stage="{stage}"{extra}}} {timing["count"]}')
+            lines.append(f'{stage_metric}_sum{{stage="{stage}"{extra}}} {timing["total_s"]:.6f}')
+        lines += [f"# HELP {stage_metric}_max Durée maximale observée par étape", f"# TYPE {stage_metric}_max gauge"]
+        for stage, timing in sorted(snapshot["timings"].items()):
+            lines.append(f'{stage_metric}_max{{stage="{stage}"{extra}}} {timing["max_s"]:.6f}')
+        lines += [f"# HELP {size_metric} Taille des données produites ou transmises", f"# TYPE {size_metric} summary"]
+        for name, size in sorted(snapshot["sizes"].items()):
+            lines.append(f'{size_metric}_count{{name="{name}"{extra}}} {size["count"]}')
+            lines.append(f'{size_metric}_sum{{name="{name}"{extra}}} {size["total_bytes"]}')
+        lines += [f"# HELP {counter_metric} Compteurs d'événements (succès et échecs de cache...)",
+                  f"# TYPE {counter_metric} counter"]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'{counter_metric}{{name="{name}"{extra}}} {value}')
+        return "\n".join(lines) + "\n"
+
+# Mesures du processus, alimentées par la bibliothèque et l'application
+METRICS = Metrics()
@@ -0,0 +1,116 @@
+# Classement multi-cœurs: les points sont répartis sur un pool de processus qui partagent
+# les géométries des zones (fichier Arrow) et la grille éventuelle (fichier .npy) projetées en
+# mémoire, sans pickle par processus. Chaque processus garde sa propre copie GEOS des
+# géométries et son arbre: seules les cellules de la grille restent dans le fichier partagé.
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .compiled import geometries_from_table, geometries_to_arrow, read_ipc_table, write_ipc_table
+from .grid import CellGrid
+from .index import AACIndex
+
+# Index propre à chaque processus du pool, reconstruit une seule fois à son démarrage
+_worker_index = None
+
+# Fichier temporaire partagé avec les processus du pool: (descripteur, chemin).
+# /dev/shm garde le fichier en mémoire quand il existe.
+def _shared_file(suffix, directory=None):
+    if directory is None and os.path.isdir("/dev/shm"):
+        directory = "/dev/shm"
+    return tempfile.mkstemp(prefix="aac_zones_", suffix=suffix, dir=directory)
+
+# Écrire les géométries dans un fichier Arrow partagé, encodées comme dans l'index compilé
+# (coordonnées brutes pour des polygones, WKB sinon)
+def write_shared_geometries(geometries, directory=None):
+    name, column = geometries_to_arrow(np.asarray(geometries, dtype=object))
+    fd, path = _shared_file(".arrow", directory)
+    os.close(fd)
+    write_ipc_table(path, pa.table({name: column}))
+    return path
+
+# Relire les géométries d'un fichier écrit par write_shared_geometries. Les coordonnées sont lues
+# dans la projection mémoire, sans copie intermédiaire avant la construction des géométries.
+def read_shared_geometries(path):
+    return geometries_from_table(read_ipc_table(path))
+
+# Écrire les cellules d'une grille dans un fichier .npy partagé; renvoie (chemin, paramètres de la grille)
+def write_shared_grid(grid, directory=None):
+    fd, path = _shared_file(".npy", directory)
+    with os.fdopen(fd, "wb") as f:
+        np.save(f, grid.cells)
+    return path, (grid.x0, grid.y0, grid.cell_size, grid.margin)
+
+# Relire une grille écrite par write_shared_grid, ses cellules projetées en mémoire (lecture seule)
+def read_shared_grid(path, params):
+    x0, y0, cell_size, margin = params
+    return CellGrid(x0, y0, cell_size, np.load(path, mmap_mode="r"), margin)
+
+def _init_worker(path, count, crs, tolerance, grid_path, grid_params):
+    global _worker_index
+    # Les attributs restent dans le processus principal: seuls les indices de zones reviennent
+    _worker_index = AACIndex(read_shared_geometries(path), None,
+                             pd.DataFrame(index=pd.RangeIndex(count)), crs=crs, tolerance=tolerance)
+    # La grille éventuelle est projetée en mémoire depuis son fichier plutôt que recalculée ou transmise
+    if grid_path is not None:
+        _worker_index.grid = read_shared_grid(grid_path, grid_params)
+
+def _locate_part(lats, lons, max_distance):
+    return _worker_index.locate_many(lats, lons, max_distance)
+
+# Index AAC dont locate_many est réparti sur plusieurs processus. S'utilise à la place de
+# l'AACIndex (classify_points, classify_batch); le reste est délégué à l'index d'origine.
+class ParallelAACIndex:
+    def __init__(self, aac_index, workers=None, min_part_size=10000):
+        self.aac_index = aac_index
+        self.workers = workers or os.cpu_count() or 1
+        # En dessous de cette taille, un morceau est traité dans le processus principal
+        self.min_part_size = min_part_size
+        self.path = write_shared_geometries(aac_index.geometries)
+        self.grid_path, grid_params = write_shared_grid(aac_index.grid) if aac_index.grid is not None else (None, None)
+        # "spawn" évite de dupliquer par fork un processus multi-thread (Streamlit, géocodage)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.path, len(aac_index), aac_index.crs, aac_index.tolerance, self.grid_path, grid_params)
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.aac_index, name)
+
+    def __len__(self):
+        return len(self.aac_index)
+
+    def locate_many(self, lats, lons, max_distance=None):
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        parts = min(self.workers, len(lats) // self.min_part_size)
+        if parts <= 1:
+            return self.aac_index.locate_many(lats, lons, max_distance)
+
+        bounds = np.linspace(0, len(lats), parts + 1).astype(int)
+        futures = [
+            self.executor.submit(_locate_part, lats[start:end], lons[start:end], max_distance)
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        results = [future.result() for future in futures]
+        return (np.concatenate([matches for matches, _ in results]),
+                np.concatenate([distances for _, distances in results]))
+
+    def close(self):
+        self.executor.shutdown()
+        for path in (self.path, self.grid_path):
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
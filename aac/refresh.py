@@ -0,0 +1,217 @@
+# Rafraîchissement incrémental d'un jeu de données chargé: la nouvelle version du fichier est
+# comparée à l'ancienne (par identifiant ou empreinte de géométrie), et seules les zones ajoutées,
+# modifiées ou supprimées sont répercutées sur l'index, la table d'attributs et les couches d'affichage
+import copy
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from .batch import guess_column
+from .compiled import COMPILED_EXTENSION
+from .display import update_display_artifacts
+from .index import replace_rows
+from .loading import CachedDataset, estimate_rows_size, read_aac_source
+from .metrics import METRICS
+
+# Colonnes reconnues comme identifiant stable des zones
+KEY_COLUMNS = ["id", "code_aac", "code", "identifiant", "gid", "fid"]
+# Précision des géométries comparées après reprojection (degrés, mètres)
+FINGERPRINT_PRECISION = {True: 1e-7, False: 0.01}
+
+# Empreinte de la géométrie de chaque entité, à la précision donnée si besoin (les géométries vides ont la même)
+def geometry_fingerprints(geometries, precision=None):
+    geometries = np.asarray(geometries, dtype=object)
+    if precision is not None:
+        geometries = shapely.set_precision(geometries, precision)
+    wkb = shapely.to_wkb(geometries)
+    wkb = np.array([b"" if value is None else value for value in wkb], dtype=object)
+    return pd.util.hash_array(wkb)
+
+# Empreinte des attributs de chaque entité
+def attribute_fingerprints(attributes):
+    try:
+        return pd.util.hash_pandas_object(attributes, index=False).to_numpy()
+    except TypeError:
+        # Valeurs non hachables (listes, dicts): comparaison de leur représentation textuelle
+        return pd.util.hash_pandas_object(attributes.astype(str), index=False).to_numpy()
+
+# Précision à laquelle comparer les géométries de new à celles de old: les coordonnées reprojetées
+# ne sont comparables qu'à une précision donnée (None si les deux versions ont le même CRS)
+def fingerprint_precision(old, new):
+    return None if new.crs == old.crs else FINGERPRINT_PRECISION[old.crs.is_geographic]
+
+# Empreintes (géométries, attributs) de chaque entité de gdf, géométries reprojetées dans crs si besoin
+def feature_fingerprints(gdf, precision=None, crs=None):
+    geometries = gdf.geometry
+    if crs is not None and geometries.crs != crs:
+        geometries = geometries.to_crs(crs)
+    return geometry_fingerprints(geometries, precision), attribute_fingerprints(gdf.drop(columns=gdf.geometry.name))
+
+# Différences entre deux versions d'une couche AAC, appariées par la colonne key (identifiant unique
+# dans les deux versions) ou, à défaut, par empreinte de géométrie. Renvoie les paires
+# (indice ancien, indice nouveau) des zones modifiées, les indices anciens supprimés et nouveaux ajoutés.
+# Les entités anciennes sans géométrie (zones déjà supprimées) ne sont pas signalées comme supprimées.
+# old_fingerprints: empreintes de old déjà calculées (voir feature_fingerprints), pour ne pas le rehacher.
+def diff_features(old, new, key=None, old_fingerprints=None):
+    modified, deleted, added, _ = _diff_features(old, new, key, old_fingerprints)
+    return modified, deleted, added
+
+def _diff_features(old, new, key, old_fingerprints):
+    precision = fingerprint_precision(old, new)
+    if old_fingerprints is None:
+        old_fingerprints = feature_fingerprints(old, precision)
+    new_fingerprints = feature_fingerprints(new, precision, old.crs)
+    old_hashes, old_attribute_hashes = old_fingerprints
+    new_hashes, new_attribute_hashes = new_fingerprints
+
+    if key is None:
+        key = guess_column(old.columns.drop(old.geometry.name), KEY_COLUMNS)
+        if key is not None and not (old[key].is_unique and key in new and new[key].is_unique):
+            key = None
+    if key is not None:
+        old_keys = old[key].reset_index(drop=True)
+        new_keys = new[key].reset_index(drop=True)
+    else:
+        # Sans identifiant, une zone est reconnue à sa géométrie (et à son rang parmi les doublons):
+        # une géométrie modifiée apparaît comme une suppression suivie d'un ajout
+        old_keys = _occurrence_keys(old_hashes)
+        new_keys = _occurrence_keys(new_hashes)
+
+    positions = pd.Index(new_keys).get_indexer(old_keys)
+    matched = np.flatnonzero(positions >= 0)
+    matched_new = positions[matched]
+    deleted = np.flatnonzero((positions < 0) & ~old.geometry.isna().to_numpy())
+    added = np.setdiff1d(np.arange(len(new)), matched_new)
+
+    changed = old_hashes[matched] != new_hashes[matched_new]
+    changed |= old_attribute_hashes[matched] != new_attribute_hashes[matched_new]
+    modified = np.column_stack([matched[changed], matched_new[changed]])
+    return modified, deleted, added, new_fingerprints
+
+# Empreinte suivie du rang de l'entité parmi celles de même empreinte
+def _occurrence_keys(hashes):
+    hashes = pd.Series(hashes)
+    return hashes.astype(str) + "#" + hashes.groupby(hashes).cumcount().astype(str)
+
+# Nouveau jeu de données reflétant la nouvelle version new_gdf de la couche, sans modifier dataset
+# (partagé par les sessions): les géométries préparées, les lignes d'attributs et les entités
+# d'affichage inchangées sont réutilisées. Les zones supprimées gardent leur indice avec une
+# géométrie vide, pour ne pas décaler les autres.
+# Lève ValueError si les colonnes diffèrent ou si plus de max_changes des zones changent
+# (un rechargement complet est alors préférable). Renvoie (jeu de données, décompte des changements).
+def update_dataset(dataset, new_gdf, key=None, max_changes=0.5):
+    start = time.perf_counter()
+    old_gdf = dataset.data_source
+    if list(new_gdf.columns) != list(old_gdf.columns) or new_gdf.geometry.name != old_gdf.geometry.name:
+        raise ValueError("Les colonnes du fichier ont changé: rechargement complet nécessaire")
+    if new_gdf.crs is None:
+        new_gdf = new_gdf.set_crs(old_gdf.crs)
+
+    # Les empreintes de l'ancienne version sont calculées au premier rafraîchissement seulement, puis
+    # gardées sur le jeu de données (partagé, mais sans effet sur son contenu)
+    precision = fingerprint_precision(old_gdf, new_gdf)
+    old_fingerprints = dataset.fingerprints.get(precision)
+    if old_fingerprints is None:
+        with METRICS.timer("fingerprints", zones=len(old_gdf)):
+            old_fingerprints = feature_fingerprints(old_gdf, precision)
+        dataset.fingerprints[precision] = old_fingerprints
+    with METRICS.timer("diff", zones=len(new_gdf)):
+        modified, deleted, added, new_fingerprints = _diff_features(old_gdf, new_gdf, key, old_fingerprints)
+    n_changes = len(modified) + len(deleted) + len(added)
+    if n_changes > max_changes * max(len(old_gdf), 1):
+        raise ValueError(f"{n_changes} zones modifiées sur {len(old_gdf)}: rechargement complet nécessaire")
+
+    stats = {
+        "added": len(added), "modified": len(modified), "deleted": len(deleted),
+        "unchanged": len(new_gdf) - len(added) - len(modified),
+    }
+    updated = dataset
+    if n_changes > 0:
+        with METRICS.timer("refresh", changes=n_changes):
+            updated = _apply_changes(dataset, new_gdf, modified, deleted, added)
+            updated.fingerprints = {
+                precision: _apply_fingerprints(old_fingerprints, new_fingerprints, modified, deleted, added)
+            }
+    stats["seconds"] = time.perf_counter() - start
+    return updated, stats
+
+# Empreintes de la version mise à jour: celles des zones modifiées et ajoutées viennent de la nouvelle
+# version, les zones supprimées prennent celle d'une géométrie vide
+def _apply_fingerprints(old_fingerprints, new_fingerprints, modified, deleted, added):
+    fingerprints = []
+    for old_hashes, new_hashes in zip(old_fingerprints, new_fingerprints):
+        hashes = np.concatenate([old_hashes, new_hashes[added]])
+        hashes[modified[:, 0]] = new_hashes[modified[:, 1]]
+        fingerprints.append(hashes)
+    fingerprints[0][deleted] = geometry_fingerprints([None])[0]
+    return tuple(fingerprints)
+
+def _apply_changes(dataset, new_gdf, modified, deleted, added):
+    old_gdf = dataset.data_source.reset_index(drop=True)
+    n_zones = len(old_gdf)
+    if new_gdf.crs != old_gdf.crs:
+        new_gdf = new_gdf.iloc[np.concatenate([modified[:, 1], added])].to_crs(old_gdf.crs)
+        modified = np.column_stack([modified[:, 0], np.arange(len(modified))])
+        added = np.arange(len(modified), len(modified) + len(added))
+
+    # Zones remplacées, zones supprimées (attributs conservés, géométrie vide) et zones ajoutées
+    # à la suite des zones existantes, indexées par leur indice de zone
+    tombstones = old_gdf.iloc[deleted].copy()
+    tombstones[old_gdf.geometry.name] = gpd.GeoSeries([None] * len(deleted), index=tombstones.index, crs=old_gdf.crs)
+    source = pd.concat([
+        new_gdf.iloc[modified[:, 1]].set_axis(modified[:, 0]),
+        tombstones,
+        new_gdf.iloc[added].set_axis(np.arange(n_zones, n_zones + len(added))),
+    ]).sort_index()
+    indices = source.index.to_numpy()
+
+    # Géométries de l'index dans son propre CRS: seules les zones touchées sont reprojetées
+    geometries = source.geometry
+    if geometries.crs != dataset.aac_index.crs:
+        geometries = geometries.to_crs(dataset.aac_index.crs)
+    attributes = source.drop(columns=source.geometry.name)
+    aac_index = dataset.aac_index.with_zones(indices, geometries.to_numpy(), attributes)
+
+    data_source = replace_rows(old_gdf, source)
+    geometry_name = data_source.geometry.name
+    aac_index.get_properties = lambda i: data_source.iloc[i].drop(geometry_name).to_dict()
+
+    # Taille mise à jour à partir des seules lignes remplacées ou ajoutées; celle des artefacts,
+    # repris puis mis à jour par copie, reste comptée
+    replaced = indices[indices < n_zones]
+    nbytes = dataset.nbytes + estimate_rows_size(aac_index.geometries[indices], attributes)
+    nbytes -= estimate_rows_size(
+        dataset.aac_index.geometries[replaced], old_gdf.iloc[replaced].drop(columns=old_gdf.geometry.name)
+    )
+    updated = CachedDataset(data_source, dataset.file_type, aac_index, list(dataset.messages), nbytes)
+    updated.artifacts = dict(dataset.artifacts)
+    update_display_artifacts(updated, indices)
+    return updated
+
+# Rafraîchir dataset avec une nouvelle version du fichier (même format, même filtre régional
+# et mêmes colonnes qu'au chargement). dataset n'est pas modifié.
+# Renvoie (jeu de données mis à jour, décompte des changements).
+def refresh_aac_dataset(dataset, file_bytes, file_name, selected_region=None, columns=None, key=None):
+    file_extension = file_name.split('.')[-1].lower()
+    if file_extension == COMPILED_EXTENSION or dataset.file_type == COMPILED_EXTENSION:
+        raise ValueError("Un index compilé ne peut pas être rafraîchi: rechargement complet nécessaire")
+    messages = []
+    METRICS.record_size("aac_file", len(file_bytes))
+    new_gdf, file_type = read_aac_source(file_bytes, file_extension, selected_region, columns, messages)
+    if file_type != dataset.file_type:
+        raise ValueError("Le format du fichier a changé: rechargement complet nécessaire")
+
+    updated, stats = update_dataset(dataset, new_gdf, key)
+    if updated is dataset:
+        # Aucun changement: même contenu, seuls les messages diffèrent
+        updated = copy.copy(dataset)
+        updated.artifacts = dict(dataset.artifacts)
+    messages.append(("success", (
+        f"Données mises à jour en {stats['seconds']:.2f} s: {stats['added']} zones ajoutées, "
+        f"{stats['modified']} modifiées, {stats['deleted']} supprimées"
+    )))
+    updated.messages = messages
+    return updated, stats
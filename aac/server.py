@@ -0,0 +1,205 @@
+# Service HTTP de recherche des zones AAC pour les autres outils. Le jeu de données et l'index sont
+# chargés une seule fois, puis partagés en copie sur écriture par des processus préforkés qui
+# écoutent le même port:
+#   GET  /check?lat=43.6&lon=3.88&margin=50   -> {"in_aac": true, "aac_id": 12, "properties": {...}}
+#   POST /check  {"points": [[43.6, 3.88], ...], "margin": 50}
+#                (ou {"lats": [...], "lons": [...]})  -> {"results": [{"in_aac": ..., "distance_m": ...}, ...]}
+#   GET  /health                                -> {"status": "ok", "zones": ..., "pid": ...}
+#   GET  /metrics                               -> mesures du processus qui répond (format Prometheus)
+# Chaque processus préforké garde ses propres mesures: /metrics ne décrit que celui qui a répondu,
+# identifié par l'étiquette pid. Les totaux du service s'obtiennent en sommant les séries sur pid.
+import gc
+import json
+import logging
+import math
+import os
+import signal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from .metrics import METRICS
+
+logger = logging.getLogger("aac.server")
+
+# Nombre maximal de points par requête de lot
+MAX_BATCH_POINTS = 100000
+NOT_IN_AAC = '{"in_aac":false,"aac_id":null,"properties":null}'
+NOT_IN_AAC_BATCH = '{"in_aac":false,"aac_id":null,"distance_m":null,"properties":null}'
+
+# Propriétés de chaque zone sérialisées une fois pour toutes en JSON (null pour les valeurs manquantes)
+def serialize_properties(dataset):
+    gdf = dataset.data_source
+    attributes = gdf.drop(columns=gdf.geometry.name)
+    attributes = attributes.astype(object).where(attributes.notna(), None)
+    return [json.dumps(record, ensure_ascii=False, default=str) for record in attributes.to_dict("records")]
+
+# Marge de proximité (mètres) d'une requête, ou None pour la tolérance de l'index
+def parse_margin(value):
+    if value is None:
+        return None
+    margin = float(value)
+    if not math.isfinite(margin) or margin < 0:
+        raise ValueError("La marge doit être un nombre positif")
+    return margin
+
+# Coordonnées d'une requête de lot: {"points": [[lat, lon], ...]} ou {"lats": [...], "lons": [...]}
+def parse_points(payload):
+    if "points" in payload:
+        points = np.asarray(payload["points"], dtype=float).reshape(-1, 2)
+        lats, lons = points[:, 0], points[:, 1]
+    else:
+        lats = np.asarray(payload["lats"], dtype=float).ravel()
+        lons = np.asarray(payload["lons"], dtype=float).ravel()
+        if len(lats) != len(lons):
+            raise ValueError("lats et lons doivent avoir la même longueur")
+    if len(lats) > MAX_BATCH_POINTS:
+        raise ValueError(f"Au plus {MAX_BATCH_POINTS} points par requête")
+    return lats, lons
+
+# Réponse d'une requête de lot, assemblée à partir des propriétés déjà sérialisées
+def batch_response(matches, distances, properties):
+    results = [
+        f'{{"in_aac":true,"aac_id":{zone},"distance_m":{round(distance, 2)},"properties":{properties[zone]}}}'
+        if zone >= 0 else NOT_IN_AAC_BATCH
+        for zone, distance in zip(matches.tolist(), distances.tolist())
+    ]
+    return '{"results":[' + ",".join(results) + "]}"
+
+def make_handler(aac_index, properties, margin_m=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Réponses courtes sur des connexions persistantes: pas d'attente de l'algorithme de Nagle
+        disable_nagle_algorithm = True
+
+        def send_body(self, status, body, content_type="application/json; charset=utf-8"):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_json(self, status, message):
+            self.send_body(status, json.dumps({"error": message}, ensure_ascii=False))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            path = url.path.rstrip("/")
+            if path == "/check":
+                with METRICS.timer("http_check"):
+                    query = parse_qs(url.query)
+                    try:
+                        lat = float(query["lat"][0])
+                        lon = float(query["lon"][0])
+                        margin = parse_margin(query.get("margin", [margin_m])[0])
+                    except (KeyError, ValueError) as e:
+                        return self.send_error_json(400, f"Paramètres lat et lon numériques attendus ({e})")
+                    x, y = aac_index.project(lat, lon)
+                    zone_id = aac_index.lookup(x, y, margin) if math.isfinite(x) and math.isfinite(y) else None
+                    if zone_id is None:
+                        return self.send_body(200, NOT_IN_AAC)
+                    self.send_body(200, f'{{"in_aac":true,"aac_id":{zone_id},"properties":{properties[zone_id]}}}')
+            elif path == "/health":
+                self.send_body(200, json.dumps({"status": "ok", "zones": len(aac_index), "pid": os.getpid()}))
+            elif path == "/metrics":
+                self.send_body(200, METRICS.to_prometheus({"pid": os.getpid()}), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self.send_error_json(404, "Ressource inconnue")
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") != "/check":
+                return self.send_error_json(404, "Ressource inconnue")
+            with METRICS.timer("http_batch"):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    payload = json.loads(body)
+                    lats, lons = parse_points(payload)
+                    margin = parse_margin(payload.get("margin", margin_m))
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    return self.send_error_json(400, f"Corps JSON invalide ({e})")
+                matches = np.full(len(lats), -1, dtype=np.int64)
+                distances = np.full(len(lats), np.nan)
+                valid = np.isfinite(lats) & np.isfinite(lons)
+                if valid.any():
+                    matches[valid], distances[valid] = aac_index.locate_many(lats[valid], lons[valid], margin)
+                self.send_body(200, batch_response(matches, distances, properties))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+class LookupServer(ThreadingHTTPServer):
+    # Les connexions persistantes des clients ne doivent pas empêcher l'arrêt d'un processus
+    daemon_threads = True
+    request_queue_size = 128
+
+# Créer le serveur sur un jeu de données chargé (port 0: port libre choisi par le système)
+def make_server(dataset, host="127.0.0.1", port=0, margin_m=None):
+    handler = make_handler(dataset.aac_index, serialize_properties(dataset), margin_m)
+    return LookupServer((host, port), handler)
+
+# Servir les requêtes avec workers processus préforkés partageant le socket d'écoute.
+# Tout ce qui est chargé avant le fork (index, propriétés sérialisées) est partagé en copie sur
+# écriture; le ramasse-miettes est gelé pour ne pas réécrire ces pages en parcourant les objets.
+# Un processus qui s'arrête est remplacé. Sans fork (Windows), le serveur tourne dans ce processus.
+def serve_forever(server, workers=1):
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+        return
+
+    gc.collect()
+    gc.freeze()
+    children = set()
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logger.exception("Arrêt du processus %d sur erreur", os.getpid())
+                status = 1
+            finally:
+                os._exit(status)
+        children.add(pid)
+
+    # SIGTERM arrête le processus principal comme Ctrl-C, qui arrête alors ses processus
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGTERM, stop)
+    try:
+        for _ in range(workers):
+            start_worker()
+        while True:
+            pid, _ = os.wait()
+            if pid in children:
+                children.discard(pid)
+                logger.warning("Processus %d arrêté, remplacement", pid)
+                start_worker()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.server_close()
+        gc.unfreeze()
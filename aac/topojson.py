@@ -0,0 +1,231 @@
+# Encodage TopoJSON des couches d'affichage: coordonnées quantifiées et codées en différences,
+# frontières communes à plusieurs zones stockées une seule fois (arcs partagés)
+import numpy as np
+import shapely
+
+# Premier indice de chaque groupe où mask est vrai: (groupes concernés, positions)
+def _first_per_group(mask, groups):
+    candidates = np.flatnonzero(mask)
+    found, first = np.unique(groups[candidates], return_index=True)
+    return found, candidates[first]
+
+# Découper les anneaux en arcs aux jonctions et dédupliquer les arcs (y compris parcourus à l'envers).
+# rings_q: sommets quantifiés (n, 2) de tous les anneaux fermés mis bout à bout, starts/ends: bornes des anneaux.
+# Renvoie les sommets des arcs mis bout à bout, le nombre de sommets de chaque arc et,
+# par anneau, la liste de ses références d'arcs (~i pour l'arc i parcouru à l'envers).
+def _cut_arcs(rings_q, starts, ends):
+    # Anneaux ouverts (sans le sommet de fermeture) pour la recherche des jonctions
+    lengths = ends - starts - 1
+    n_rings = len(lengths)
+    ring_ids = np.repeat(np.arange(n_rings), lengths)
+    open_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    positions = np.arange(lengths.sum())
+    vertices = rings_q[np.repeat(starts - open_starts, lengths) + positions]
+    # Clé entière unique par sommet (les coordonnées quantifiées peuvent être négatives)
+    low_x, low_y = rings_q.min(axis=0)
+    keys = (vertices[:, 0] - low_x) * (int(rings_q[:, 1].max() - low_y) + 1) + (vertices[:, 1] - low_y)
+
+    # Un sommet est une jonction si ses voisins diffèrent d'une occurrence à l'autre
+    local = positions - open_starts[ring_ids]
+    previous = np.where(local == 0, positions + lengths[ring_ids] - 1, positions - 1)
+    following = np.where(local == lengths[ring_ids] - 1, open_starts[ring_ids], positions + 1)
+    low = np.minimum(keys[previous], keys[following])
+    high = np.maximum(keys[previous], keys[following])
+    order = np.lexsort((high, low, keys))
+    keys_sorted, low_sorted, high_sorted = keys[order], low[order], high[order]
+    differs = (keys_sorted[1:] == keys_sorted[:-1]) & (
+        (low_sorted[1:] != low_sorted[:-1]) | (high_sorted[1:] != high_sorted[:-1])
+    )
+    is_junction = np.isin(keys, np.unique(keys_sorted[1:][differs]))
+
+    # Chaque anneau commence à sa première jonction, ou à défaut à son plus petit sommet pour
+    # reconnaître un anneau identique quel que soit son point de départ
+    ring_min = np.minimum.reduceat(keys, open_starts)
+    _, offsets = _first_per_group(keys == ring_min[ring_ids], ring_ids)
+    with_junction, first_junction = _first_per_group(is_junction, ring_ids)
+    offsets[with_junction] = first_junction
+    offsets -= open_starts
+
+    # Anneaux tournés et refermés, mis bout à bout (longueur + 1 sommets chacun)
+    closed_lengths = lengths + 1
+    closed_ring = np.repeat(np.arange(n_rings), closed_lengths)
+    closed_starts = np.concatenate([[0], np.cumsum(closed_lengths)[:-1]])
+    step = np.arange(closed_lengths.sum()) - closed_starts[closed_ring]
+    source = open_starts[closed_ring] + (offsets[closed_ring] + step) % lengths[closed_ring]
+    closed = np.ascontiguousarray(vertices[source])
+
+    # Arcs entre deux coupures successives d'un même anneau (jonctions, début et fin de l'anneau)
+    cuts = np.flatnonzero(is_junction[source] | (step == 0) | (step == lengths[closed_ring]))
+    same_ring = closed_ring[cuts[1:]] == closed_ring[cuts[:-1]]
+    arc_starts, arc_ends = cuts[:-1][same_ring], cuts[1:][same_ring]
+
+    # Déduplication sur les octets des sommets, dans les deux sens de parcours
+    point_size = closed.itemsize * 2
+    forward = closed.tobytes()
+    backward = closed[::-1].tobytes()
+    total = len(closed)
+    arc_ids = {}
+    unique_arcs = []
+    ring_refs = [[] for _ in range(n_rings)]
+    for ring, start, end in zip(closed_ring[arc_starts].tolist(), arc_starts.tolist(), arc_ends.tolist()):
+        key = forward[start * point_size:(end + 1) * point_size]
+        ref = arc_ids.get(key)
+        if ref is None:
+            reversed_id = arc_ids.get(backward[(total - 1 - end) * point_size:(total - start) * point_size])
+            if reversed_id is not None:
+                ref = ~reversed_id
+            else:
+                ref = arc_ids[key] = len(unique_arcs)
+                unique_arcs.append((start, end))
+        ring_refs[ring].append(ref)
+
+    bounds = np.array(unique_arcs, dtype=np.int64).reshape(-1, 2)
+    sizes = bounds[:, 1] - bounds[:, 0] + 1
+    gather = np.repeat(bounds[:, 0] - np.concatenate([[0], np.cumsum(sizes)[:-1]]), sizes) + np.arange(sizes.sum())
+    return closed[gather], sizes, ring_refs
+
+# Simplifier chaque arc une seule fois (Douglas-Peucker, extrémités conservées): les frontières
+# partagées restent identiques pour les deux zones. Renvoie les arcs codés en différences.
+def _encode_arcs(coords, sizes, tolerance):
+    if len(sizes) == 0:
+        return []
+    if tolerance > 0:
+        lines = shapely.linestrings(coords.astype(float), indices=np.repeat(np.arange(len(sizes)), sizes))
+        simplified = shapely.simplify(lines, tolerance, preserve_topology=False)
+        # Un anneau fermé réduit à moins de quatre sommets est resimplifié sans dégénérer
+        collapsed = np.flatnonzero(shapely.is_closed(lines) & (shapely.get_num_points(simplified) < 4))
+        simplified[collapsed] = shapely.simplify(lines[collapsed], tolerance, preserve_topology=True)
+        coords, arc_of_coord = shapely.get_coordinates(simplified, return_index=True)
+        coords = np.round(coords).astype(np.int64)
+        sizes = np.bincount(arc_of_coord, minlength=len(sizes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    deltas = coords.copy()
+    deltas[1:] -= coords[:-1]
+    deltas[starts] = coords[starts]
+    flat = deltas.tolist()
+    return [flat[start:start + size] for start, size in zip(starts, sizes)]
+
+# Topologie TopoJSON quantifiée d'un tableau de géométries (Polygon, MultiPolygon) en WGS84.
+# step: pas de quantification (degrés), tolerance: simplification (degrés) appliquée aux arcs.
+# Les objets sont rangés dans l'ordre des géométries (type None pour une géométrie vide),
+# avec les propriétés éventuelles (une liste de dicts alignée sur les géométries).
+# translate impose l'origine de la quantification (pour compléter une topologie existante).
+def build_topology(geometries, step, tolerance=0.0, properties=None, object_name="aac", translate=None):
+    geometries = np.asarray(geometries, dtype=object)
+    polygons, polygon_geometry = shapely.get_parts(geometries, return_index=True)
+    keep = shapely.get_type_id(polygons) == 3
+    polygons, polygon_geometry = polygons[keep], polygon_geometry[keep]
+    rings, ring_polygon = shapely.get_rings(polygons, return_index=True)
+    coords, ring_of_coord = shapely.get_coordinates(rings, return_index=True)
+    # L'anneau extérieur est le premier de chaque polygone
+    exterior = np.r_[True, ring_polygon[1:] != ring_polygon[:-1]] if len(rings) else np.zeros(0, dtype=bool)
+
+    if translate is None:
+        translate = coords.min(axis=0) if len(coords) else np.zeros(2)
+    translate = np.asarray(translate, dtype=float)
+    quantized = np.round((coords - translate) / step).astype(np.int64)
+    # Sommets confondus après quantification
+    distinct = np.ones(len(quantized), dtype=bool)
+    distinct[1:] = (quantized[1:] != quantized[:-1]).any(axis=1) | (ring_of_coord[1:] != ring_of_coord[:-1])
+    quantized, ring_of_coord = quantized[distinct], ring_of_coord[distinct]
+
+    # Les anneaux réduits à moins de trois sommets distincts disparaissent, avec leur polygone s'il s'agit de l'extérieur
+    counts = np.bincount(ring_of_coord, minlength=len(rings))
+    valid_ring = counts >= 4
+    valid_polygon = np.ones(len(polygons), dtype=bool)
+    valid_polygon[ring_polygon[exterior & ~valid_ring]] = False
+    valid_ring &= valid_polygon[ring_polygon]
+
+    kept = np.flatnonzero(valid_ring)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    if len(kept) > 0:
+        arc_coords, arc_sizes, ring_refs = _cut_arcs(quantized, starts[kept], ends[kept])
+    else:
+        arc_coords, arc_sizes, ring_refs = np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64), []
+
+    # Regrouper les anneaux par polygone, puis les polygones par géométrie
+    polygon_rings = {}
+    for ring, refs in zip(kept, ring_refs):
+        polygon_rings.setdefault(ring_polygon[ring], []).append(refs)
+    geometry_polygons = [[] for _ in range(len(geometries))]
+    for polygon, ring_list in polygon_rings.items():
+        geometry_polygons[polygon_geometry[polygon]].append(ring_list)
+
+    objects = []
+    for i, parts in enumerate(geometry_polygons):
+        if not parts:
+            item = {"type": None}
+        elif len(parts) == 1:
+            item = {"type": "Polygon", "arcs": parts[0]}
+        else:
+            item = {"type": "MultiPolygon", "arcs": parts}
+        if properties is not None:
+            item["properties"] = properties[i]
+        objects.append(item)
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [step, step], "translate": [float(translate[0]), float(translate[1])]},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": objects}},
+        "arcs": _encode_arcs(arc_coords, arc_sizes, tolerance / step),
+    }
+
+# Nouvelle topologie où les objets d'indices donnés sont remplacés (ou ajoutés à la suite) par ceux de
+# la topologie partielle patch, construite avec la même quantification. topology n'est pas modifiée:
+# ses arcs et objets inchangés sont partagés. Les arcs de patch sont ajoutés à la fin; les arcs devenus
+# inutiles restent en place mais ne sont plus référencés (subset_topology ne les transmet pas).
+def patch_topology(topology, indices, patch, object_name="aac"):
+    offset = len(topology["arcs"])
+    collection = topology["objects"][object_name]
+    objects = list(collection["geometries"])
+
+    def shift(ref):
+        return ref + offset if ref >= 0 else ~(~ref + offset)
+
+    for i, item in zip(indices, patch["objects"][object_name]["geometries"]):
+        if item["type"] == "Polygon":
+            item = {**item, "arcs": [[shift(ref) for ref in ring] for ring in item["arcs"]]}
+        elif item["type"] == "MultiPolygon":
+            item = {**item, "arcs": [[[shift(ref) for ref in ring] for ring in polygon] for polygon in item["arcs"]]}
+        if i < len(objects):
+            objects[i] = item
+        else:
+            objects.append(item)
+    return {
+        **topology,
+        "objects": {**topology["objects"], object_name: {**collection, "geometries": objects}},
+        "arcs": topology["arcs"] + patch["arcs"],
+    }
+
+# Topologie réduite aux objets d'indices donnés (géométries vides exclues), avec ses seuls arcs
+def subset_topology(topology, indices, object_name="aac"):
+    objects = topology["objects"][object_name]["geometries"]
+    arcs = topology["arcs"]
+    new_ids = {}
+    new_arcs = []
+
+    def remap(ref):
+        old = ref if ref >= 0 else ~ref
+        if old not in new_ids:
+            new_ids[old] = len(new_arcs)
+            new_arcs.append(arcs[old])
+        return new_ids[old] if ref >= 0 else ~new_ids[old]
+
+    selected = []
+    for i in indices:
+        item = objects[i]
+        if item["type"] == "Polygon":
+            parts = [[remap(ref) for ref in ring] for ring in item["arcs"]]
+        elif item["type"] == "MultiPolygon":
+            parts = [[[remap(ref) for ref in ring] for ring in polygon] for polygon in item["arcs"]]
+        else:
+            continue
+        selected.append({**item, "arcs": parts})
+
+    return {
+        "type": "Topology",
+        "transform": topology["transform"],
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": selected}},
+        "arcs": new_arcs,
+    }
@@ -0,0 +1,159 @@
+import argparse
+import csv
+import difflib
+import email
+import email.policy
+import io
+import json
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Serveur local imitant l'API adresse.data.gouv.fr (/search/ et /search/csv/),
+# pour tester le géocodage hors ligne:
+#   python serveur_adresse_local.py --adresses adresses.csv --port 7878
+#   API_ADRESSE_URL=http://127.0.0.1:7878 streamlit run Zonage_AAC.py
+# Le fichier d'adresses contient les colonnes label, lat, lon (séparateur , ou ;).
+
+# Quelques adresses connues utilisées si aucun fichier n'est fourni
+DEFAULT_ADDRESSES = [
+    ("1 Place de la Mairie 34000 Montpellier", 43.608, 3.879),
+    ("Place du Capitole 31000 Toulouse", 43.6045, 1.4440),
+    ("20 Avenue de Ségur 75007 Paris", 48.8507, 2.3085),
+]
+
+# Mise en forme simplifiée d'une adresse pour la comparaison
+def simplify(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().replace(",", " ").split())
+
+# Référentiel d'adresses en mémoire avec recherche approchée
+class AddressBook:
+    def __init__(self, addresses, min_score=0.6):
+        self.entries = {simplify(label): (label, lat, lon) for label, lat, lon in addresses}
+        self.min_score = min_score
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            reader = csv.DictReader(f, delimiter=";" if sample.count(";") > sample.count(",") else ",")
+            return cls([(row["label"], float(row["lat"]), float(row["lon"])) for row in reader])
+
+    # Renvoie (label, lat, lon, score) ou None
+    def search(self, query):
+        key = simplify(query)
+        if not key:
+            return None
+        if key in self.entries:
+            return (*self.entries[key], 1.0)
+        candidates = difflib.get_close_matches(key, self.entries.keys(), n=1, cutoff=self.min_score)
+        if not candidates:
+            return None
+        score = difflib.SequenceMatcher(None, key, candidates[0]).ratio()
+        return (*self.entries[candidates[0]], round(score, 4))
+
+# Réponse GeoJSON au format de /search/
+def search_response(address_book, query):
+    result = address_book.search(query)
+    features = []
+    if result:
+        label, lat, lon, score = result
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"label": label, "score": score, "type": "housenumber"}
+        })
+    return {"type": "FeatureCollection", "query": query, "features": features}
+
+# Extraire les champs d'un formulaire multipart/form-data
+def parse_multipart(content_type, body):
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body,
+        policy=email.policy.HTTP
+    )
+    fields = []
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields.append((name, part.get_payload(decode=True)))
+    return fields
+
+# Réponse CSV au format de /search/csv/: colonnes d'origine suivies des résultats
+def csv_response(address_book, data, columns, result_columns):
+    text = data.decode("utf-8-sig")
+    first_line = text.split("\n", 1)[0]
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+
+    all_result_columns = ["latitude", "longitude", "result_label", "result_score", "result_type", "result_status"]
+    result_columns = [col for col in all_result_columns if not result_columns or col in result_columns]
+
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=delimiter)
+    writer.writerow(list(reader.fieldnames or []) + result_columns)
+    for row in reader:
+        query = " ".join(row.get(col) or "" for col in (columns or reader.fieldnames))
+        result = address_book.search(query)
+        if result:
+            label, lat, lon, score = result
+            values = {"latitude": lat, "longitude": lon, "result_label": label,
+                      "result_score": score, "result_type": "housenumber", "result_status": "ok"}
+        else:
+            values = {"result_status": "not-found" if query.strip() else "skipped"}
+        writer.writerow([row.get(col) for col in reader.fieldnames] + [values.get(col, "") for col in result_columns])
+    return output.getvalue().encode("utf-8")
+
+def make_handler(address_book):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_body(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/search":
+                return self.send_body(404, b"Not found", "text/plain")
+            query = parse_qs(url.query).get("q", [""])[0]
+            body = json.dumps(search_response(address_book, query)).encode("utf-8")
+            self.send_body(200, body, "application/json; charset=utf-8")
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") != "/search/csv":
+                return self.send_body(404, b"Not found", "text/plain")
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            fields = parse_multipart(self.headers.get("Content-Type", ""), body)
+            data = next((value for name, value in fields if name == "data"), None)
+            if data is None:
+                return self.send_body(400, b"Missing data file", "text/plain")
+            columns = [value.decode() for name, value in fields if name == "columns"]
+            result_columns = [value.decode() for name, value in fields if name == "result_columns"]
+            self.send_body(200, csv_response(address_book, data, columns, result_columns), "text/csv; charset=utf-8")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+# Créer le serveur (port 0: port libre choisi par le système)
+def make_server(address_book=None, host="127.0.0.1", port=0):
+    address_book = address_book or AddressBook(DEFAULT_ADDRESSES)
+    return ThreadingHTTPServer((host, port), make_handler(address_book))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API adresse.data.gouv.fr")
+    parser.add_argument("--adresses", help="CSV des adresses connues (label, lat, lon)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7878)
+    args = parser.parse_args()
+
+    address_book = AddressBook.from_csv(args.adresses) if args.adresses else None
+    server = make_server(address_book, args.host, args.port)
+    print(f"API adresse locale sur http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
@@ -0,0 +1,72 @@
+# Jeux de données synthétiques partagés par les tests (zones disjointes en Lambert-93)
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from aac import DISPLAY_CRS, WORKING_CRS, build_aac_index, get_transformer
+
+# Emprise des zones (Lambert-93) et espacement de la grille de leurs centres (mètres)
+EXTENT = (600000, 6200000, 800000, 6300000)
+SPACING = 20000
+
+# Polygones étoilés irréguliers, un par cellule de la grille, de rayon 2 à 5 km
+def make_test_zones(n_zones=40, vertices=40, seed=3):
+    rng = np.random.default_rng(seed)
+    n_cols = int((EXTENT[2] - EXTENT[0]) // SPACING)
+    cells = rng.choice(n_cols * int((EXTENT[3] - EXTENT[1]) // SPACING), n_zones, replace=False)
+    centers_x = EXTENT[0] + (cells % n_cols + 0.5) * SPACING
+    centers_y = EXTENT[1] + (cells // n_cols + 0.5) * SPACING
+    radii = rng.uniform(2000, 5000, n_zones)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, (n_zones, vertices)), axis=1)
+    distances = radii[:, None] * rng.uniform(0.6, 1.0, (n_zones, vertices))
+    polygons = [
+        shapely.Polygon(np.column_stack([x + d * np.cos(a), y + d * np.sin(a)]))
+        for x, y, d, a in zip(centers_x, centers_y, distances, angles)
+    ]
+    return gpd.GeoDataFrame({
+        "code_aac": [f"AAC{i:06d}" for i in range(n_zones)],
+        "nom_aac": [f"Captage synthétique {i}" for i in range(n_zones)],
+        "surface_ha": np.round(np.pi * radii ** 2 * 0.64 / 10000, 1),
+    }, geometry=polygons, crs=WORKING_CRS), (centers_x, centers_y, radii)
+
+# Points WGS84 dont une part inside_fraction est tirée à l'intérieur des zones (à moins de
+# 0.5 rayon du centre, où tous les sommets sont plus loin), le reste sur toute l'emprise
+def make_test_points(zones_shape, n_points=400, inside_fraction=0.5, seed=4):
+    centers_x, centers_y, radii = zones_shape
+    rng = np.random.default_rng(seed)
+    n_inside = int(n_points * inside_fraction)
+    picked = rng.integers(0, len(radii), n_inside)
+    angles = rng.uniform(0, 2 * np.pi, n_inside)
+    distances = 0.5 * radii[picked] * np.sqrt(rng.uniform(0, 1, n_inside))
+    xs = np.concatenate([centers_x[picked] + distances * np.cos(angles),
+                         rng.uniform(EXTENT[0], EXTENT[2], n_points - n_inside)])
+    ys = np.concatenate([centers_y[picked] + distances * np.sin(angles),
+                         rng.uniform(EXTENT[1], EXTENT[3], n_points - n_inside)])
+    order = rng.permutation(n_points)
+    lons, lats = get_transformer(WORKING_CRS, DISPLAY_CRS).transform(xs[order], ys[order])
+    return np.asarray(lats), np.asarray(lons)
+
+# Les GPKG relus depuis la mémoire font avertir pyogrio à chaque lecture
+def pytest_configure(config):
+    config.addinivalue_line("filterwarnings", "ignore:.*non conformant file extension:RuntimeWarning")
+
+@pytest.fixture
+def zones():
+    return make_test_zones()[0]
+
+# Index sans tolérance de proximité: seuls les points intérieurs sont dans une zone
+@pytest.fixture
+def make_index():
+    def make(zones):
+        return build_aac_index(zones, tolerance=0)
+    return make
+
+@pytest.fixture
+def aac_index(zones, make_index):
+    return make_index(zones)
+
+# Points WGS84, pour moitié à l'intérieur des zones: (latitudes, longitudes)
+@pytest.fixture
+def points():
+    return make_test_points(make_test_zones()[1])
@@ -0,0 +1,113 @@
+# Géocodeur local BAN: découpage des requêtes, fautes de frappe, codes postaux, seuil de score,
+# recours à l'API et index enregistré sur disque
+import os
+
+import pytest
+import requests
+
+from aac import GeocodingClient, LocalGeocoder, parse_query
+
+BAN_ROWS = [
+    ("1", "", "Rue de la République", "34000", "Montpellier", 3.8790, 43.6080),
+    ("2", "", "Rue de la République", "34000", "Montpellier", 3.8792, 43.6082),
+    ("12", "bis", "Rue de la République", "34000", "Montpellier", 3.8800, 43.6090),
+    ("1", "", "Rue de la République", "30000", "Nîmes", 4.3600, 43.8350),
+    ("5", "", "Rue de la République", "30000", "Nîmes", 4.3610, 43.8360),
+    ("3", "", "Avenue Victor Hugo", "34000", "Montpellier", 3.8760, 43.6050),
+    ("7", "", "Chemin des Moulins", "34170", "Castelnau-le-Lez", 3.9000, 43.6300),
+]
+
+def write_ban(path, rows=BAN_ROWS):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("id;numero;rep;nom_voie;code_postal;nom_commune;lon;lat\n")
+        for i, (numero, rep, voie, code_postal, commune, lon, lat) in enumerate(rows):
+            f.write(f"{i};{numero};{rep};{voie};{code_postal};{commune};{lon};{lat}\n")
+    return str(path)
+
+@pytest.fixture
+def ban_path(tmp_path):
+    return write_ban(tmp_path / "adresses-34.csv")
+
+@pytest.fixture
+def geocoder(ban_path):
+    return LocalGeocoder.from_csv(ban_path)
+
+def test_parse_query():
+    assert parse_query("12 bis Rue de la République 34 000 Montpellier") == (
+        "12bis", "34000", ["rue", "de", "la", "republique", "montpellier"]
+    )
+    assert parse_query("007 Av. Victor-Hugo") == ("7", None, ["avenue", "victor", "hugo"])
+    assert parse_query("4ter bd Foch 75016") == ("4ter", "75016", ["boulevard", "foch"])
+    assert parse_query("") == (None, None, [])
+
+def test_housenumber_and_street(geocoder):
+    result = geocoder.search("12 bis rue de la République 34000 Montpellier")
+    assert result["type"] == "housenumber" and result["label"] == "12 bis Rue de la République 34000 Montpellier"
+    assert (result["lat"], result["lon"]) == (43.6090, 3.8800)
+    assert result["score"] > 0.9
+
+    # Numéro inconnu: position moyenne de la voie
+    result = geocoder.search("99 avenue Victor Hugo Montpellier")
+    assert result["type"] == "street" and result["label"] == "Avenue Victor Hugo 34000 Montpellier"
+
+def test_typo_correction(geocoder):
+    result = geocoder.search("3 avenue Victor Hgo 34000 Montpelier")
+    assert result is not None and result["label"] == "3 Avenue Victor Hugo 34000 Montpellier"
+
+def test_postcode_scoping(geocoder):
+    assert geocoder.search("1 rue de la République 30000")["label"].endswith("30000 Nîmes")
+    assert geocoder.search("1 rue de la République 34000")["label"].endswith("34000 Montpellier")
+    # Code postal sans voie correspondante: recherche dans toutes les voies
+    assert geocoder.search("7 chemin des Moulins 13000")["label"] == "7 Chemin des Moulins 34170 Castelnau-le-Lez"
+
+def test_min_score(ban_path, geocoder):
+    assert geocoder.search("zzzz qqqq") is None
+    assert geocoder.search("") is None
+    query = "chemin moulins"
+    assert geocoder.search(query) is not None
+    assert LocalGeocoder.from_csv(ban_path, min_score=0.99).search(query) is None
+
+# Les adresses résolues localement ne partent pas vers l'API; les autres y sont envoyées, et le
+# résultat local reste la réponse si l'API est injoignable
+def test_local_then_remote(geocoder, monkeypatch):
+    client = GeocodingClient(local=geocoder, local_min_score=0.8, rate_limit=1000)
+    remote_calls = []
+    remote_result = {'lat': 1.0, 'lon': 2.0, 'label': "API", 'score': 0.95}
+
+    def search_remote(address):
+        remote_calls.append(address)
+        return remote_result
+
+    monkeypatch.setattr(client, "_search_remote", search_remote)
+    assert client.search("2 rue de la République 34000 Montpellier")["type"] == "housenumber"
+    assert remote_calls == []
+
+    fuzzy = "chemin moulins"
+    assert client.search(fuzzy) == remote_result
+    assert remote_calls == [fuzzy]
+
+    def unreachable(address):
+        raise requests.ConnectionError("API injoignable")
+
+    monkeypatch.setattr(client, "_search_remote", unreachable)
+    assert client.search(fuzzy) == geocoder.search(fuzzy)
+    assert list(client.geocode_bulk(["1 rue de la République 30000 Nîmes"]))[0]["label"].endswith("Nîmes")
+
+    client.remote = False
+    assert client.search(fuzzy) == geocoder.search(fuzzy)
+
+# L'index construit est relu depuis cache_dir, puis reconstruit quand l'extrait change
+def test_persisted_index(ban_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    built = LocalGeocoder.from_csv(ban_path, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    loaded = LocalGeocoder.from_csv(ban_path, cache_dir=cache_dir, min_score=0.9)
+    assert loaded.min_score == 0.9 and len(loaded) == len(built)
+    query = "1 rue de la République 30000 Nîmes"
+    assert loaded.search(query) == built.search(query)
+
+    write_ban(ban_path, BAN_ROWS[:3])
+    os.utime(ban_path, (0, 0))
+    assert len(LocalGeocoder.from_csv(ban_path, cache_dir=cache_dir)) == 3
+    assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,84 @@
+# Classement par lot: noms de colonnes, coordonnées invalides ou à virgule décimale, écriture Parquet
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from aac import classify_batch, classify_chunk, classify_points
+
+# Un attribut id ou distance_m ne doit pas entrer en collision avec les colonnes calculées
+def test_attributes_do_not_collide_with_results(zones, points, make_index):
+    zones = zones.assign(id=np.arange(len(zones)) + 1000, distance_m=1.5)
+    aac_index = make_index(zones)
+    lats, lons = points
+
+    result = classify_points(lats, lons, aac_index)
+    assert result.columns.is_unique
+    inside = result["in_aac"].to_numpy(dtype=bool)
+    assert inside.any()
+    assert (result.loc[inside, "aac_attr_id"] == result.loc[inside, "aac_id"] + 1000).all()
+    assert (result.loc[inside, "aac_distance_m"] == 0).all()
+
+# Reclasser un fichier déjà classé: les colonnes d'entrée homonymes sont suffixées
+def test_reclassify_classified_chunk(aac_index, points):
+    lats, lons = points
+    chunk = pd.DataFrame({"lat": lats, "lon": lons})
+    first = classify_chunk(chunk, aac_index, "lat", "lon")
+    second = classify_chunk(first, aac_index, "lat", "lon")
+
+    assert second.columns.is_unique
+    assert (second["in_aac"] == second["in_aac_entree"]).all()
+    assert (second["aac_id"].fillna(-1) == second["aac_id_entree"].fillna(-1)).all()
+
+# Virgule décimale des CSV français, et coordonnées invalides signalées par in_aac NA
+def test_decimal_comma_and_invalid_coordinates(aac_index, points):
+    lats, lons = points
+    expected = classify_points(lats, lons, aac_index)["in_aac"]
+    lines = ["lat;lon"] + [f"{lat};{lon}".replace(".", ",") for lat, lon in zip(lats, lons)] + ["abc;2,5", ";"]
+    output = io.BytesIO()
+
+    stats = classify_batch("\n".join(lines).encode("utf-8"), aac_index, output, file_name="points.csv",
+                           lat_col="lat", lon_col="lon")
+    result = pd.read_csv(io.BytesIO(output.getvalue()), sep=",", dtype=str)
+    assert (result["in_aac"].iloc[:len(lats)] == expected.astype(str).to_numpy()).all()
+    assert result["in_aac"].iloc[len(lats):].isna().all()
+    assert stats == {"rows": len(lats) + 2, "in_aac": int(expected.sum()), "invalid": 2}
+
+# Une colonne vide dans le premier morceau et renseignée ensuite ne doit pas casser l'écriture Parquet
+def test_parquet_sparse_column(aac_index, points):
+    lats, lons = points
+    notes = [""] * 200 + ["remarque"] * (len(lats) - 200)
+    csv_text = "lat,lon,note\n" + "\n".join(f"{lat},{lon},{note}" for lat, lon, note in zip(lats, lons, notes))
+    output = io.BytesIO()
+
+    stats = classify_batch(csv_text.encode("utf-8"), aac_index, output, file_name="points.csv",
+                           lat_col="lat", lon_col="lon", output_format="parquet", chunk_size=100)
+    table = pq.read_table(io.BytesIO(output.getvalue()))
+    assert table.num_rows == stats["rows"] == len(lats)
+    assert table.column("note").to_pylist()[-1] == "remarque"
+
+# Géocodeur minimal: aucune adresse trouvée dans le premier morceau, toutes dans les suivants
+class FakeGeocoder:
+    def __init__(self, lat, lon):
+        self.lat, self.lon = lat, lon
+        self.calls = 0
+
+    def geocode_bulk(self, addresses):
+        self.calls += 1
+        for _ in addresses:
+            yield None if self.calls == 1 else {"lat": self.lat, "lon": self.lon, "label": "adresse", "score": 0.9}
+
+    def geocode_concurrent(self, items, workers=8):
+        return iter(())
+
+def test_parquet_addresses_without_first_chunk_results(aac_index, points):
+    lats, lons = points
+    csv_text = "adresse\n" + "\n".join(f"{i} rue de test" for i in range(30))
+    output = io.BytesIO()
+
+    classify_batch(csv_text.encode("utf-8"), aac_index, output, file_name="adresses.csv", address_col="adresse",
+                   output_format="parquet", chunk_size=10, geocoding_client=FakeGeocoder(lats[0], lons[0]))
+    labels = pq.read_table(io.BytesIO(output.getvalue())).column("geocodage_label").to_pylist()
+    assert labels[:10] == [None] * 10
+    assert labels[10:] == ["adresse"] * 20
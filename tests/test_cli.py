@@ -0,0 +1,90 @@
+# Ligne de commande: compilation, vérification d'un point et classement d'un fichier, options comprises
+import json
+
+import pandas as pd
+import pytest
+
+from aac import DISPLAY_CRS, classify_points, read_compiled
+from aac.cli import main
+
+@pytest.fixture
+def zones_gpkg(zones, tmp_path):
+    path = tmp_path / "zones.gpkg"
+    zones.to_file(path, driver="GPKG", engine="pyogrio")
+    return str(path)
+
+@pytest.fixture
+def compiled_path(zones_gpkg, tmp_path):
+    path = str(tmp_path / "zones.arrow")
+    assert main(["compile", zones_gpkg, path, "--grid-cell", "1000", "--margin", "50"]) == 0
+    return path
+
+def test_compile(compiled_path, zones):
+    geometries, attributes, metadata, grid = read_compiled(compiled_path)
+    assert len(geometries) == len(zones) and list(attributes.columns) == list(zones.columns.drop("geometry"))
+    assert metadata["tolerance"] == 50 and metadata["source"] == "zones.gpkg"
+    assert grid is not None and grid.cell_size == 1000
+
+def test_check(compiled_path, aac_index, points, capsys):
+    lats, lons = points
+    expected = classify_points(lats, lons, aac_index)
+    inside = int(expected["in_aac"].to_numpy().nonzero()[0][0])
+    outside = int((~expected["in_aac"].astype(bool)).to_numpy().nonzero()[0][0])
+
+    assert main(["check", compiled_path, str(lats[inside]), str(lons[inside]), "--margin", "0"]) == 0
+    result = json.loads(capsys.readouterr().out)
+    assert result["in_aac"] and result["properties"]["code_aac"] == expected["aac_attr_code_aac"].iloc[inside]
+
+    assert main(["check", compiled_path, str(lats[outside]), str(lons[outside]), "--margin", "0"]) == 0
+    assert not json.loads(capsys.readouterr().out)["in_aac"]
+
+# Région et colonnes appliquées à la lecture d'un GeoJSON, région ignorée pour un index compilé
+def test_region_and_columns(zones, compiled_path, tmp_path, capsys):
+    path = tmp_path / "zones.geojson"
+    zones.assign(region=["Occitanie"] * 10 + ["Bretagne"] * (len(zones) - 10)).to_crs(DISPLAY_CRS).to_file(path)
+    lat, lon = 43.6, 3.88
+    assert main(["check", str(path), str(lat), str(lon), "--region", "Occitanie", "--columns", "code_aac"]) == 0
+    err = capsys.readouterr().err
+    assert "Données filtrées pour la région Occitanie: 10 zones trouvées" in err and "10 zones chargées" in err
+
+    assert main(["check", compiled_path, str(lat), str(lon), "--region", "Occitanie"]) == 0
+    assert "[warning] Le filtrage par région n'est pas disponible" in capsys.readouterr().err
+
+@pytest.fixture
+def points_csv(points, tmp_path):
+    lats, lons = points
+    path = tmp_path / "points.csv"
+    pd.DataFrame({"id": range(len(lats)), "latitude": lats, "longitude": lons}).to_csv(path, index=False)
+    return str(path)
+
+# Colonnes devinées, résultat Parquet déduit de l'extension, mesures écrites
+def test_classify(compiled_path, points_csv, points, aac_index, tmp_path, capsys):
+    output = str(tmp_path / "resultat.parquet")
+    metrics = str(tmp_path / "mesures.prom")
+    assert main(["classify", compiled_path, points_csv, output, "--margin", "0", "--quiet",
+                 "--chunk-size", "150", "--metrics", metrics]) == 0
+    result = pd.read_parquet(output)
+    expected = classify_points(*points, aac_index)
+    assert list(result["id"].astype(int)) == list(range(len(expected)))
+    assert (result["in_aac"].to_numpy() == expected["in_aac"].to_numpy()).all()
+    assert f"{len(expected)} lignes classées" in capsys.readouterr().err
+    with open(metrics, encoding="utf-8") as f:
+        assert "classify_chunk" in f.read()
+
+def test_classify_columns(compiled_path, points, tmp_path, capsys):
+    lats, lons = points
+    source = tmp_path / "points.csv"
+    pd.DataFrame({"a": lats, "b": lons}).to_csv(source, index=False)
+    output = str(tmp_path / "resultat.csv")
+    assert main(["classify", compiled_path, str(source), output, "--quiet"]) == 2
+    assert "Colonnes de coordonnées ou d'adresse introuvables parmi: a, b" in capsys.readouterr().err
+
+    assert main(["classify", compiled_path, str(source), output, "--quiet", "--lat-col", "a", "--lon-col", "b"]) == 0
+    assert len(pd.read_csv(output)) == len(lats)
+
+def test_invalid_arguments(capsys):
+    with pytest.raises(SystemExit):
+        main(["check", "zones.gpkg", "43.6"])
+    with pytest.raises(SystemExit):
+        main(["classify", "zones.gpkg", "points.csv", "resultat.csv", "--format", "xlsx"])
+    assert "invalid choice" in capsys.readouterr().err
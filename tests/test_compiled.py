@@ -0,0 +1,73 @@
+# Index compilé: relecture fidèle (chemin projeté en mémoire ou bytes), grille incluse
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+import shapely
+
+from aac import classify_points, open_compiled_dataset, read_compiled, write_compiled
+
+@pytest.fixture(params=["path", "bytes"])
+def compiled_source(request, tmp_path):
+    def write(aac_index):
+        path = tmp_path / "zones.arrow"
+        write_compiled(path, aac_index, "gpkg", "zones.gpkg")
+        return str(path) if request.param == "path" else path.read_bytes()
+    return write
+
+def test_round_trip_polygons(aac_index, compiled_source):
+    geometries, attributes, metadata, grid = read_compiled(compiled_source(aac_index))
+    assert shapely.equals(geometries, aac_index.geometries).all()
+    pd.testing.assert_frame_equal(attributes.convert_dtypes(), aac_index.attributes)
+    assert metadata["zones"] == len(aac_index) and metadata["source"] == "zones.gpkg"
+    assert metadata["crs"] == aac_index.crs and metadata["tolerance"] == aac_index.tolerance
+    assert grid is None
+
+# Zone supprimée (vide) et multipolygone: les géométries passent par le WKB
+def test_round_trip_wkb(zones, make_index, compiled_source):
+    zones = zones.copy()
+    zones.loc[1, "geometry"] = shapely.MultiPolygon([zones.geometry.iloc[1], zones.geometry.iloc[2]])
+    aac_index = make_index(zones)
+    aac_index.update_zones([3], [shapely.Polygon()])
+    geometries, _, _, _ = read_compiled(compiled_source(aac_index))
+    assert shapely.get_type_id(geometries[1]) == 6
+    assert shapely.is_empty(geometries[3])
+    assert shapely.equals(geometries, aac_index.geometries).all()
+
+def test_grid_round_trip(aac_index, compiled_source):
+    expected = aac_index.build_grid(1000, 50)
+    _, _, _, grid = read_compiled(compiled_source(aac_index))
+    assert (grid.x0, grid.y0, grid.cell_size, grid.margin) == (expected.x0, expected.y0, expected.cell_size, 50)
+    assert np.array_equal(grid.cells, expected.cells)
+    # Les cellules restent dans le fichier projeté en mémoire: aucune copie modifiable
+    assert not grid.cells.flags.writeable
+
+def test_open_compiled_dataset(aac_index, points, compiled_source):
+    lats, lons = points
+    aac_index.build_grid(1000)
+    expected = classify_points(lats, lons, aac_index, 200)
+    messages = []
+    dataset = open_compiled_dataset(compiled_source(aac_index), messages=messages)
+
+    assert dataset.file_type == "arrow" and messages[0][0] == "success"
+    assert dataset.aac_index.grid is not None
+    assert list(dataset.data_source.columns) == list(aac_index.attributes.columns) + ["geometry"]
+    pd.testing.assert_frame_equal(classify_points(lats, lons, dataset.aac_index, 200), expected)
+
+    # Le rafraîchissement copie les cellules avant de les recalculer
+    updated = dataset.aac_index.with_zones([0], [shapely.box(*shapely.bounds(aac_index.geometries[0]))])
+    assert updated.grid.cells.flags.writeable
+
+def test_columns_subset(aac_index, compiled_source):
+    _, attributes, _, _ = read_compiled(compiled_source(aac_index), columns=["code_aac"])
+    assert list(attributes.columns) == ["code_aac"]
+
+def test_rejects_other_files():
+    sink = io.BytesIO()
+    table = pa.table({"a": [1]})
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    with pytest.raises(ValueError):
+        read_compiled(sink.getvalue())
@@ -0,0 +1,171 @@
+# Géocodage par lot contre le serveur local imitant l'API adresse (serveur_adresse_local.py)
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+import serveur_adresse_local
+from aac import (
+    CACHE_MISS,
+    GEOCODE_ERROR,
+    GeocodeCache,
+    GeocodingClient,
+    classify_address_stream,
+    geocode_address,
+    get_default_geocoding_client,
+)
+from aac import geocoding
+from serveur_adresse_local import DEFAULT_ADDRESSES, AddressBook, make_handler
+
+KNOWN = [label for label, _, _ in DEFAULT_ADDRESSES]
+ADDRESSES = [KNOWN[0], "Adresse inconnue 99999 Nulle Part", "", KNOWN[2], KNOWN[1]]
+FOUND = [True, False, False, True, True]
+
+# Serveur local dans un thread (csv_down: /search/csv/ répond 503). Renvoie son URL et
+# les requêtes /search/csv/ reçues
+@pytest.fixture
+def api(monkeypatch, request):
+    csv_down = getattr(request, "param", False)
+    calls = []
+    csv_response = serveur_adresse_local.csv_response
+
+    def counting_csv_response(*args):
+        calls.append(args)
+        return csv_response(*args)
+
+    monkeypatch.setattr(serveur_adresse_local, "csv_response", counting_csv_response)
+
+    class Handler(make_handler(AddressBook(DEFAULT_ADDRESSES))):
+        def do_POST(self):
+            if csv_down:
+                return self.send_body(503, b"Service indisponible", "text/plain")
+            super().do_POST()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", calls
+    server.shutdown()
+    server.server_close()
+
+def make_client(url, **options):
+    return GeocodingClient(url, timeout=(2, 5), retries=0, rate_limit=1000, **options)
+
+# Le serveur local marque comme rejetées par l'endpoint CSV (result_status "error") les lignes contenant text
+def reject_in_csv(monkeypatch, text):
+    csv_response = serveur_adresse_local.csv_response
+
+    def rejecting_csv_response(*args):
+        lines = csv_response(*args).decode("utf-8").splitlines()
+        lines = [line.replace(",ok", ",error") if text in line else line for line in lines]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    monkeypatch.setattr(serveur_adresse_local, "csv_response", rejecting_csv_response)
+
+# Lots produits par classify_address_stream, remis dans l'ordre des adresses
+def collect(chunks):
+    return pd.concat(list(chunks)).sort_index()
+
+def expected_result(address):
+    label, lat, lon = next(entry for entry in DEFAULT_ADDRESSES if entry[0] == address)
+    return {'lat': lat, 'lon': lon, 'label': label, 'score': 1.0}
+
+def test_geocode_bulk_round_trip(api):
+    url, calls = api
+    results = list(make_client(url).geocode_bulk(ADDRESSES))
+
+    assert len(calls) == 1
+    assert [result is not None for result in results] == FOUND
+    for address, result in zip(ADDRESSES, results):
+        if result is not None:
+            assert result == expected_result(address)
+
+def test_geocode_error_rows_are_retried(api, monkeypatch, aac_index):
+    url, _ = api
+    reject_in_csv(monkeypatch, "Toulouse")
+    cache = GeocodeCache(":memory:")
+    client = make_client(url, cache=cache)
+
+    results = list(client.geocode_bulk(ADDRESSES))
+    assert results[4] is GEOCODE_ERROR
+    assert results[0] == expected_result(KNOWN[0])
+    # Une ligne rejetée n'est pas mise en cache, contrairement à une adresse introuvable
+    assert cache.get(KNOWN[1]) is CACHE_MISS
+    assert cache.get(ADDRESSES[1]) is None
+
+    # Le classement retente les lignes rejetées une à une via /search/
+    geocoded = collect(classify_address_stream(ADDRESSES, aac_index, client, workers=2))
+    assert list(geocoded.index) == list(range(len(ADDRESSES)))
+    assert geocoded["geocodage_lat"].notna().tolist() == FOUND
+    assert geocoded.loc[4, "geocodage_label"] == KNOWN[1]
+    assert cache.get(KNOWN[1]) == expected_result(KNOWN[1])
+
+def test_geocode_cache_accounting(api, tmp_path):
+    url, calls = api
+    path = str(tmp_path / "geocodage.sqlite3")
+    cache = GeocodeCache(path)
+    client = make_client(url, cache=cache)
+    # Les adresses vides ne sont ni cherchées en cache ni envoyées
+    lookups = sum(1 for address in ADDRESSES if address)
+
+    first = list(client.geocode_bulk(ADDRESSES))
+    assert cache.stats == {"memory_hits": 0, "disk_hits": 0, "misses": lookups}
+    assert len(calls) == 1
+
+    # Deuxième passage: tout vient du cache mémoire, y compris l'adresse introuvable
+    assert list(client.geocode_bulk(ADDRESSES)) == first
+    assert cache.stats == {"memory_hits": lookups, "disk_hits": 0, "misses": lookups}
+    assert len(calls) == 1
+
+    # Nouveau processus: le cache disque suffit
+    reopened = GeocodeCache(path)
+    assert list(make_client(url, cache=reopened).geocode_bulk(ADDRESSES)) == first
+    assert reopened.stats == {"memory_hits": 0, "disk_hits": lookups, "misses": 0}
+    assert len(calls) == 1
+
+# Endpoint CSV indisponible: les adresses passent par /search/ avec les mêmes résultats
+@pytest.mark.parametrize("api", [True], indirect=True)
+def test_csv_endpoint_down_falls_back_to_search(api, aac_index):
+    url, calls = api
+    client = make_client(url)
+    with pytest.raises(requests.RequestException):
+        list(client.geocode_bulk(ADDRESSES))
+
+    geocoded = collect(classify_address_stream(ADDRESSES, aac_index, client, batch_size=2, workers=2))
+    assert list(geocoded.index) == list(range(len(ADDRESSES)))
+    assert geocoded["geocodage_lat"].notna().tolist() == FOUND
+    assert geocoded.loc[0, "geocodage_label"] == KNOWN[0]
+    assert len(calls) == 0
+
+# API injoignable: chaque adresse obtient une ligne sans coordonnées, sans erreur
+def test_api_unreachable(aac_index):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    client = make_client(f"http://127.0.0.1:{port}")
+
+    geocoded = collect(classify_address_stream(ADDRESSES, aac_index, client, workers=2))
+    assert list(geocoded.index) == list(range(len(ADDRESSES)))
+    assert geocoded["geocodage_lat"].isna().all()
+    assert geocoded["in_aac"].isna().all()
+
+# Une adresse saisie dans l'interface passe par le client au délai court, sans nouvelle tentative;
+# le traitement par lot garde les réglages longs. Les deux partagent le cache.
+def test_interactive_client(monkeypatch):
+    monkeypatch.setattr(geocoding, "_default_cache", GeocodeCache(":memory:"))
+    monkeypatch.setattr(geocoding, "_default_clients", {})
+    monkeypatch.setattr(geocoding, "BAN_CSV", None)
+    bulk = get_default_geocoding_client()
+    interactive = get_default_geocoding_client(interactive=True)
+    assert bulk.timeout == (5, 30) and bulk.session.get_adapter(bulk.base_url).max_retries.total == 3
+    assert interactive.timeout == geocoding.INTERACTIVE_TIMEOUT and sum(interactive.timeout) <= 10
+    assert interactive.session.get_adapter(interactive.base_url).max_retries.total == 0
+    assert interactive.cache is bulk.cache and get_default_geocoding_client() is bulk
+
+    searched = []
+    monkeypatch.setattr(interactive, "search", lambda address: searched.append(address))
+    geocode_address(KNOWN[0])
+    assert searched == [KNOWN[0]]
@@ -0,0 +1,54 @@
+# Lecture incrémentale des GeoJSON: même résultat quel que soit le découpage du flux
+import io
+import json
+
+import pytest
+import shapely
+
+from aac.geojson import iter_geojson_features, make_feature_filter, read_geojson
+
+# Valeurs coupées entre deux lectures: caractères multioctets, échappements, nombres, littéraux
+FEATURES = [
+    {"type": "Feature", "properties": {"nom": "Étang de Thau 🐟", "region": "Occitanie", "surface": 1.5e-3,
+                                       "note": "guillemets \" et \\ et } ]", "actif": True, "code": None},
+     "geometry": {"type": "Polygon", "coordinates": [[[3.5, 43.4], [3.7, 43.4], [3.7, 43.5], [3.5, 43.4]]]}},
+    {"type": "Feature", "properties": {"nom": "Captage éloigné", "region": "Bretagne", "rang": -12},
+     "geometry": {"type": "MultiPolygon", "coordinates": [
+         [[[-3.0, 48.0], [-2.9, 48.0], [-2.9, 48.1], [-3.0, 48.0]]],
+         [[[-2.0, 48.0], [-1.9, 48.0], [-1.9, 48.1], [-2.0, 48.0]]],
+     ]}},
+    {"type": "Feature", "properties": {"nom": "Puits", "region": "Occitanie", "liste": [1, [2, 3]], "extra": {"a": 1}},
+     "geometry": {"type": "Point", "coordinates": [3.88, 43.6]}},
+]
+
+def geojson_bytes(features, bom=False):
+    document = {"type": "FeatureCollection", "name": "aac", "crs": {"type": "name", "properties": {"name": "CRS84"}},
+                "features": features, "bbox": [-3.0, 43.4, 3.88, 48.1]}
+    data = json.dumps(document, ensure_ascii=False, indent=1).encode("utf-8")
+    return b"\xef\xbb\xbf" + data if bom else data
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 64])
+def test_tiny_read_sizes(read_size):
+    data = geojson_bytes(FEATURES, bom=True)
+    assert list(iter_geojson_features(io.BytesIO(data), read_size)) == FEATURES
+
+    expected = read_geojson(io.BytesIO(data))
+    gdf = read_geojson(io.BytesIO(data), read_size=read_size)
+    assert list(gdf.columns) == list(expected.columns)
+    assert gdf.drop(columns="geometry").equals(expected.drop(columns="geometry"))
+    assert shapely.equals(gdf.geometry.to_numpy(), expected.geometry.to_numpy()).all()
+    assert gdf.loc[0, "nom"] == "Étang de Thau 🐟"
+    assert gdf.loc[1, "nom"] == "Captage éloigné"
+    assert gdf.loc[0, "note"] == "guillemets \" et \\ et } ]"
+    assert gdf.loc[1, "rang"] == -12 and gdf.loc[0, "surface"] == 1.5e-3
+
+# Filtre régional et sélection de colonnes appliqués pendant la lecture
+def test_filter_and_columns():
+    gdf = read_geojson(io.BytesIO(geojson_bytes(FEATURES)), make_feature_filter("occitanie"), columns=["nom"], read_size=5)
+    assert list(gdf.columns) == ["nom", "geometry"]
+    assert gdf["nom"].tolist() == ["Étang de Thau 🐟", "Puits"]
+
+def test_empty_and_truncated():
+    assert len(read_geojson(io.BytesIO(geojson_bytes([])), read_size=1)) == 0
+    with pytest.raises(ValueError):
+        read_geojson(io.BytesIO(geojson_bytes(FEATURES)[:-40]), read_size=3)
@@ -0,0 +1,33 @@
+# Grille d'accélération: mêmes zones et distances que le test exact, dedans, dehors et en bordure
+import numpy as np
+import pytest
+import shapely
+
+from aac.grid import BOUNDARY
+
+@pytest.mark.parametrize("max_distance", [None, 0, 300, 1000])
+def test_grid_matches_exact_lookup(aac_index, points, max_distance):
+    xs, ys = aac_index.project(*points)
+    expected = aac_index.lookup_many(xs, ys, max_distance)
+    scalar = [aac_index.lookup(x, y, max_distance) for x, y in zip(xs, ys)]
+
+    grid = aac_index.build_grid(1000, margin=300)
+    # Les points couvrent des cellules intérieures et de bordure (et extérieures sous la marge de la grille)
+    codes = grid.classify(xs, ys, max_distance)
+    assert (codes >= 0).any() and (codes == BOUNDARY).any()
+    matches, distances = aac_index.lookup_many(xs, ys, max_distance)
+    assert np.array_equal(matches, expected[0])
+    assert np.allclose(distances, expected[1], equal_nan=True)
+    assert [aac_index.lookup(x, y, max_distance) for x, y in zip(xs, ys)] == scalar
+
+# Points sur les sommets et au ras des frontières des zones
+def test_grid_on_zone_boundaries(aac_index):
+    coords = shapely.get_coordinates(aac_index.geometries[:10])
+    xs = np.concatenate([coords[:, 0], coords[:, 0] + 0.5, coords[:, 0] - 0.5])
+    ys = np.concatenate([coords[:, 1], coords[:, 1] + 0.5, coords[:, 1] - 0.5])
+    expected = aac_index.lookup_many(xs, ys, 100)
+
+    aac_index.build_grid(250)
+    matches, distances = aac_index.lookup_many(xs, ys, 100)
+    assert np.array_equal(matches, expected[0])
+    assert np.allclose(distances, expected[1], equal_nan=True)
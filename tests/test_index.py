@@ -0,0 +1,31 @@
+# Recherches sur l'index: zone la plus proche et attributs joints
+import numpy as np
+import pandas as pd
+
+from aac import nearest_aac
+from aac.index import replace_rows
+
+# Un attribut id ou distance_m ne doit pas entrer en collision avec les colonnes calculées
+def test_nearest_aac_attribute_columns(zones, points, make_index):
+    zones = zones.assign(id=np.arange(len(zones)) + 1000, distance_m=-1.0)
+    aac_index = make_index(zones)
+    lats, lons = points
+
+    result = nearest_aac(lats, lons, aac_index, max_distance=5000)
+    assert result.columns.is_unique
+    found = result["aac_id"].notna().to_numpy()
+    assert found.any() and not found.all()
+    assert (result.loc[found, "aac_attr_id"] == result.loc[found, "aac_id"] + 1000).all()
+    assert (result.loc[found, "distance_m"] >= 0).all()
+    assert result.loc[~found, "distance_m"].isna().all()
+
+# Lignes remplacées et ajoutées à la suite; une colonne qui change de type est reconstruite
+def test_replace_rows():
+    frame = pd.DataFrame({"code": ["a", "b", "c"], "n": [1, 2, 3]})
+    rows = pd.DataFrame({"code": ["B", "d"], "n": [20, 40]}, index=[1, 3])
+    result = replace_rows(frame, rows)
+    assert result["code"].tolist() == ["a", "B", "c", "d"] and result["n"].tolist() == [1, 20, 3, 40]
+    assert frame["code"].tolist() == ["a", "b", "c"]
+
+    result = replace_rows(frame, pd.DataFrame({"code": ["C"], "n": [2.5]}, index=[2]))
+    assert result["n"].tolist() == [1, 2, 2.5] and list(result.index) == [0, 1, 2]
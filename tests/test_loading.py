@@ -0,0 +1,120 @@
+# Lecture des GPKG: filtre régional et sélection de colonnes appliqués à la lecture, lecture
+# complète quand le filtre ne garde aucune zone. Cache des jeux de données: éviction LRU et
+# chargement unique d'une clé demandée par plusieurs sessions
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import shapely
+
+from aac import DISPLAY_CRS, REGION_BBOXES, DatasetCache, read_aac_source
+
+def to_gpkg(gdf):
+    output = io.BytesIO()
+    gdf.to_file(output, driver="GPKG", engine="pyogrio")
+    return output.getvalue()
+
+# Zones paires en Occitanie, impaires en Bretagne (colonne région en fin de table)
+@pytest.fixture
+def regional_gpkg(zones):
+    regions = ["Occitanie" if i % 2 == 0 else "Bretagne" for i in range(len(zones))]
+    return to_gpkg(zones.assign(nom_region=regions)), zones
+
+def test_gpkg_region_filter(regional_gpkg):
+    file_bytes, zones = regional_gpkg
+    messages = []
+    gdf, file_type = read_aac_source(file_bytes, "gpkg", "Bretagne", None, messages)
+    assert file_type == "gpkg"
+    assert list(gdf["code_aac"]) == list(zones["code_aac"].iloc[1::2])
+    assert set(gdf["nom_region"]) == {"Bretagne"}
+    assert messages == [("success", f"Données filtrées pour la région Bretagne: {len(gdf)} zones trouvées")]
+
+# La colonne région sert au filtre sans faire partie des colonnes lues
+def test_gpkg_columns_without_region(regional_gpkg):
+    file_bytes, zones = regional_gpkg
+    gdf, _ = read_aac_source(file_bytes, "gpkg", "Occitanie", ["code_aac", "absente"], [])
+    assert list(gdf.columns) == ["code_aac", "geometry"]
+    assert list(gdf["code_aac"]) == list(zones["code_aac"].iloc[::2])
+
+def test_gpkg_no_match_reads_everything(regional_gpkg):
+    file_bytes, zones = regional_gpkg
+    messages = []
+    gdf, _ = read_aac_source(file_bytes, "gpkg", "Corse", ["code_aac"], messages)
+    assert list(gdf["code_aac"]) == list(zones["code_aac"])
+    assert list(gdf.columns) == ["code_aac", "geometry"]
+    assert messages[0] == ("warning", "Aucune zone trouvée pour la région Corse. Utilisation de toutes les données.")
+
+# Sans colonne région: bbox approximative de la région, reprojetée dans le CRS du fichier
+def test_gpkg_bbox_filter(zones):
+    file_bytes = to_gpkg(zones)
+    messages = []
+    gdf, _ = read_aac_source(file_bytes, "gpkg", "Nouvelle-Aquitaine", None, messages)
+    expected = zones.to_crs(DISPLAY_CRS).intersects(shapely.box(*REGION_BBOXES["Nouvelle-Aquitaine"]))
+    assert 0 < len(gdf) < len(zones)
+    assert set(gdf["code_aac"]) >= set(zones["code_aac"][expected])
+    assert messages == [("success", f"Données filtrées pour la région Nouvelle-Aquitaine par bbox: {len(gdf)} zones trouvées")]
+
+    gdf, _ = read_aac_source(file_bytes, "gpkg", "Bretagne", None, messages)
+    assert len(gdf) == len(zones) and messages[-1][0] == "warning"
+
+def test_cache_lru_eviction():
+    cache = DatasetCache(max_entries=2)
+    for key in ["a", "b"]:
+        cache.get_or_load(key, lambda: SimpleNamespace(nbytes=1))
+    cache.get_or_load("a", None)
+    cache.get_or_load("c", lambda: SimpleNamespace(nbytes=1))
+    assert "a" in cache and "b" not in cache and "c" in cache
+    assert len(cache) == 2 and cache.nbytes == 2
+
+# Le budget mémoire évince les entrées les plus anciennes, mais garde toujours la dernière
+def test_cache_max_bytes():
+    cache = DatasetCache(max_bytes=100)
+    cache.get_or_load("a", lambda: SimpleNamespace(nbytes=40))
+    cache.get_or_load("b", lambda: SimpleNamespace(nbytes=50))
+    assert cache.nbytes == 90
+    cache.get_or_load("c", lambda: SimpleNamespace(nbytes=30))
+    assert "a" not in cache and cache.nbytes == 80
+    cache.get_or_load("d", lambda: SimpleNamespace(nbytes=500))
+    assert len(cache) == 1 and cache.nbytes == 500
+
+def test_cache_loads_once():
+    cache = DatasetCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def load():
+        calls.append(threading.get_ident())
+        started.set()
+        release.wait(5)
+        return SimpleNamespace(nbytes=1)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("a", load))) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Laisser les autres sessions arriver pendant le chargement
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert len(results) == 4 and all(result is results[0] for result in results)
+
+# Un chargement en erreur n'est pas mis en cache et ne bloque pas les suivants
+def test_cache_failed_load():
+    cache = DatasetCache()
+
+    def fail():
+        raise ValueError("fichier illisible")
+
+    with pytest.raises(ValueError):
+        cache.get_or_load("a", fail)
+    assert "a" not in cache
+    assert cache.get_or_load("a", lambda: SimpleNamespace(nbytes=1)).nbytes == 1
+    with pytest.raises(KeyError):
+        cache.get_or_derive("absente", "b", lambda previous: previous)
+    assert cache.get_or_derive("a", "b", lambda previous: SimpleNamespace(nbytes=2)).nbytes == 2
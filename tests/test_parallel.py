@@ -0,0 +1,44 @@
+# Classement multi-processus: mêmes résultats que l'index d'origine, fichiers partagés supprimés à la fermeture
+import os
+
+import numpy as np
+
+from aac import ParallelAACIndex, read_shared_geometries, read_shared_grid, write_shared_geometries, write_shared_grid
+
+def test_shared_geometries_round_trip(aac_index, tmp_path):
+    path = write_shared_geometries(aac_index.geometries, tmp_path)
+    geometries = read_shared_geometries(path)
+    assert all(a.equals(b) for a, b in zip(geometries, aac_index.geometries))
+
+def test_parallel_locate_many(aac_index, points):
+    lats, lons = points
+    expected = aac_index.locate_many(lats, lons, 500)
+
+    with ParallelAACIndex(aac_index, workers=2, min_part_size=50) as parallel:
+        matches, distances = parallel.locate_many(lats, lons, 500)
+        path = parallel.path
+    assert np.array_equal(matches, expected[0])
+    assert np.allclose(distances, expected[1], equal_nan=True)
+    assert not os.path.exists(path)
+
+# La grille relue depuis son fichier partagé est projetée en mémoire, identique à l'originale
+def test_shared_grid_round_trip(aac_index, tmp_path):
+    grid = aac_index.build_grid(1000)
+    path, params = write_shared_grid(grid, tmp_path)
+    shared = read_shared_grid(path, params)
+
+    assert isinstance(shared.cells, np.memmap)
+    assert np.array_equal(shared.cells, grid.cells)
+    assert (shared.x0, shared.y0, shared.cell_size, shared.margin) == (grid.x0, grid.y0, grid.cell_size, grid.margin)
+
+def test_parallel_locate_many_with_grid(aac_index, points):
+    aac_index.build_grid(1000)
+    lats, lons = points
+    expected = aac_index.locate_many(lats, lons)
+
+    with ParallelAACIndex(aac_index, workers=2, min_part_size=50) as parallel:
+        matches, distances = parallel.locate_many(lats, lons)
+        grid_path = parallel.grid_path
+    assert np.array_equal(matches, expected[0])
+    assert np.allclose(distances, expected[1], equal_nan=True)
+    assert grid_path is not None and not os.path.exists(grid_path)
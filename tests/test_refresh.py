@@ -0,0 +1,126 @@
+# Rafraîchissement incrémental: même résultat qu'un rechargement complet, jeu d'origine intact
+import copy
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from aac import (
+    METRICS,
+    DatasetCache,
+    classify_points,
+    diff_features,
+    get_display_topology,
+    load_aac_dataset,
+    refresh_aac_dataset,
+    subset_topology,
+)
+from aac.loading import estimate_dataset_size
+from aac.refresh import attribute_fingerprints, geometry_fingerprints
+
+TOLERANCE = 0.003
+
+def to_gpkg(gdf):
+    output = io.BytesIO()
+    gdf.to_file(output, driver="GPKG", engine="pyogrio")
+    return output.getvalue()
+
+# Nouvelle version de la couche: 3 géométries et 2 noms modifiés, 2 zones supprimées, 3 ajoutées
+@pytest.fixture
+def versions(zones):
+    new = zones.copy()
+    new.loc[[3, 10, 11], "geometry"] = new.loc[[3, 10, 11]].geometry.buffer(500)
+    new.loc[[5, 6], "nom_aac"] = "renommée"
+    extra = zones.iloc[:3].copy()
+    extra["geometry"] = extra.geometry.translate(0, 20000)
+    extra["code_aac"] = ["N1", "N2", "N3"]
+    new = pd.concat([new.drop(index=[20, 21]), extra]).reset_index(drop=True)
+    return zones, new
+
+def test_diff_features(versions):
+    old, new = versions
+    modified, deleted, added = diff_features(old, new)
+    assert sorted(old["code_aac"].iloc[modified[:, 0]]) == sorted(old["code_aac"].iloc[[3, 5, 6, 10, 11]])
+    assert (old["code_aac"].iloc[modified[:, 0]].to_numpy() == new["code_aac"].iloc[modified[:, 1]].to_numpy()).all()
+    assert list(deleted) == [20, 21]
+    assert list(new["code_aac"].iloc[added]) == ["N1", "N2", "N3"]
+
+def test_refresh_matches_full_reload(versions, points):
+    old, new = versions
+    lats, lons = points
+    dataset = load_aac_dataset(to_gpkg(old), "zones.gpkg")
+    dataset.aac_index.build_grid(1000)
+    topology = get_display_topology(dataset, TOLERANCE)
+    before = classify_points(lats, lons, dataset.aac_index)
+    topology_json = json.dumps(topology)
+
+    refreshed, stats = refresh_aac_dataset(dataset, to_gpkg(new), "zones.gpkg")
+    assert (stats["added"], stats["modified"], stats["deleted"]) == (3, 5, 2)
+    full = load_aac_dataset(to_gpkg(new), "zones.gpkg")
+
+    # Mêmes zones (par code) pour chaque point, avec ou sans grille
+    expected = classify_points(lats, lons, full.aac_index)["aac_attr_code_aac"]
+    result = classify_points(lats, lons, refreshed.aac_index)["aac_attr_code_aac"]
+    assert (result.fillna("-") == expected.fillna("-")).all()
+    grid = refreshed.aac_index.grid
+    refreshed.aac_index.grid = None
+    assert (classify_points(lats, lons, refreshed.aac_index)["aac_attr_code_aac"].fillna("-") == expected.fillna("-")).all()
+    refreshed.aac_index.grid = grid
+
+    # Topologie d'affichage mise à jour: mêmes zones visibles que celles d'un rechargement
+    visible = np.flatnonzero(~shapely.is_missing(refreshed.aac_index.geometries))
+    objects = subset_topology(get_display_topology(refreshed, TOLERANCE), visible)["objects"]["aac"]["geometries"]
+    assert sorted(item["properties"]["nom"] for item in objects) == sorted(new["nom_aac"])
+
+    # Le jeu de données d'origine, partagé par d'autres sessions, n'a pas changé
+    assert json.dumps(dataset.artifacts[("display_topology", TOLERANCE)]) == topology_json
+    pd.testing.assert_frame_equal(classify_points(lats, lons, dataset.aac_index), before)
+    assert len(dataset.data_source) == len(old)
+
+    # Un second rafraîchissement avec le même fichier ne trouve aucun changement
+    _, stats = refresh_aac_dataset(refreshed, to_gpkg(new), "zones.gpkg")
+    assert (stats["added"], stats["modified"], stats["deleted"]) == (0, 0, 0)
+
+def test_refresh_rejects_schema_change(zones):
+    dataset = load_aac_dataset(to_gpkg(zones), "zones.gpkg")
+    with pytest.raises(ValueError):
+        refresh_aac_dataset(dataset, to_gpkg(zones.assign(extra=1)), "zones.gpkg")
+
+# Le cache range la version dérivée sous sa clé sans retirer ni modifier l'ancienne
+def test_cache_get_or_derive(versions):
+    old, new = versions
+    cache = DatasetCache()
+    dataset = cache.get_or_load("v1", lambda: load_aac_dataset(to_gpkg(old), "zones.gpkg"))
+    geometries = copy.copy(dataset.aac_index.geometries)
+
+    derived = cache.get_or_derive("v1", "v2", lambda previous: refresh_aac_dataset(previous, to_gpkg(new), "zones.gpkg")[0])
+    assert derived is not dataset
+    assert "v1" in cache and "v2" in cache
+    assert cache.get_or_derive("v1", "v2", None) is derived
+    assert all(a is b for a, b in zip(dataset.aac_index.geometries, geometries))
+    with pytest.raises(KeyError):
+        cache.get_or_derive("absent", "v3", None)
+
+# Les empreintes de l'ancienne version ne sont calculées qu'une fois, puis tenues à jour par ligne
+def test_refresh_reuses_fingerprints(versions):
+    old, new = versions
+    dataset = load_aac_dataset(to_gpkg(old), "zones.gpkg")
+    METRICS.reset()
+    refreshed, _ = refresh_aac_dataset(dataset, to_gpkg(new), "zones.gpkg")
+    assert METRICS.snapshot()["timings"]["fingerprints"]["count"] == 1
+    assert None in dataset.fingerprints
+
+    geometry_hashes, attribute_hashes = refreshed.fingerprints[None]
+    source = refreshed.data_source
+    assert np.array_equal(geometry_hashes, geometry_fingerprints(source.geometry))
+    assert np.array_equal(attribute_hashes, attribute_fingerprints(source.drop(columns=source.geometry.name)))
+    # Taille mise à jour par les seules lignes modifiées, proche d'une estimation complète
+    assert refreshed.nbytes == pytest.approx(estimate_dataset_size(source, refreshed.aac_index), rel=0.01)
+
+    # Retour à l'ancienne version: les zones supprimées reviennent à leur indice (modifiées)
+    _, stats = refresh_aac_dataset(refreshed, to_gpkg(old), "zones.gpkg")
+    assert (stats["added"], stats["modified"], stats["deleted"]) == (0, 7, 3)
+    assert METRICS.snapshot()["timings"]["fingerprints"]["count"] == 1
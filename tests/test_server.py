@@ -0,0 +1,112 @@
+# Service HTTP: lecture des paramètres, réponses de /check (GET et POST) et erreurs 400
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from aac import CachedDataset, classify_points
+from aac.server import MAX_BATCH_POINTS, make_server, parse_margin, parse_points
+
+def test_parse_margin():
+    assert parse_margin(None) is None
+    assert parse_margin("50") == 50.0
+    assert parse_margin(0) == 0.0
+    for value in ["-1", "nan", "inf", "abc"]:
+        with pytest.raises(ValueError):
+            parse_margin(value)
+
+def test_parse_points():
+    lats, lons = parse_points({"points": [[43.6, 3.88], [44.0, 4.0]]})
+    assert lats.tolist() == [43.6, 44.0] and lons.tolist() == [3.88, 4.0]
+    lats, lons = parse_points({"lats": [43.6], "lons": [3.88]})
+    assert lats.tolist() == [43.6] and lons.tolist() == [3.88]
+    assert len(parse_points({"points": []})[0]) == 0
+    with pytest.raises(ValueError):
+        parse_points({"lats": [43.6, 44.0], "lons": [3.88]})
+    with pytest.raises(ValueError):
+        parse_points({"points": [[43.6, 3.88, 1.0]]})
+    with pytest.raises(ValueError):
+        parse_points({"lats": [0.0] * (MAX_BATCH_POINTS + 1), "lons": [0.0] * (MAX_BATCH_POINTS + 1)})
+    with pytest.raises(KeyError):
+        parse_points({"lat": [43.6]})
+
+# Serveur sur un port libre, servi dans un thread. Renvoie l'URL de base et les zones
+@pytest.fixture
+def service(zones, aac_index):
+    server = make_server(CachedDataset(zones, "gpkg", aac_index, []), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+# (statut, corps JSON ou texte) d'une requête au service
+def call(url, payload=None):
+    data = None if payload is None else (payload if isinstance(payload, bytes) else json.dumps(payload).encode())
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=10) as response:
+            status, body = response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read().decode("utf-8")
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        return status, body
+
+def test_check_get(service, zones, aac_index, points):
+    lats, lons = points
+    expected = classify_points(lats, lons, aac_index)
+    for i in range(0, len(lats), 40):
+        status, body = call(f"{service}/check?lat={lats[i]}&lon={lons[i]}")
+        assert status == 200
+        if expected["in_aac"].iloc[i]:
+            zone = int(expected["aac_id"].iloc[i])
+            assert body["in_aac"] is True and body["aac_id"] == zone
+            assert body["properties"]["code_aac"] == zones["code_aac"].iloc[zone]
+        else:
+            assert body == {"in_aac": False, "aac_id": None, "properties": None}
+
+def test_check_post(service, aac_index, points):
+    lats, lons = points
+    expected = aac_index.locate_many(lats, lons, 50)
+    status, body = call(f"{service}/check", {"lats": lats.tolist(), "lons": lons.tolist(), "margin": 50})
+    assert status == 200
+    results = body["results"]
+    assert len(results) == len(lats)
+    assert [result["aac_id"] if result["in_aac"] else -1 for result in results] == expected[0].tolist()
+    distances = np.array([np.nan if result["distance_m"] is None else result["distance_m"] for result in results])
+    assert np.allclose(distances, np.round(expected[1], 2), equal_nan=True)
+
+    # Les coordonnées manquantes donnent une ligne hors zone
+    status, body = call(f"{service}/check", {"points": [[None, 3.88], [lats[0], lons[0]]]})
+    assert status == 200 and body["results"][0]["in_aac"] is False
+
+@pytest.mark.parametrize("query", ["lat=43.6", "lat=abc&lon=3.88", "lat=43.6&lon=3.88&margin=-5"])
+def test_check_get_bad_request(service, query):
+    status, body = call(f"{service}/check?{query}")
+    assert status == 400 and "error" in body
+
+@pytest.mark.parametrize("payload", [
+    b"pas du json",
+    {"lats": [43.6, 44.0], "lons": [3.88]},
+    {"points": [[43.6, 3.88]], "margin": "abc"},
+    {"autre": 1},
+    [1, 2],
+])
+def test_check_post_bad_request(service, payload):
+    status, body = call(f"{service}/check", payload)
+    assert status == 400 and "error" in body
+
+def test_health_and_metrics(service, aac_index):
+    call(f"{service}/check?lat=43.6&lon=3.88")
+    status, body = call(f"{service}/health")
+    assert status == 200 and body["zones"] == len(aac_index) and body["pid"] == os.getpid()
+
+    status, body = call(f"{service}/metrics")
+    assert status == 200
+    assert f'stage="http_check",pid="{os.getpid()}"' in body
+    assert call(f"{service}/inconnu")[0] == 404
@@ -0,0 +1,111 @@
+# Topologie d'affichage: arcs partagés, décodage fidèle et mise à jour partielle (patch_topology)
+import copy
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Polygon, box
+
+from aac.topojson import build_topology, patch_topology, subset_topology
+
+# Damier de 3 x 3 carrés jointifs de 10 unités, avec un trou dans le carré central
+def checkerboard():
+    squares = [box(10 * i, 10 * j, 10 * i + 10, 10 * j + 10) for j in range(3) for i in range(3)]
+    squares[4] = Polygon(squares[4].exterior, [box(13, 13, 17, 17).exterior])
+    return squares
+
+# Géométries décodées d'une topologie (None pour les objets vides)
+def decode_topology(topology, object_name="aac"):
+    scale = np.array(topology["transform"]["scale"])
+    translate = np.array(topology["transform"]["translate"])
+    arcs = [np.cumsum(np.array(arc, dtype=float), axis=0) * scale + translate for arc in topology["arcs"]]
+
+    def ring(refs):
+        coords = [arcs[ref] if ref >= 0 else arcs[~ref][::-1] for ref in refs]
+        return np.concatenate([coords[0]] + [part[1:] for part in coords[1:]])
+
+    geometries = []
+    for item in topology["objects"][object_name]["geometries"]:
+        if item["type"] == "Polygon":
+            parts = [item["arcs"]]
+        elif item["type"] == "MultiPolygon":
+            parts = item["arcs"]
+        else:
+            geometries.append(None)
+            continue
+        polygons = [Polygon(ring(rings[0]), [ring(refs) for refs in rings[1:]]) for rings in parts]
+        geometries.append(polygons[0] if len(polygons) == 1 else shapely.MultiPolygon(polygons))
+    return geometries
+
+def assert_same_geometries(decoded, expected):
+    assert len(decoded) == len(expected)
+    for geometry, original in zip(decoded, expected):
+        if original is None or original.is_empty:
+            assert geometry is None
+        else:
+            assert geometry.equals(original)
+
+def test_shared_arcs_round_trip():
+    squares = checkerboard()
+    topology = build_topology(squares, 1.0, translate=(0, 0))
+    assert_same_geometries(decode_topology(topology), squares)
+
+    # Chaque frontière commune est stockée une fois et parcourue dans les deux sens
+    refs = [ref for item in topology["objects"]["aac"]["geometries"] for ring in item["arcs"] for ref in ring]
+    arc_ids = np.array([ref if ref >= 0 else ~ref for ref in refs])
+    uses = np.bincount(arc_ids, minlength=len(topology["arcs"]))
+    assert uses.max() == 2 and (uses >= 1).all()
+    # Les 12 côtés intérieurs du damier
+    assert (uses == 2).sum() == 12
+    assert sum(ref < 0 for ref in refs) == 12
+
+def test_quantization_and_multipolygons():
+    geometries = [
+        shapely.MultiPolygon([box(0, 0.01, 0.99, 0.99), box(2, 0, 3, 1)]),
+        None,
+        box(1, 0, 2, 1),
+        # Réduit à moins de trois sommets distincts par la quantification
+        box(5, 5, 5.1, 5.1),
+    ]
+    topology = build_topology(geometries, 1.0, translate=(0, 0), properties=[{"n": i} for i in range(4)])
+    objects = topology["objects"]["aac"]["geometries"]
+    assert [item["type"] for item in objects] == ["MultiPolygon", None, "Polygon", None]
+    assert [item["properties"]["n"] for item in objects] == [0, 1, 2, 3]
+    decoded = decode_topology(topology)
+    assert decoded[0].equals(shapely.MultiPolygon([box(0, 0, 1, 1), box(2, 0, 3, 1)]))
+    assert decoded[2].equals(box(1, 0, 2, 1))
+
+# Le sous-ensemble ne garde que les objets demandés et leurs arcs
+def test_subset_topology():
+    squares = checkerboard()
+    topology = build_topology(squares, 1.0, translate=(0, 0))
+    subset = subset_topology(topology, [0, 1])
+    assert len(subset["arcs"]) < len(topology["arcs"])
+    assert_same_geometries(decode_topology(subset), squares[:2])
+
+# Remplacer, vider et ajouter des zones par patch donne la même géométrie qu'une reconstruction complète
+@pytest.mark.parametrize("tolerance", [0.0, 1.5])
+def test_patch_topology_matches_rebuild(tolerance):
+    squares = checkerboard()
+    topology = build_topology(squares, 1.0, tolerance, translate=(0, 0))
+    original = copy.deepcopy(topology)
+
+    updated = list(squares)
+    updated[1] = box(10, 0, 20, 8)
+    updated[7] = None
+    updated.append(box(30, 0, 40, 10))
+    indices = [1, 7, 9]
+    patch = build_topology([updated[i] for i in indices], 1.0, tolerance, translate=(0, 0))
+    patched = patch_topology(topology, indices, patch)
+
+    assert topology == original
+    rebuilt = build_topology(updated, 1.0, tolerance, translate=(0, 0))
+    for geometry, expected in zip(decode_topology(patched), decode_topology(rebuilt)):
+        assert (geometry is None) == (expected is None)
+        if geometry is not None:
+            assert geometry.equals(expected)
+
+    # Le sous-ensemble ne transmet que les arcs encore référencés
+    subset = subset_topology(patched, range(len(updated)))
+    assert len(subset["arcs"]) < len(patched["arcs"])
+    assert_same_geometries(decode_topology(subset), [g for g in decode_topology(patched) if g is not None])